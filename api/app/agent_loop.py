@@ -1,10 +1,20 @@
 from typing import AsyncGenerator
 from pathlib import Path
 import json
+import time
 import aiofiles
-from app.grok_client import chat_completion
+from app.grok_client import chat_completion, Conversation
+from app.model_router import route_model, model_cost
 from app.tools import get_all_tools  # returns list of Tool instances
 from app.config import settings
+from app.output_compaction import compact_tool_output
+from app.repo_map import get_repo_map
+from app.code_index import code_index_manager
+from app.checkpoints import create_checkpoint
+from app.usage_tracking import record_llm_call, cached_prompt_tokens
+from app.cassettes import cassette_for_session
+from app.file_listing import bump_workspace_generation
+from app.loop_detection import LoopDetector
 
 AGENT_PROMPTS = {
 "planning": """You are the Principal Enterprise Architect. Your role is to define the high-level structure, tech stack, and governance for mission-critical software. You do not write boilerplate code; you design systems.
@@ -33,12 +43,43 @@ Tone & Style:
   Practical, technical, and detail-oriented. You are obbessed with type safety, edge cases, and making the code readable for other humans."""
 }
 
+# Tools that may rewrite workspace files in place
+WORKSPACE_WRITING_TOOLS = {"write_file", "write_files", "execute_bash"}
+
+
+def close_pending_tool_calls(messages: list) -> list:
+    """
+    Answer any tool calls left without a result (e.g. after a cancelled run)
+    so the conversation stays valid for the next API request.
+    """
+    answered = {m.get("tool_call_id") for m in messages if m.get("role") == "tool"}
+    for idx in range(len(messages) - 1, -1, -1):
+        msg = messages[idx]
+        if msg.get("role") != "assistant" or not msg.get("tool_calls"):
+            continue
+        missing = [tc for tc in msg["tool_calls"] if tc.get("id") not in answered]
+        # Results must directly follow their assistant message
+        insert_at = idx + 1
+        while insert_at < len(messages) and messages[insert_at].get("role") == "tool":
+            insert_at += 1
+        for tool_call in missing:
+            messages.insert(insert_at, {
+                "role": "tool",
+                "tool_call_id": tool_call.get("id"),
+                "content": "(cancelled before completion)"
+            })
+            insert_at += 1
+    return messages
+
+
 async def run_agent(
     user_message: str,
     workspace: str,
     history: list = None,
     agent_type: str = "building",
-    cumulative_tokens: dict = None
+    cumulative_tokens: dict = None,
+    session_id: str = None,
+    checkpoints: bool = True
 ) -> AsyncGenerator[dict, None]:
     if history is None:
         history = []
@@ -46,18 +87,38 @@ async def run_agent(
     # Add system prompt based on agent type
     system_prompt = AGENT_PROMPTS.get(agent_type, AGENT_PROMPTS["building"])
 
-    # Insert system message at the beginning if not already present
-    if not history or history[0].get("role") != "system":
-        messages = [{"role": "system", "content": system_prompt}] + history + [{"role": "user", "content": user_message}]
-    else:
-        messages = history + [{"role": "user", "content": user_message}]
+    # Give the agent its bearings up front instead of spending iterations exploring
+    repo_map = await get_repo_map(Path(workspace))
+    if repo_map:
+        system_prompt += (
+            "\n\n## Repository map\n"
+            "Most important files in the workspace, with their top-level symbols:\n"
+            f"{repo_map}"
+        )
+
+    # Warm the retrieval index in the background so find_relevant_code is fast
+    code_index_manager.ensure(Path(workspace))
 
-    tools = get_all_tools()
+    # Build the conversation in place so the caller keeps partial progress
+    # even if the run is cancelled midway. Messages are validated and
+    # serialized once as they are added, not again on every API call.
+    conversation = Conversation(history)
+    # Insert system message at the beginning if not already present,
+    # otherwise refresh it so the repository map reflects this turn's workspace
+    conversation.set_system(system_prompt)
+    conversation.append({"role": "user", "content": user_message})
+
+    tools = get_all_tools(session_id=session_id)
     tool_schemas = [t.schema for t in tools]
     tool_map = {t.schema["function"]["name"]: t for t in tools}
 
     workspace_path = Path(workspace).resolve()
 
+    # Record/replay of LLM calls and tool results (CASSETTE_MODE)
+    cassette = cassette_for_session(session_id)
+    if cassette is not None and cassette.recording:
+        cassette.record_run(user_message, agent_type)
+
     # Track token usage - start from cumulative values if provided
     if cumulative_tokens is None:
         cumulative_tokens = {}
@@ -65,10 +126,44 @@ async def run_agent(
     total_output_tokens = cumulative_tokens.get("output_tokens", 0)
     total_cost = cumulative_tokens.get("estimated_cost", 0.0)
 
-    for iteration in range(settings.max_iterations):
+    # Snapshot the workspace before the agent touches it, so the run can be rolled back
+    if checkpoints:
+        await create_checkpoint(workspace_path, session_id, "before run", 0)
+
+    # Repetition/stall detection and the run's iteration budget, which grows
+    # with productive iterations up to the agent type's ceiling
+    detector = LoopDetector(agent_type)
+    must_answer = False
+
+    iteration = 0
+    while iteration < detector.limit:
         yield {"type": "status", "content": f"Thinking... (iteration {iteration + 1})"}
 
-        response = await chat_completion(messages, tools=tool_schemas)
+        # Pick model and sampling params for this step
+        if must_answer or (iteration == detector.limit - 1 and iteration > 0):
+            role = "final"
+        elif iteration == 0:
+            role = "initial"
+        else:
+            role = "tool_followup"
+        route = route_model(agent_type, role, conversation.context_tokens())
+
+        call_started = time.monotonic()
+        response = await chat_completion(
+            conversation,
+            tools=tool_schemas,
+            # Last allowed iteration - make the model answer instead of calling more tools
+            tool_choice="none" if role == "final" else "auto",
+            model=route["model"],
+            temperature=route["temperature"],
+            max_tokens=route["max_tokens"],
+            fallbacks=route["fallbacks"],
+            cassette=cassette,
+            # Temperature 0 calls are always cacheable; these agent types opt in at any temperature
+            cache=True if agent_type in settings.response_cache_agent_types else None
+        )
+        model = response.get("routed_model", route["model"])
+        latency_ms = int((time.monotonic() - call_started) * 1000)
 
         # Track token usage
         if "usage" in response:
@@ -78,17 +173,30 @@ async def run_agent(
             total_input_tokens += input_tokens
             total_output_tokens += output_tokens
 
-            # Calculate cost (prices are per million tokens) - add to cumulative
-            input_cost = (input_tokens / 1_000_000) * settings.input_price
-            output_cost = (output_tokens / 1_000_000) * settings.output_price
-            total_cost += input_cost + output_cost
+            # Calculate cost with the serving model's pricing - add to cumulative
+            call_cost = model_cost(model, input_tokens, output_tokens)
+            total_cost += call_cost
+
+            # Per-call delta for analytics (the event below stays cumulative for the UI)
+            record_llm_call(
+                session_id=session_id,
+                workspace=str(workspace_path),
+                agent_type=agent_type,
+                model=model,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cached_tokens=cached_prompt_tokens(usage),
+                latency_ms=latency_ms,
+                cost=call_cost
+            )
 
             yield {
                 "type": "token_usage",
                 "input_tokens": total_input_tokens,
                 "output_tokens": total_output_tokens,
                 "total_tokens": total_input_tokens + total_output_tokens,
-                "estimated_cost": round(total_cost, 6)
+                "estimated_cost": round(total_cost, 6),
+                "model": model
             }
 
         msg = response["choices"][0]["message"]
@@ -108,7 +216,7 @@ async def run_agent(
             # Regular text response
             sanitized_msg["content"] = msg.get("content", "")
 
-        messages.append(sanitized_msg)
+        conversation.append(sanitized_msg)
 
         if msg.get("tool_calls"):
             for tool_call in msg["tool_calls"]:
@@ -135,24 +243,40 @@ async def run_agent(
                                 content_before = None  # File exists but couldn't read
 
                 tool = tool_map[func_name]
-                result = await tool.execute(args, workspace=workspace_path)
+                tool.last_changes = None
+                tool_started = time.monotonic()
+                if cassette is not None and cassette.should_replay_tool(func_name):
+                    result = await cassette.replay_tool(func_name)
+                else:
+                    result = await tool.execute(args, workspace=workspace_path)
+                    if cassette is not None and cassette.replaying:
+                        cassette.skip_tool()
 
                 # Ensure result is always a string (never None)
                 if result is None:
                     result = "(no output)"
                 elif not isinstance(result, str):
                     result = str(result)
+                if cassette is not None and cassette.recording:
+                    cassette.record_tool(func_name, args, result, int((time.monotonic() - tool_started) * 1000))
+                detector.observe(func_name, args, result)
 
                 yield {
                     "type": "tool_result",
                     "tool_name": func_name,
                     "content": result,
-                    "success": True
+                    "success": True,
+                    "resource_usage": tool.last_usage
                 }
 
+                # File sizes may have changed without any directory mtime changing
+                if func_name in WORKSPACE_WRITING_TOOLS:
+                    bump_workspace_generation(workspace_path)
+
                 # Track file changes with before/after content
                 if func_name == "write_file":
                     content_after = args.get("content", "")
+                    code_index_manager.notify_changed(workspace_path, args.get("path", ""))
                     yield {
                         "type": "file_change",
                         "action": "write",
@@ -161,14 +285,41 @@ async def run_agent(
                         "content_before": content_before,
                         "content_after": content_after
                     }
+                elif tool.last_changes:
+                    # Batch tools report all their changes as one event
+                    for change in tool.last_changes:
+                        code_index_manager.notify_changed(workspace_path, change["file_path"])
+                    yield {
+                        "type": "file_changes",
+                        "tool_name": func_name,
+                        "changes": tool.last_changes
+                    }
 
-                # Add tool result to conversation history
+                # Add tool result to conversation history - large outputs are
+                # compacted first since they are resent with every later call
                 # Note: Grok API uses "tool" role (OpenAI format)
-                messages.append({
+                conversation.append({
                     "role": "tool",
                     "tool_call_id": tool_call["id"],
-                    "content": result  # Must be a non-empty string
+                    "content": await compact_tool_output(func_name, result)  # Must be a non-empty string
                 })
+
+            # Iteration boundary - captures write_file and execute_bash changes alike
+            if checkpoints:
+                await create_checkpoint(workspace_path, session_id, f"after iteration {iteration + 1}", iteration + 1)
+
+            # Stuck runs get a corrective hint first, then are made to summarize and stop
+            problem = detector.end_iteration()
+            if problem:
+                hint, must_answer = detector.intervention(problem)
+                conversation.append(hint)
+                yield {
+                    "type": "status",
+                    "content": f"Loop detected: {problem} - " + (
+                        "asking the agent to summarize and stop" if must_answer else "nudging the agent to change approach"
+                    )
+                }
+            iteration += 1
         else:
             # Final assistant response
             yield {"type": "assistant", "content": msg["content"]}
@@ -0,0 +1,260 @@
+"""
+Cold-session archival to compressed segment files.
+
+Sessions idle for longer than ARCHIVE_AFTER_DAYS are moved out of the hot
+tables: their messages, tool calls, file changes and token usage are written
+as one zstd-compressed NDJSON frame appended to the current segment file, and
+deleted from the database. The sessions row stays behind as a stub that
+records where the frame lives (segment, offset, length), so reading an
+archived session back is a single seek + decompress. Each segment also has an
+append-only .idx sidecar (one JSON line per frame) so archives can be located
+without the database.
+
+Archived sessions are rehydrated transparently the first time anything asks
+for them (session routes, WebSocket resume).
+"""
+import asyncio
+import fcntl
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.config import settings
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson.zst"
+
+_segment_lock = threading.Lock()
+
+
+def _child_models():
+    """Session-owned tables, in insertion order for rehydration"""
+    from app.db_models import Message, ToolCall, FileChange, TokenUsage
+    return {"message": Message, "tool_call": ToolCall, "file_change": FileChange, "token_usage": TokenUsage}
+
+
+def _row_to_record(row) -> dict:
+    record = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.name)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        record[column.name] = value
+    return record
+
+
+def _record_to_row(model, record: dict) -> dict:
+    values = {}
+    for column in model.__table__.columns:
+        if column.name not in record:
+            continue
+        value = record[column.name]
+        if value is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        values[column.name] = value
+    return values
+
+
+def archive_dir() -> Path:
+    directory = Path(settings.archive_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def _current_segment(directory: Path) -> Path:
+    segments = sorted(directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+    if segments and segments[-1].stat().st_size < settings.archive_segment_max_mb * 1024 * 1024:
+        return segments[-1]
+    number = int(segments[-1].name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 if segments else 1
+    return directory / f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+
+def append_frame(session_id: str, payload: bytes) -> tuple[str, int, int]:
+    """Append one compressed frame to the current segment. Returns (segment, offset, length)."""
+    import zstandard
+
+    frame = zstandard.ZstdCompressor(level=settings.archive_compression_level).compress(payload)
+    with _segment_lock:
+        directory = archive_dir()
+        segment = _current_segment(directory)
+        with open(segment, "ab") as f:
+            # Other processes (e.g. a second API instance) may archive at the same time
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(frame)
+                f.flush()
+                os.fsync(f.fileno())
+                index_path = segment.with_name(segment.name[:-len(SEGMENT_SUFFIX)] + ".idx")
+                with open(index_path, "a") as index:
+                    index.write(json.dumps({
+                        "session_id": session_id,
+                        "offset": offset,
+                        "length": len(frame),
+                        "archived_at": datetime.utcnow().isoformat()
+                    }) + "\n")
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    return segment.name, offset, len(frame)
+
+
+def read_frame(segment: str, offset: int, length: int) -> list[dict]:
+    import zstandard
+
+    with open(archive_dir() / segment, "rb") as f:
+        f.seek(offset)
+        frame = f.read(length)
+    payload = zstandard.ZstdDecompressor().decompress(frame)
+    return [json.loads(line) for line in payload.splitlines() if line]
+
+
+def archive_session(session_id: str) -> bool:
+    """Move one session's data into the archive (blocking). Returns False if it was skipped."""
+    from app.database import SessionLocal
+    from app.db_models import Session as DBSession
+
+    models = _child_models()
+    db = SessionLocal()
+    try:
+        row = db.query(DBSession).filter(DBSession.id == session_id).first()
+        if row is None or row.archived_at is not None:
+            return False
+
+        lines = [json.dumps({"kind": "session", **_row_to_record(row)})]
+        ids = {}
+        for kind, model in models.items():
+            children = db.query(model).filter(model.session_id == session_id).order_by(model.id).all()
+            ids[kind] = [child.id for child in children]
+            lines.extend(json.dumps({"kind": kind, **_row_to_record(child)}) for child in children)
+
+        segment, offset, length = append_frame(session_id, ("\n".join(lines) + "\n").encode("utf-8"))
+
+        # Only what was written to the frame is deleted. If the session got new
+        # activity in the meantime, leave it hot (the frame is then just garbage).
+        for kind, model in models.items():
+            if ids[kind]:
+                db.query(model).filter(model.id.in_(ids[kind])).delete(synchronize_session=False)
+            if db.query(model.id).filter(model.session_id == session_id).first() is not None:
+                db.rollback()
+                return False
+
+        stubbed = db.query(DBSession).filter(
+            DBSession.id == session_id, DBSession.archived_at.is_(None)
+        ).update({
+            DBSession.archived_at: datetime.utcnow(),
+            DBSession.archive_segment: segment,
+            DBSession.archive_offset: offset,
+            DBSession.archive_length: length
+        }, synchronize_session=False)
+        if not stubbed:
+            db.rollback()
+            return False
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def rehydrate_session(session_id: str) -> bool:
+    """Move an archived session back into the hot tables (blocking). Returns True if it was archived."""
+    from app.database import SessionLocal
+    from app.db_models import Session as DBSession
+
+    db = SessionLocal()
+    try:
+        row = db.query(DBSession).filter(DBSession.id == session_id).first()
+        if row is None or row.archived_at is None:
+            return False
+
+        records = read_frame(row.archive_segment, row.archive_offset, row.archive_length)
+
+        # Clearing the stub first makes concurrent rehydrations of the same
+        # session race on this row - only one of them gets to insert
+        claimed = db.query(DBSession).filter(
+            DBSession.id == session_id, DBSession.archived_at.isnot(None)
+        ).update({
+            DBSession.archived_at: None,
+            DBSession.archive_segment: None,
+            DBSession.archive_offset: None,
+            DBSession.archive_length: None
+        }, synchronize_session=False)
+        if not claimed:
+            db.rollback()
+            return False
+
+        models = _child_models()
+        for kind, model in models.items():
+            rows = [_record_to_row(model, r) for r in records if r.get("kind") == kind]
+            if rows:
+                db.bulk_insert_mappings(model, rows)
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def find_idle_sessions(idle_days: float, limit: int) -> list[str]:
+    """Unarchived sessions without any activity for idle_days (blocking)"""
+    from sqlalchemy import func
+    from app.database import SessionLocal
+    from app.db_models import Session as DBSession, Message as DBMessage
+
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=idle_days)
+        last_message = (
+            db.query(DBMessage.session_id, func.max(DBMessage.created_at).label("last_at"))
+            .group_by(DBMessage.session_id)
+            .subquery()
+        )
+        rows = (
+            db.query(DBSession.id)
+            .outerjoin(last_message, last_message.c.session_id == DBSession.id)
+            .filter(DBSession.archived_at.is_(None))
+            .filter(func.coalesce(DBSession.updated_at, DBSession.created_at) < cutoff)
+            .filter((last_message.c.last_at.is_(None)) | (last_message.c.last_at < cutoff))
+            .order_by(DBSession.created_at)
+            .limit(limit)
+            .all()
+        )
+        return [r.id for r in rows]
+    finally:
+        db.close()
+
+
+def archive_idle_sessions(is_hot: Callable[[str], bool] = lambda _: False) -> int:
+    """Archive one batch of idle sessions, skipping any that are in use (blocking)"""
+    archived = 0
+    for session_id in find_idle_sessions(settings.archive_after_days, settings.archive_batch_size):
+        if is_hot(session_id):
+            continue
+        try:
+            if archive_session(session_id):
+                archived += 1
+        except Exception as e:
+            print(f"⚠️  Could not archive session {session_id}: {e}")
+    return archived
+
+
+async def run_archiver(is_hot: Callable[[str], bool], interval_seconds: float) -> None:
+    """Periodically archive idle sessions (runs for the lifetime of the app)"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            archived = await asyncio.to_thread(archive_idle_sessions, is_hot)
+            if archived:
+                print(f"Archived {archived} idle session(s)")
+        except Exception as e:
+            print(f"⚠️  Session archival failed: {e}")
+
+
+async def ensure_session_hot(session_id: str) -> Optional[bool]:
+    """Rehydrate a session if it is archived. Returns None if that failed."""
+    try:
+        return await asyncio.to_thread(rehydrate_session, session_id)
+    except Exception as e:
+        print(f"⚠️  Could not rehydrate archived session {session_id}: {e}")
+        return None
@@ -0,0 +1,233 @@
+"""
+Record/replay cassettes for deterministic agent-loop runs.
+
+With CASSETTE_MODE=record, every LLM request/response pair and every tool
+result of a session is appended to a JSONL cassette (CASSETTE_DIR/<session>.jsonl).
+With CASSETTE_MODE=replay, chat_completion answers from the cassette instead
+of the network - at the recorded latency or instantly (CASSETTE_REPLAY_LATENCY)
+- so the agent loop's own overhead can be measured without spending tokens.
+Tools are executed for real during replay (their cost is part of what is
+being measured), except network-bound ones, whose recorded results are used;
+CASSETTE_REPLAY_TOOLS=all replays every tool result.
+
+Benchmark a recorded cassette from the command line:
+
+    python -m app.cassettes replay cassettes/<session>.jsonl --workspace /tmp/ws --latency zero
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import settings
+
+CASSETTE_VERSION = 1
+
+# Tools whose results depend on the network - always served from the cassette in replay
+NETWORK_TOOLS = {"web_search"}
+
+
+class CassetteError(Exception):
+    """The cassette has no (matching) entry for a replayed call"""
+
+
+def request_fingerprint(payload: dict) -> str:
+    """
+    Stable hash of an LLM request, used to detect replay divergence. The
+    system prompt is left out - it embeds the repository map, which differs
+    whenever the replay workspace is not byte-identical to the recorded one -
+    and so is the model, which a fallback may have changed while recording.
+    """
+    relevant = {
+        "messages": [m for m in payload.get("messages", []) if m.get("role") != "system"],
+        "tools": [t["function"]["name"] for t in payload.get("tools") or []],
+        "tool_choice": payload.get("tool_choice")
+    }
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class Cassette:
+    """One session's recorded LLM calls and tool results"""
+
+    def __init__(self, path: Path, mode: str):
+        self.path = path
+        self.mode = mode
+        self.entries: Dict[str, list[dict]] = {"llm": [], "tool": [], "run": []}
+        self.cursors = {"llm": 0, "tool": 0}
+        self.mismatches = 0
+
+        if mode == "replay":
+            if not path.is_file():
+                raise CassetteError(f"No cassette at {path}")
+            for line in path.read_text(encoding="utf-8").splitlines():
+                if not line:
+                    continue
+                entry = json.loads(line)
+                self.entries.setdefault(entry["kind"], []).append(entry)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if not path.exists():
+                self._append({"kind": "header", "version": CASSETTE_VERSION, "created_at": datetime.utcnow().isoformat()})
+
+    def _append(self, entry: dict) -> None:
+        # One line per entry, flushed immediately - a crashed run still leaves a usable cassette
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record_run(self, user_message: str, agent_type: str) -> None:
+        self._append({"kind": "run", "user_message": user_message, "agent_type": agent_type})
+
+    def record_llm(self, payload: dict, response: dict, latency_ms: int) -> None:
+        self._append({
+            "kind": "llm",
+            "fingerprint": request_fingerprint(payload),
+            "request": payload,
+            "response": response,
+            "latency_ms": latency_ms
+        })
+
+    def record_tool(self, tool_name: str, arguments: dict, result: str, latency_ms: int) -> None:
+        self._append({
+            "kind": "tool",
+            "tool_name": tool_name,
+            "arguments": arguments,
+            "result": result,
+            "latency_ms": latency_ms
+        })
+
+    def _next(self, kind: str) -> dict:
+        entries = self.entries.get(kind, [])
+        cursor = self.cursors[kind]
+        if cursor >= len(entries):
+            raise CassetteError(f"Cassette {self.path.name} has no more recorded {kind} calls")
+        self.cursors[kind] = cursor + 1
+        return entries[cursor]
+
+    async def _wait(self, entry: dict) -> None:
+        if settings.cassette_replay_latency == "recorded":
+            await asyncio.sleep(entry.get("latency_ms", 0) / 1000)
+
+    async def replay_llm(self, payload: dict) -> dict:
+        entry = self._next("llm")
+        if entry["fingerprint"] != request_fingerprint(payload):
+            # The loop built a different request than when recording - later
+            # responses may no longer fit, so make it visible
+            self.mismatches += 1
+            print(f"⚠️  Cassette divergence at LLM call {self.cursors['llm']}: request differs from the recording")
+        await self._wait(entry)
+        return json.loads(json.dumps(entry["response"]))
+
+    async def replay_tool(self, tool_name: str) -> str:
+        entry = self._next("tool")
+        if entry["tool_name"] != tool_name:
+            raise CassetteError(
+                f"Cassette divergence at tool call {self.cursors['tool']}: "
+                f"recorded {entry['tool_name']}, replaying {tool_name}"
+            )
+        await self._wait(entry)
+        return entry["result"]
+
+    def skip_tool(self) -> None:
+        """Advance past a tool result that was re-executed instead of replayed"""
+        if self.cursors["tool"] < len(self.entries.get("tool", [])):
+            self.cursors["tool"] += 1
+
+    def should_replay_tool(self, tool_name: str) -> bool:
+        return self.replaying and (settings.cassette_replay_tools == "all" or tool_name in NETWORK_TOOLS)
+
+
+_cassettes: Dict[str, Cassette] = {}
+
+
+def cassette_for_session(session_id: Optional[str]) -> Optional[Cassette]:
+    """The session's cassette when record/replay is enabled, else None"""
+    if settings.cassette_mode not in ("record", "replay") or not session_id:
+        return None
+    cassette = _cassettes.get(session_id)
+    if cassette is None:
+        path = Path(settings.cassette_dir) / f"{session_id}.jsonl"
+        cassette = Cassette(path, settings.cassette_mode)
+        _cassettes[session_id] = cassette
+    return cassette
+
+
+def register_cassette(session_id: str, cassette: Cassette) -> None:
+    _cassettes[session_id] = cassette
+
+
+# --- Benchmark CLI ---
+
+async def replay_benchmark(path: Path, workspace: Path) -> dict:
+    """Re-drive run_agent through every recorded run of a cassette and time it"""
+    from app.agent_loop import run_agent
+
+    settings.cassette_mode = "replay"
+    cassette = Cassette(path, "replay")
+    session_id = f"replay-{path.stem}"
+    register_cassette(session_id, cassette)
+
+    history: list = []
+    events = 0
+    tool_seconds = 0.0
+    tool_started = None
+    started = time.perf_counter()
+    for run in cassette.entries.get("run", []):
+        async for event in run_agent(
+            user_message=run["user_message"],
+            workspace=str(workspace),
+            history=history,
+            agent_type=run.get("agent_type", "building"),
+            session_id=session_id,
+            checkpoints=False
+        ):
+            events += 1
+            if event["type"] == "tool_call":
+                tool_started = time.perf_counter()
+            elif event["type"] == "tool_result" and tool_started is not None:
+                tool_seconds += time.perf_counter() - tool_started
+                tool_started = None
+    wall = time.perf_counter() - started
+
+    recorded_llm_seconds = sum(e.get("latency_ms", 0) for e in cassette.entries["llm"]) / 1000
+    llm_seconds = recorded_llm_seconds if settings.cassette_replay_latency == "recorded" else 0.0
+    return {
+        "cassette": str(path),
+        "runs": len(cassette.entries.get("run", [])),
+        "llm_calls": cassette.cursors["llm"],
+        "tool_calls": cassette.cursors["tool"],
+        "events": events,
+        "wall_seconds": round(wall, 4),
+        "tool_seconds": round(tool_seconds, 4),
+        "simulated_llm_seconds": round(llm_seconds, 4),
+        "loop_overhead_seconds": round(max(0.0, wall - tool_seconds - llm_seconds), 4),
+        "divergences": cassette.mismatches
+    }
+
+
+if __name__ == "__main__":
+    # Run through the importable module so run_agent sees the same cassette registry
+    from app.cassettes import replay_benchmark as run_benchmark
+
+    parser = argparse.ArgumentParser(description="Replay an agent cassette and report timings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay = sub.add_parser("replay")
+    replay.add_argument("cassette", type=Path)
+    replay.add_argument("--workspace", type=Path, required=True, help="Workspace to run the tools in")
+    replay.add_argument("--latency", choices=["recorded", "zero"], default="zero")
+    args = parser.parse_args()
+
+    settings.cassette_replay_latency = args.latency
+    args.workspace.mkdir(parents=True, exist_ok=True)
+    print(json.dumps(asyncio.run(run_benchmark(args.cassette, args.workspace.resolve())), indent=2))
@@ -0,0 +1,221 @@
+"""
+Workspace checkpoints backed by git objects.
+
+Each workspace gets a private git directory (outside the workspace, so the
+user's own repository is never touched) whose index doubles as a stat cache:
+`git add -A` only re-hashes files that changed, so a snapshot costs roughly
+O(changed files). A checkpoint is a commit on refs/checkpoints/<session_id>
+whose message holds its metadata as JSON. Restoring is a `read-tree -u`,
+which only rewrites the files that differ.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import subprocess
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import settings
+from app.private_dirs import private_temp_dir
+from app.repo_map import IGNORE_DIRS
+
+CHECKPOINT_ID = re.compile(r"[0-9a-f]{40}")
+SESSION_ID = re.compile(r"[A-Za-z0-9_-]+")
+MAX_DIFF_BYTES = 500_000
+
+GIT_IDENTITY = {
+    "GIT_AUTHOR_NAME": "web-agent", "GIT_AUTHOR_EMAIL": "checkpoints@web-agent",
+    "GIT_COMMITTER_NAME": "web-agent", "GIT_COMMITTER_EMAIL": "checkpoints@web-agent",
+}
+
+
+class CheckpointError(Exception):
+    """A checkpoint operation failed (unknown checkpoint, git error, ...)"""
+
+
+# One lock per workspace - the checkpoint index is shared by its sessions
+_locks: Dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _workspace_lock(workspace: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(workspace, threading.Lock())
+
+
+class CheckpointStore:
+    """Checkpoints of one workspace"""
+
+    def __init__(self, workspace: Path):
+        self.workspace = workspace.resolve()
+        # git runs with GIT_DIR set - a planted config or hook would run as us, so only we may write there
+        try:
+            root = Path(settings.checkpoint_dir) if settings.checkpoint_dir else private_temp_dir("checkpoints")
+        except OSError as e:
+            raise CheckpointError(f"Checkpoint directory is not usable: {e}")
+        digest = hashlib.sha256(str(self.workspace).encode()).hexdigest()[:32]
+        self.git_dir = root / f"{digest}.git"
+        self.lock = _workspace_lock(self.workspace)
+
+    def _git(self, *args: str, input: Optional[str] = None, check: bool = True) -> str:
+        env = {
+            **os.environ, **GIT_IDENTITY,
+            "GIT_DIR": str(self.git_dir),
+            "GIT_WORK_TREE": str(self.workspace),
+        }
+        result = subprocess.run(
+            ["git", *args], cwd=self.workspace, env=env, input=input,
+            capture_output=True, text=True, errors="replace"
+        )
+        if check and result.returncode != 0:
+            raise CheckpointError(result.stderr.strip() or f"git {args[0]} failed")
+        return result.stdout
+
+    def _ensure_repo(self) -> None:
+        if (self.git_dir / "HEAD").exists():
+            return
+        self.git_dir.parent.mkdir(parents=True, exist_ok=True)
+        subprocess.run(["git", "init", "-q", "--bare", str(self.git_dir)], check=True, capture_output=True)
+        self._git("config", "core.bare", "false")
+        # Dependency and build directories are cheap to regenerate and expensive to snapshot
+        exclude = self.git_dir / "info" / "exclude"
+        exclude.parent.mkdir(exist_ok=True)
+        exclude.write_text("".join(f"{name}/\n" for name in sorted(IGNORE_DIRS)))
+
+    @staticmethod
+    def _ref(session_id: str) -> str:
+        if not SESSION_ID.fullmatch(session_id):
+            raise CheckpointError(f"Invalid session id: {session_id}")
+        return f"refs/checkpoints/{session_id}"
+
+    def _head(self, session_id: str) -> Optional[str]:
+        head = self._git("rev-parse", "--verify", "-q", self._ref(session_id), check=False).strip()
+        return head or None
+
+    def _stage_workspace(self) -> str:
+        """Sync the checkpoint index with the working tree and return its tree id"""
+        self._git("add", "-A", ".")
+        return self._git("write-tree").strip()
+
+    def _commit(self, session_id: str, tree: str, label: str, iteration: Optional[int]) -> str:
+        metadata = json.dumps({
+            "label": label,
+            "iteration": iteration,
+            "created_at": datetime.utcnow().isoformat()
+        })
+        parent = self._head(session_id)
+        args = ["commit-tree", tree] + (["-p", parent] if parent else [])
+        commit = self._git(*args, input=metadata).strip()
+        self._git("update-ref", self._ref(session_id), commit)
+        return commit
+
+    def _resolve(self, session_id: str, checkpoint_id: str) -> str:
+        """Validate that a checkpoint id belongs to the session"""
+        head = self._head(session_id)
+        if not CHECKPOINT_ID.fullmatch(checkpoint_id or "") or head is None:
+            raise CheckpointError(f"Unknown checkpoint: {checkpoint_id}")
+        try:
+            self._git("merge-base", "--is-ancestor", checkpoint_id, head)
+        except CheckpointError:
+            raise CheckpointError(f"Unknown checkpoint: {checkpoint_id}")
+        return checkpoint_id
+
+    def snapshot(self, session_id: str, label: str, iteration: Optional[int] = None) -> Optional[str]:
+        """Checkpoint the workspace. Returns the checkpoint id, or None if nothing changed."""
+        with self.lock:
+            self._ensure_repo()
+            tree = self._stage_workspace()
+            head = self._head(session_id)
+            if head is not None and self._git("rev-parse", f"{head}^{{tree}}").strip() == tree:
+                return None
+            return self._commit(session_id, tree, label, iteration)
+
+    def list_checkpoints(self, session_id: str) -> list[dict]:
+        """Checkpoints of a session, newest first"""
+        with self.lock:
+            if not (self.git_dir / "HEAD").exists() or self._head(session_id) is None:
+                return []
+            log = self._git(
+                "log", "--format=%x01%H%x00%B%x00", "--shortstat", self._ref(session_id)
+            )
+
+        checkpoints = []
+        for entry in log.split("\x01")[1:]:
+            commit, message, stat = (entry.split("\x00") + ["", ""])[:3]
+            try:
+                metadata = json.loads(message.strip())
+            except ValueError:
+                metadata = {}
+            files_changed = re.search(r"(\d+) files? changed", stat)
+            checkpoints.append({
+                "id": commit.strip(),
+                "label": metadata.get("label"),
+                "iteration": metadata.get("iteration"),
+                "created_at": metadata.get("created_at"),
+                "files_changed": int(files_changed.group(1)) if files_changed else 0
+            })
+        return checkpoints
+
+    def diff(self, session_id: str, checkpoint_id: str, against: Optional[str] = None) -> dict:
+        """Diff from a checkpoint to another checkpoint, or to the current workspace"""
+        with self.lock:
+            self._ensure_repo()
+            base = self._resolve(session_id, checkpoint_id)
+            if against:
+                args = [base, self._resolve(session_id, against)]
+            else:
+                # Compare against the working tree through a freshly synced index
+                self._stage_workspace()
+                args = ["--cached", base]
+            stat = self._git("diff", "--stat", *args)
+            patch = self._git("diff", *args)
+
+        truncated = len(patch) > MAX_DIFF_BYTES
+        return {
+            "from": base,
+            "to": against or "workspace",
+            "stat": stat,
+            "diff": patch[:MAX_DIFF_BYTES],
+            "truncated": truncated
+        }
+
+    def restore(self, session_id: str, checkpoint_id: str) -> dict:
+        """
+        Reset the workspace to a checkpoint. The current state is checkpointed
+        first, so a restore can itself be undone.
+        """
+        with self.lock:
+            self._ensure_repo()
+            target = self._resolve(session_id, checkpoint_id)
+            tree = self._stage_workspace()
+            head = self._head(session_id)
+            backup = None
+            if self._git("rev-parse", f"{head}^{{tree}}").strip() != tree:
+                backup = self._commit(session_id, tree, "before restore", None)
+
+            changed = self._git("diff", "--name-only", "--cached", target).split("\n")
+            # The index matches the working tree, so -u only touches files that differ
+            self._git("read-tree", "-u", "--reset", target)
+            restored = self._commit(session_id, self._git("write-tree").strip(), f"restored {target[:12]}", None)
+
+        return {
+            "restored": target,
+            "checkpoint": restored,
+            "backup": backup,
+            "files_changed": len([p for p in changed if p])
+        }
+
+
+async def create_checkpoint(workspace: Path, session_id: Optional[str], label: str, iteration: Optional[int] = None) -> Optional[str]:
+    """Best-effort checkpoint from the agent loop - failures never break a run"""
+    if not settings.checkpoints_enabled or not session_id:
+        return None
+    try:
+        return await asyncio.to_thread(CheckpointStore(workspace).snapshot, session_id, label, iteration)
+    except Exception as e:
+        print(f"⚠️  Could not checkpoint workspace: {e}")
+        return None
@@ -0,0 +1,289 @@
+"""
+BM25 relevance index over workspace code chunks.
+
+Backs the find_relevant_code tool, so the agent can jump straight to the
+right file instead of reading file after file. Files are split into
+overlapping line windows and indexed in an inverted index. Indexes are built
+in a background thread, persisted per workspace, and kept current
+incrementally: write_file reports the paths it touched, and every query
+re-stats the workspace to pick up changes made by other tools (e.g. bash).
+"""
+import asyncio
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from pathlib import Path
+from typing import Dict, Optional
+
+import orjson
+
+from app.config import settings
+from app.private_dirs import private_temp_dir
+from app.repo_map import list_workspace_files
+
+INDEX_VERSION = 2
+
+CHUNK_LINES = 40
+CHUNK_STRIDE = 30
+MAX_FILE_BYTES = 500_000
+MAX_CACHED_INDEXES = 8
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+CAMEL_SPLIT = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased terms: whole identifiers plus their snake_case/camelCase parts"""
+    terms = []
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        lowered = identifier.lower()
+        terms.append(lowered)
+        parts = [p.lower() for piece in identifier.split("_") for p in CAMEL_SPLIT.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(p for p in parts if len(p) > 1)
+    return terms
+
+
+class CodeIndex:
+    """Inverted BM25 index of one workspace"""
+
+    def __init__(self, workspace: Path):
+        self.workspace = workspace
+        self.lock = threading.RLock()
+        # chunk_id → (path, start_line, end_line, length)
+        self.chunks: Dict[int, tuple[str, int, int, int]] = {}
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        # path → (mtime_ns, size, [chunk_ids])
+        self.files: Dict[str, tuple[int, int, list[int]]] = {}
+        self.total_length = 0
+        self.next_chunk_id = 0
+
+    def _remove_file(self, path: str) -> None:
+        entry = self.files.pop(path, None)
+        if entry is None:
+            return
+        for chunk_id in entry[2]:
+            _, _, _, length = self.chunks.pop(chunk_id)
+            self.total_length -= length
+        # Postings of removed chunks are dropped lazily at query time and on save
+
+    def _add_file(self, path: str) -> None:
+        full_path = self.workspace / path
+        try:
+            stat = full_path.stat()
+            if stat.st_size > MAX_FILE_BYTES:
+                return
+            raw = full_path.read_bytes()
+        except OSError:
+            return
+        if b"\0" in raw[:8192]:
+            return  # binary
+
+        lines = raw.decode("utf-8", errors="replace").splitlines()
+        chunk_ids = []
+        start = 0
+        while True:
+            window = lines[start:start + CHUNK_LINES]
+            # The path itself is strong evidence, so it is indexed with every chunk
+            terms = tokenize(path) + tokenize("\n".join(window))
+            if terms:
+                chunk_id = self.next_chunk_id
+                self.next_chunk_id += 1
+                self.chunks[chunk_id] = (path, start + 1, start + len(window), len(terms))
+                self.total_length += len(terms)
+                for term, count in Counter(terms).items():
+                    self.postings[term][chunk_id] = count
+                chunk_ids.append(chunk_id)
+            if start + CHUNK_LINES >= len(lines):
+                break
+            start += CHUNK_STRIDE
+
+        self.files[path] = (stat.st_mtime_ns, stat.st_size, chunk_ids)
+
+    def update_file(self, path: str) -> None:
+        with self.lock:
+            self._remove_file(path)
+            if (self.workspace / path).is_file():
+                self._add_file(path)
+
+    def refresh(self) -> int:
+        """Re-index files that were added, changed or removed. Returns how many changed."""
+        current = {}
+        for path in list_workspace_files(self.workspace):
+            try:
+                stat = (self.workspace / path).stat()
+            except OSError:
+                continue
+            current[path] = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            stale = [p for p in self.files if p not in current]
+            changed = [
+                p for p, (mtime, size) in current.items()
+                if p not in self.files or self.files[p][:2] != (mtime, size)
+            ]
+            for path in stale:
+                self._remove_file(path)
+            for path in changed:
+                self._remove_file(path)
+                self._add_file(path)
+        return len(stale) + len(changed)
+
+    def search(self, query: str, top_k: int) -> list[tuple[float, str, int, int]]:
+        """Best chunks for a query as (score, path, start_line, end_line)"""
+        with self.lock:
+            if not self.chunks:
+                return []
+            n = len(self.chunks)
+            avg_length = self.total_length / n
+            scores: Dict[int, float] = defaultdict(float)
+
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                live = {cid: tf for cid, tf in postings.items() if cid in self.chunks}
+                if not live:
+                    continue
+                idf = math.log(1 + (n - len(live) + 0.5) / (len(live) + 0.5))
+                for chunk_id, tf in live.items():
+                    length = self.chunks[chunk_id][3]
+                    scores[chunk_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+            ranked = sorted(scores.items(), key=lambda item: -item[1])
+            results = []
+            seen_ranges: Dict[str, list[tuple[int, int]]] = defaultdict(list)
+            for chunk_id, score in ranked:
+                path, start, end, _ = self.chunks[chunk_id]
+                # Overlapping windows of the same file would repeat the same code
+                if any(start <= e and end >= s for s, e in seen_ranges[path]):
+                    continue
+                seen_ranges[path].append((start, end))
+                results.append((score, path, start, end))
+                if len(results) >= top_k:
+                    break
+            return results
+
+    def compact(self) -> None:
+        with self.lock:
+            for term in list(self.postings):
+                live = {cid: tf for cid, tf in self.postings[term].items() if cid in self.chunks}
+                if live:
+                    self.postings[term] = live
+                else:
+                    del self.postings[term]
+
+    def save(self, path: Path) -> None:
+        self.compact()
+        with self.lock:
+            state = {
+                "version": INDEX_VERSION,
+                "chunks": self.chunks,
+                "postings": dict(self.postings),
+                "files": self.files,
+                "total_length": self.total_length,
+                "next_chunk_id": self.next_chunk_id,
+            }
+            # Plain JSON - loading an index must never execute anything
+            data = orjson.dumps(state, option=orjson.OPT_NON_STR_KEYS)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, workspace: Path, path: Path) -> Optional["CodeIndex"]:
+        try:
+            state = orjson.loads(path.read_bytes())
+            if not isinstance(state, dict) or state.get("version") != INDEX_VERSION:
+                return None
+            index = cls(workspace)
+            # JSON object keys are strings - chunk ids are ints again
+            index.chunks = {int(chunk_id): tuple(chunk) for chunk_id, chunk in state["chunks"].items()}
+            index.postings = defaultdict(dict, {
+                term: {int(chunk_id): tf for chunk_id, tf in postings.items()}
+                for term, postings in state["postings"].items()
+            })
+            index.files = {
+                file_path: (mtime_ns, size, list(chunk_ids))
+                for file_path, (mtime_ns, size, chunk_ids) in state["files"].items()
+            }
+            index.total_length = int(state["total_length"])
+            index.next_chunk_id = int(state["next_chunk_id"])
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return None
+        return index
+
+
+def index_path(workspace: Path) -> Path:
+    if settings.code_index_dir:
+        directory = Path(settings.code_index_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+    else:
+        directory = private_temp_dir("code-index")
+    return directory / f"{hashlib.sha256(str(workspace).encode()).hexdigest()[:32]}.json"
+
+
+def _load_or_build(workspace: Path) -> CodeIndex:
+    path = index_path(workspace)
+    index = CodeIndex.load(workspace, path) or CodeIndex(workspace)
+    if index.refresh():
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"⚠️  Could not persist code index: {e}")
+    return index
+
+
+class CodeIndexManager:
+    """Keeps one index per workspace, built and refreshed in background threads"""
+
+    def __init__(self):
+        self._builds: "OrderedDict[Path, asyncio.Future]" = OrderedDict()
+
+    def ensure(self, workspace: Path) -> asyncio.Future:
+        """Start building (or loading) a workspace's index without waiting for it"""
+        workspace = workspace.resolve()
+        future = self._builds.get(workspace)
+        # A cancelled future has no exception - exception() would raise CancelledError
+        if future is None or (future.done() and (future.cancelled() or future.exception() is not None)):
+            future = asyncio.ensure_future(asyncio.to_thread(_load_or_build, workspace))
+            self._builds[workspace] = future
+            while len(self._builds) > MAX_CACHED_INDEXES:
+                self._builds.popitem(last=False)
+        self._builds.move_to_end(workspace)
+        return future
+
+    async def search(self, workspace: Path, query: str, top_k: int) -> list[tuple[float, str, int, int]]:
+        index = await self.ensure(workspace)
+
+        def refresh_and_search():
+            if index.refresh():
+                try:
+                    index.save(index_path(index.workspace))
+                except OSError as e:
+                    print(f"⚠️  Could not persist code index: {e}")
+            return index.search(query, top_k)
+
+        return await asyncio.to_thread(refresh_and_search)
+
+    def notify_changed(self, workspace: Path, rel_path: str) -> None:
+        """Incrementally re-index a file another tool just wrote"""
+        workspace = workspace.resolve()
+        future = self._builds.get(workspace)
+        if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+            return  # Not indexed yet - the next build picks the change up
+        try:
+            # Index keys are normalized relative paths ("./a/../b.py" → "b.py")
+            rel_path = str((workspace / rel_path).resolve().relative_to(workspace))
+        except ValueError:
+            return
+        asyncio.get_running_loop().run_in_executor(None, future.result().update_file, rel_path)
+
+
+code_index_manager = CodeIndexManager()
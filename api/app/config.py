@@ -9,11 +9,146 @@ class Settings(BaseSettings):
     max_iterations: int = 10
     default_workspace: str = "../workspaces/default-project"
 
+    # Iteration budget and loop detection (see app/loop_detection.py)
+    # Per agent type: a run gets "base" iterations plus one per productive
+    # iteration, up to "max". Agent types not listed get MAX_ITERATIONS.
+    agent_iteration_limits: dict[str, dict[str, int]] = {
+        "planning": {"base": 8, "max": 16},
+        "building": {"base": 10, "max": 30},
+    }
+    loop_detection_enabled: bool = True
+    loop_repeat_threshold: int = 3  # Same tool call with the same result this many times counts as a loop
+    loop_stall_iterations: int = 3  # Iterations in a row without new information count as a stall (0 disables)
+    loop_max_hints: int = 1  # Corrective hints before a stuck agent is made to summarize and stop
+
+    # Agent run fan-out
+    subscriber_queue_size: int = 256  # Max pending events per subscriber before coalescing/dropping
+    ws_flush_interval_ms: int = 50  # WebSocket sends are batched per tick, superseded events coalesced (0 disables)
+    ws_per_message_deflate: bool = True  # Negotiate permessage-deflate on /ws (python -m app.main)
+
+    # In-memory session cache (evicted sessions are rehydrated from the database)
+    session_cache_size: int = 200  # Max sessions kept in memory
+    session_idle_ttl_seconds: int = 1800  # Evict sessions idle for longer than this
+    session_sweep_interval_seconds: int = 60  # How often idle sessions are swept
+
+    # Persistent execute_bash shells (one per session)
+    shell_pool_size: int = 32  # Max live shell workers; beyond this commands run in one-shot shells
+    shell_idle_timeout_seconds: int = 600  # Shut down shells idle for longer than this
+
+    # execute_bash resource limits (0 disables a limit)
+    bash_cpu_seconds_per_process: int = 600  # RLIMIT_CPU for every process a command starts
+    bash_memory_mb: int = 4096  # memory.max per session with cgroups, otherwise RLIMIT_DATA per process
+    bash_max_processes: int = 512  # pids.max per session (cgroup v2 only)
+    bash_max_cpus: float = 2.0  # cpu.max per session (cgroup v2 only)
+    bash_nice: int = 10  # Scheduling priority offset so agents can't starve the API
+    bash_session_cpu_seconds: int = 3600  # Total CPU budget of a session's shell
+    bash_max_output_bytes: int = 1_000_000  # Per stream (stdout/stderr) kept from one command
+    bash_cgroup_root: str | None = None  # Delegated cgroup v2 directory, e.g. /sys/fs/cgroup/web-agent
+
+    # Compaction of large tool outputs before they enter the conversation history
+    tool_output_max_tokens: int = 2000  # Outputs above this (estimated) size are compacted
+    tool_output_head_lines: int = 40  # Lines kept from the start of a compacted output
+    tool_output_tail_lines: int = 60  # Lines kept from the end of a compacted output
+    tool_output_dir: str | None = None  # Where full outputs are stored (default: owner-only dir in the system temp dir)
+    tool_output_max_files: int = 1000  # Oldest stored outputs are deleted beyond this
+
+    # Repository map added to the system prompt (0 disables it)
+    repo_map_max_tokens: int = 1500
+    repo_map_cache_dir: str | None = None  # Default: owner-only dir in the system temp dir
+
+    # Workspace checkpoints at agent iteration boundaries (see app/checkpoints.py)
+    checkpoints_enabled: bool = True
+    checkpoint_dir: str | None = None  # Where checkpoint git directories live (default: owner-only dir in the system temp dir)
+
+    # Orchestrated runs - TODO items fanned out to parallel building agents
+    orchestrator_max_parallel: int = 4  # Building agents running at once
+    orchestrator_max_subtasks: int = 8  # TODO items are grouped into at most this many subtasks
+    orchestrator_scratch_dir: str | None = None  # Where subtask workspace copies live (default: owner-only dir in the system temp dir)
+
+    # Copy-on-write workspace overlays - a private view of the workspace per session (see app/overlays.py)
+    workspace_overlays: bool = False  # Default for POST /sessions {"overlay": ...}
+    workspace_overlay_mode: str = "auto"  # "reflink", "worktree" or "copy"; "auto" tries them in that order
+    workspace_overlay_dir: str = "../workspace-overlays"  # Same filesystem as the workspaces, for reflinks
+    workspace_overlay_idle_days: float = 7  # Unchanged overlays with nothing to promote are removed after this (0 keeps them)
+
+    # Archival of idle sessions to compressed segment files (see app/archival.py)
+    archive_after_days: float = 30  # Sessions idle for longer are archived (0 disables archival)
+    archive_dir: str = "../session-archive"
+    archive_segment_max_mb: int = 256  # A new segment file is started beyond this size
+    archive_compression_level: int = 10  # zstd level
+    archive_interval_seconds: int = 3600  # How often idle sessions are looked for
+    archive_batch_size: int = 100  # Sessions archived per run
+
+    # Record/replay of LLM calls and tool results (see app/cassettes.py)
+    cassette_mode: str | None = None  # "record" or "replay"; unset disables cassettes
+    cassette_dir: str = "../cassettes"  # One <session_id>.jsonl cassette per session
+    cassette_replay_latency: str = "recorded"  # "recorded" re-applies the recorded LLM latency, "zero" skips it
+    cassette_replay_tools: str = "network"  # "network" replays only web_search results, "all" replays every tool
+
+    # Exact-match LLM response cache (see app/response_cache.py)
+    response_cache_enabled: bool = False  # Answer repeated temperature-0 requests from disk
+    response_cache_agent_types: list[str] = []  # Agent types whose calls are cached at any temperature, e.g. ["planning"]
+    response_cache_dir: str | None = None  # Default: owner-only dir in the system temp dir
+    response_cache_max_mb: int = 256  # Least recently used responses are evicted beyond this
+
+    # Diagnostics (see app/profiler.py)
+    admin_token: str | None = None  # Enables /admin endpoints, sent as X-Admin-Token
+    profile_max_seconds: int = 120  # Longest profile /admin/profile takes
+    slow_callback_ms: int = 250  # Log event-loop stalls longer than this with the blocking stack (0 disables)
+
+    # Per-call LLM usage records and daily rollups behind /api/analytics
+    usage_tracking_enabled: bool = True
+
+    # Headless job queue (/jobs)
+    job_workers: int = 2  # Jobs run concurrently inside the API process (0: only standalone workers)
+    job_poll_interval_seconds: float = 1.0  # Idle workers and NDJSON streams poll this often
+    job_heartbeat_seconds: float = 10.0
+    job_stale_seconds: float = 120.0  # Running jobs without a heartbeat for this long are requeued
+    job_max_attempts: int = 3
+
+    # Workspace listings of GET /sessions/{id}/files (see app/file_listing.py)
+    file_listing_max_depth: int = 8  # Deepest level of a recursive listing
+    file_listing_max_entries: int = 20_000  # Recursive listings stop (truncated) beyond this
+
+    # GET /sessions/{id}/files/content (see app/file_content.py)
+    file_content_compress_min_bytes: int = 1024  # Smaller text files are sent uncompressed
+    file_content_compress_max_mb: int = 32  # Larger files are sent uncompressed
+    file_content_brotli_quality: int = 5  # Used when the optional brotli package is installed
+    file_content_cache_dir: str | None = None  # Compressed copies (default: owner-only dir in the system temp dir)
+    file_content_cache_max_files: int = 500  # Oldest compressed copies are deleted beyond this
+
+    # Limits of the read_files batch tool
+    read_files_max_files: int = 50
+    read_files_max_file_bytes: int = 100_000  # Larger files are truncated
+    read_files_max_total_bytes: int = 400_000  # Across all files of one call
+
+    # BM25 index behind the find_relevant_code tool
+    code_index_dir: str | None = None  # Where per-workspace indexes are persisted (default: owner-only dir in the system temp dir)
+
     # Token pricing (per million tokens)
     # Default pricing for grok-4-1-fast as of Jan 2026
     input_price: float = 5.0  # $5 per 1M input tokens
     output_price: float = 15.0  # $15 per 1M output tokens
 
+    # Model routing (see app/model_router.py)
+    default_temperature: float = 0.7
+    default_max_tokens: int = 4096
+    # Ordered rules, first match wins. Match keys: agent_type, role
+    # ("initial", "tool_followup", "final"), min_context_tokens, max_context_tokens.
+    # Params: model, temperature, max_tokens
+    model_routes: list[dict] = [
+        {"agent_type": "building", "role": "tool_followup", "max_context_tokens": 200_000,
+         "model": "grok-code-fast-1", "temperature": 0.3},
+    ]
+    # Models to try, in order, when a model is rate limited or unavailable
+    model_fallbacks: dict[str, list[str]] = {
+        "grok-code-fast-1": ["grok-4-1-fast-non-reasoning"],
+    }
+    # Per-model pricing overrides ($ per 1M tokens), e.g. {"grok-code-fast-1": {"input": 0.2, "output": 1.5}}
+    model_pricing: dict[str, dict[str, float]] = {
+        "grok-code-fast-1": {"input": 0.2, "output": 1.5},
+    }
+
     # Google Search API (optional)
     google_api_key: str | None = None
     google_search_engine_id: str | None = None
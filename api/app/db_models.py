@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Date, ForeignKey, Boolean, Float, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -15,6 +15,12 @@ class Session(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Set while the session's data lives in a compressed archive segment (see app/archival.py)
+    archived_at = Column(DateTime(timezone=True), nullable=True)
+    archive_segment = Column(String, nullable=True)
+    archive_offset = Column(BigInteger, nullable=True)
+    archive_length = Column(Integer, nullable=True)
+
     # Relationships
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
     tool_calls = relationship("ToolCall", back_populates="session", cascade="all, delete-orphan")
@@ -56,6 +62,8 @@ class ToolCall(Base):
     error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     execution_time_ms = Column(Integer, nullable=True)  # Execution time in milliseconds
+    cpu_seconds = Column(Float, nullable=True)  # CPU time used by the command (execute_bash)
+    peak_rss_mb = Column(Float, nullable=True)  # Peak resident memory of the command (execute_bash)
 
     # Relationships
     session = relationship("Session", back_populates="tool_calls")
@@ -103,6 +111,99 @@ class TokenUsage(Base):
         return f"<TokenUsage {self.id} - {self.total_tokens} tokens>"
 
 
+class LLMCall(Base):
+    """One LLM request with its token deltas, written server-side by the agent loop"""
+    __tablename__ = "llm_calls"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # No foreign key: job and orchestrator subtask runs have no sessions row
+    session_id = Column(String, nullable=True, index=True)
+    workspace = Column(String, nullable=False)
+    agent_type = Column(String, nullable=True)
+    model = Column(String, nullable=False)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)  # Prompt tokens served from the provider cache
+    latency_ms = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return f"<LLMCall {self.id} - {self.model}>"
+
+
+class UsageRollup(Base):
+    """Daily usage per session, workspace and model - kept up to date on every LLMCall insert"""
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "session_id", "workspace", "model", name="uq_usage_rollups_key"),
+        Index("ix_usage_rollups_workspace_day", "workspace", "day"),
+        Index("ix_usage_rollups_model_day", "model", "day"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False, index=True)
+    session_id = Column(String, nullable=False, default="")  # "" for calls without a session
+    workspace = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)  # Sum - divide by calls for the average
+    cost = Column(Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<UsageRollup {self.day} {self.workspace} {self.model}>"
+
+
+class Job(Base):
+    """Headless agent run queued through the /jobs API"""
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    prompt = Column(Text, nullable=False)
+    workspace = Column(String, nullable=False)
+    agent_type = Column(String, default="building")
+    priority = Column(Integer, default=0, nullable=False)  # Higher runs first
+    status = Column(String, default="queued", nullable=False, index=True)  # "queued", "running", "succeeded", "failed", "cancelled"
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    worker_id = Column(String, nullable=True)  # Worker currently running the job
+    result = Column(Text, nullable=True)  # Final assistant message
+    error = Column(Text, nullable=True)
+    input_tokens = Column(Integer, default=0, nullable=False)
+    output_tokens = Column(Integer, default=0, nullable=False)
+    estimated_cost = Column(Float, default=0.0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # Stale heartbeats are requeued
+
+    # Relationships
+    events = relationship("JobEvent", back_populates="job", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<Job {self.id} - {self.status}>"
+
+
+class JobEvent(Base):
+    """Event produced by a job's agent run, in order"""
+    __tablename__ = "job_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, ForeignKey("jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    job = relationship("Job", back_populates="events")
+
+    def __repr__(self):
+        return f"<JobEvent {self.id} - {self.event_type}>"
+
+
 # Optional: User model for future authentication
 class User(Base):
     """User model for authentication"""
@@ -0,0 +1,150 @@
+"""
+Serving workspace file contents over HTTP.
+
+Files are sent with FileResponse, which streams them from disk (via the
+server's pathsend/sendfile support when available) and handles Range
+requests. Text files can be sent gzip- or brotli-compressed: the compressed
+variant is written once to a cache directory, keyed by path, mtime and size,
+and then served like any other file - so repeated downloads cost no CPU.
+Range requests always get the identity encoding.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import tempfile
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.private_dirs import private_temp_dir
+from app.repo_map import SOURCE_EXTENSIONS
+
+SNIFF_BYTES = 8192
+
+# Text types that mimetypes knows by a non-text/* name
+TEXT_MEDIA_TYPES = {
+    "application/json", "application/javascript", "application/xml",
+    "application/x-sh", "application/toml", "application/yaml", "image/svg+xml"
+}
+
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def is_text_file(path: Path) -> bool:
+    """Binary files contain NUL bytes early on - everything else is served as text"""
+    with open(path, "rb") as f:
+        return b"\0" not in f.read(SNIFF_BYTES)
+
+
+def media_type_for(path: Path, is_text: bool) -> str:
+    guessed = mimetypes.guess_type(path.name)[0]
+    if not is_text:
+        return guessed or "application/octet-stream"
+    # Source files are often guessed wrong (.ts → video/mp2t) or not at all
+    if path.suffix in SOURCE_EXTENSIONS:
+        return "text/plain; charset=utf-8"
+    if guessed and (guessed.startswith("text/") or guessed in TEXT_MEDIA_TYPES):
+        return f"{guessed}; charset=utf-8"
+    return "text/plain; charset=utf-8"
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Best of the encodings we can produce that the client accepts (None: identity)"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    candidates = (["br"] if brotli_available() else []) + ["gzip"]
+    for encoding in candidates:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+def file_etag(stat: os.stat_result, encoding: Optional[str] = None) -> str:
+    tag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str, stat: os.stat_result) -> bool:
+    """Conditional GET check (If-None-Match wins over If-Modified-Since)"""
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def last_modified(stat: os.stat_result) -> str:
+    return formatdate(stat.st_mtime, usegmt=True)
+
+
+def cache_dir() -> Path:
+    # Variants are served as file contents - the default must not be writable by other users
+    if not settings.file_content_cache_dir:
+        return private_temp_dir("compressed")
+    directory = Path(settings.file_content_cache_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def _prune(directory: Path) -> None:
+    variants = sorted(
+        (p for p in directory.iterdir() if not p.name.startswith(".tmp-")),
+        key=lambda p: p.stat().st_mtime
+    )
+    for variant in variants[:max(0, len(variants) - settings.file_content_cache_max_files)]:
+        variant.unlink(missing_ok=True)
+
+
+def compressed_variant(path: Path, stat: os.stat_result, encoding: str) -> Optional[Path]:
+    """
+    Path of the compressed copy of a file, creating it if needed (blocking).
+    Returns None if the file changed while it was being compressed.
+    """
+    key = hashlib.sha256(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}".encode()).hexdigest()[:32]
+    directory = cache_dir()
+    variant = directory / (key + ENCODING_SUFFIXES[encoding])
+    if variant.exists():
+        return variant
+
+    data = path.read_bytes()
+    current = path.stat()
+    if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+        return None
+    if encoding == "br":
+        import brotli
+        compressed = brotli.compress(data, quality=settings.file_content_brotli_quality)
+    else:
+        compressed = gzip.compress(data, compresslevel=6, mtime=0)
+
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(compressed)
+    os.replace(tmp, variant)
+    _prune(directory)
+    return variant
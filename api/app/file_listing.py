@@ -0,0 +1,171 @@
+"""
+Workspace file listings for the file explorer.
+
+Listings can be recursive (up to a depth) and are paginated. Ignored
+directories (IGNORE_DIRS) are listed and flagged, but never walked into.
+Results are cached per workspace and request; a cached listing stays valid
+while the mtimes of the directories it covers and the workspace generation
+are unchanged. Directory mtimes catch files being added, removed or renamed;
+the generation is bumped whenever an agent tool may have rewritten files in
+place (which changes sizes but no directory mtime). The same signature is the
+listing's ETag, so an unchanged tree costs one stat() per directory and a 304.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import settings
+from app.repo_map import IGNORE_DIRS
+
+CACHE_SIZE = 64
+
+_generations: Dict[str, int] = {}
+_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class WorkspacePathError(Exception):
+    """The requested workspace path can't be served"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def resolve_workspace_path(workspace: Path, path: str) -> Path:
+    """Resolve a client-supplied path, refusing anything outside the workspace"""
+    workspace = Path(workspace).resolve()
+    target = (workspace / path).resolve() if path else workspace
+
+    # Security: ensure path is within workspace (symlinks are resolved first)
+    if not target.is_relative_to(workspace):
+        raise WorkspacePathError(403, "Path outside workspace")
+    if not target.exists():
+        raise WorkspacePathError(404, "Path not found")
+    return target
+
+
+def bump_workspace_generation(workspace: Path) -> None:
+    """Invalidate cached listings of a workspace whose files may have changed in place"""
+    key = str(Path(workspace).resolve())
+    _generations[key] = _generations.get(key, 0) + 1
+
+
+def _signature(generation: int, directory_mtimes: list[tuple[str, int]]) -> str:
+    digest = hashlib.sha1(str(generation).encode())
+    for directory, mtime_ns in directory_mtimes:
+        digest.update(f"{directory}\0{mtime_ns}\0".encode())
+    return digest.hexdigest()[:20]
+
+
+def _current_mtimes(directories: list[tuple[str, int]]) -> Optional[list[tuple[str, int]]]:
+    current = []
+    for directory, _ in directories:
+        try:
+            current.append((directory, os.stat(directory).st_mtime_ns))
+        except OSError:
+            return None
+    return current
+
+
+def _scan(workspace: Path, target: Path, max_depth: int, hide_ignored: bool, max_entries: int) -> tuple[list[dict], list, bool]:
+    """
+    Pre-order walk: every directory is followed by its children.
+    Returns (items, [(directory, mtime_ns)], truncated).
+    """
+    items: list[dict] = []
+    directories: list[tuple[str, int]] = []
+
+    def walk(directory: Path, depth: int) -> bool:
+        try:
+            # Taken before reading the directory: a change during the scan
+            # then shows up as a stale signature on the next request
+            directories.append((str(directory), os.stat(directory).st_mtime_ns))
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except PermissionError:
+            if directory == target:
+                raise
+            return True
+        except FileNotFoundError:
+            return True
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+                ignored = is_dir and entry.name in IGNORE_DIRS
+                if ignored and hide_ignored:
+                    continue
+                item = {
+                    "name": entry.name,
+                    "path": os.path.relpath(entry.path, workspace),
+                    "type": "directory" if is_dir else "file",
+                    "size": None if is_dir else entry.stat().st_size,
+                    "depth": depth
+                }
+            except OSError:
+                continue
+            if ignored:
+                item["ignored"] = True
+            items.append(item)
+            if len(items) >= max_entries:
+                return False
+            # Symlinked directories are listed but not followed
+            if is_dir and not ignored and depth < max_depth and not entry.is_symlink():
+                if not walk(Path(entry.path), depth + 1):
+                    return False
+        return True
+
+    complete = walk(target, 0)
+    return items, directories, not complete
+
+
+def list_directory(
+    workspace: Path,
+    path: str = "",
+    recursive: bool = False,
+    max_depth: int = 0,
+    hide_ignored: bool = False
+) -> dict:
+    """
+    Full (unpaginated) listing of a workspace directory, served from the cache
+    when nothing changed (blocking). Returns {"items", "etag", "truncated"}.
+    """
+    workspace = Path(workspace).resolve()
+    target = resolve_workspace_path(workspace, path)
+    if not target.is_dir():
+        raise WorkspacePathError(400, "Path is not a directory")
+
+    depth = max(0, min(max_depth, settings.file_listing_max_depth)) if recursive else 0
+    key = (str(workspace), str(target), depth, hide_ignored)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached is not None:
+        current = _current_mtimes(cached["directories"])
+        if current is not None and _signature(_generations.get(key[0], 0), current) == cached["etag"]:
+            return cached
+
+    generation = _generations.get(key[0], 0)
+    try:
+        items, directories, truncated = _scan(workspace, target, depth, hide_ignored, settings.file_listing_max_entries)
+    except PermissionError:
+        raise WorkspacePathError(403, "Permission denied")
+    listing = {
+        "items": items,
+        "directories": directories,
+        "etag": _signature(generation, directories),
+        "truncated": truncated
+    }
+
+    with _cache_lock:
+        _cache[key] = listing
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return listing
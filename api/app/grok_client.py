@@ -1,81 +1,215 @@
+import asyncio
+import hashlib
 import httpx
-import json
+import orjson
+import time
 from app.config import settings
+from app.model_router import message_chars
+from app.response_cache import response_cache, request_key
 
 BASE_URL = "https://api.x.ai/v1"
 
 
+def validate_message(msg, i=0):
+    """
+    Validate and sanitize one message in place before it is sent to the API.
+    Returns the message or raises ValueError.
+    """
+    if not isinstance(msg, dict):
+        raise ValueError(f"Message {i} is not a dict: {type(msg)}")
+
+    role = msg.get("role")
+    if role not in ["system", "user", "assistant", "tool"]:
+        raise ValueError(f"Message {i} has invalid role: {role}")
+
+    # Ensure content is a string (not None)
+    if "content" in msg:
+        if msg["content"] is None:
+            msg["content"] = ""
+        elif not isinstance(msg["content"], str):
+            msg["content"] = str(msg["content"])
+
+    # Validate assistant messages with tool calls
+    if role == "assistant" and msg.get("tool_calls"):
+        # Content must be present (can be empty string)
+        if "content" not in msg:
+            msg["content"] = ""
+
+    # Validate tool messages
+    if role == "tool":
+        if "tool_call_id" not in msg:
+            raise ValueError(f"Tool message {i} missing tool_call_id")
+        if "content" not in msg or not msg["content"]:
+            msg["content"] = "(no output)"
+
+    return msg
+
+
 def validate_messages(messages):
     """
     Validate and sanitize messages before sending to API.
     Returns cleaned messages or raises ValueError.
     """
-    cleaned = []
-    for i, msg in enumerate(messages):
-        if not isinstance(msg, dict):
-            raise ValueError(f"Message {i} is not a dict: {type(msg)}")
-
-        role = msg.get("role")
-        if role not in ["system", "user", "assistant", "tool"]:
-            raise ValueError(f"Message {i} has invalid role: {role}")
-
-        # Ensure content is a string (not None)
-        if "content" in msg:
-            if msg["content"] is None:
-                msg["content"] = ""
-            elif not isinstance(msg["content"], str):
-                msg["content"] = str(msg["content"])
-
-        # Validate assistant messages with tool calls
-        if role == "assistant" and msg.get("tool_calls"):
-            # Content must be present (can be empty string)
-            if "content" not in msg:
-                msg["content"] = ""
-
-        # Validate tool messages
-        if role == "tool":
-            if "tool_call_id" not in msg:
-                raise ValueError(f"Tool message {i} missing tool_call_id")
-            if "content" not in msg or not msg["content"]:
-                msg["content"] = "(no output)"
-
-        cleaned.append(msg)
-
-    return cleaned
-
-
-async def chat_completion(messages, tools=None, tool_choice="auto"):
-    # Validate and sanitize messages before sending
-    try:
-        messages = validate_messages(messages)
-    except ValueError as e:
-        print(f"⚠️  Message validation error: {e}")
-        raise
+    return [validate_message(msg, i) for i, msg in enumerate(messages)]
 
-    async with httpx.AsyncClient() as client:
-        payload = {
-            "model": settings.grok_model,
-            "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": 4096,
+
+class Conversation:
+    """
+    The message list of an agent run, prepared for repeated API requests.
+
+    Each message is validated and serialized once, when it is added; request
+    bodies are assembled from the cached JSON fragments, so the per-call cost
+    no longer grows with a re-walk and re-encode of the whole history.
+    Wraps the given list in place (callers keep partial progress), so
+    messages must only be added through the conversation and not modified
+    afterwards.
+    """
+
+    def __init__(self, messages=None):
+        self.messages = messages if messages is not None else []
+        for i, msg in enumerate(self.messages):
+            validate_message(msg, i)
+        self._fragments = [orjson.dumps(msg) for msg in self.messages]
+        self._chars = sum(message_chars(msg) for msg in self.messages)
+        self._digests = []  # Key-sorted message hashes, computed on demand (response cache)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, msg):
+        validate_message(msg, len(self.messages))
+        fragment = orjson.dumps(msg)
+        self.messages.append(msg)
+        self._fragments.append(fragment)
+        self._chars += message_chars(msg)
+
+    def set_system(self, content):
+        """Insert the system prompt, or replace it if the conversation already starts with one"""
+        msg = {"role": "system", "content": content}
+        if self.messages and self.messages[0].get("role") == "system":
+            self._chars -= message_chars(self.messages[0])
+            self.messages[0] = msg
+            self._fragments[0] = orjson.dumps(msg)
+        else:
+            self.messages.insert(0, msg)
+            self._fragments.insert(0, orjson.dumps(msg))
+        self._chars += message_chars(msg)
+        self._digests.clear()
+
+    def context_tokens(self):
+        """Same estimate as model_router.estimate_context_tokens, kept up to date incrementally"""
+        return self._chars // 4
+
+    def digest(self):
+        """Hash of the messages that doesn't depend on their key order"""
+        for msg in self.messages[len(self._digests):]:
+            self._digests.append(hashlib.sha256(orjson.dumps(msg, option=orjson.OPT_SORT_KEYS)).digest())
+        return hashlib.sha256(b"".join(self._digests)).hexdigest()
+
+    def request_body(self, params):
+        """JSON request body: the request params plus the cached message fragments"""
+        head = orjson.dumps(params)
+        return b"".join((head[:-1], b',"messages":[' if params else b'"messages":[', b",".join(self._fragments), b"]}"))
+
+
+# Statuses that mean "this model can't serve the request right now" - try the next fallback
+FALLBACK_STATUS_CODES = {429, 503}
+
+
+async def chat_completion(
+    messages,
+    tools=None,
+    tool_choice="auto",
+    model=None,
+    temperature=None,
+    max_tokens=None,
+    fallbacks=None,
+    cassette=None,
+    cache=None
+):
+    # A plain message list is validated and encoded as a whole; agent runs pass
+    # a Conversation, whose messages were already validated and encoded once
+    if not isinstance(messages, Conversation):
+        try:
+            messages = Conversation(list(messages))
+        except ValueError as e:
+            print(f"⚠️  Message validation error: {e}")
+            raise
+
+    candidates = [model or settings.grok_model] + list(fallbacks or [])
+
+    def build_params(candidate):
+        params = {
+            "model": candidate,
+            "temperature": settings.default_temperature if temperature is None else temperature,
+            "max_tokens": max_tokens or settings.default_max_tokens,
         }
         if tools:
-            payload["tools"] = tools
-            payload["tool_choice"] = tool_choice
-
-        response = await client.post(
-            f"{BASE_URL}/chat/completions",
-            headers={"Authorization": f"Bearer {settings.grok_api_key}"},
-            json=payload,
-            timeout=120.0,
-        )
-
-        # If request fails, log the error details before raising
-        if response.status_code != 200:
-            error_body = response.text
-            print(f"❌ Grok API Error {response.status_code}")
-            print(f"Response body: {error_body}")
-            print(f"Request payload (last 3 messages): {payload['messages'][-3:]}")
-
-        response.raise_for_status()
-        return response.json()
\ No newline at end of file
+            params["tools"] = tools
+            params["tool_choice"] = tool_choice
+        return params
+
+    # Replay answers from the session's cassette without touching the network
+    if cassette is not None and cassette.replaying:
+        return await cassette.replay_llm({**build_params(candidates[0]), "messages": messages.messages})
+
+    # Deterministic requests can be answered from the response cache. cache=True
+    # allows it at any temperature, cache=False never uses it.
+    cache_key = None
+    requested = build_params(candidates[0])
+    if settings.response_cache_enabled and cache is not False and (cache or requested["temperature"] == 0):
+        cache_key = request_key(requested, messages.digest())
+        try:
+            cached = await asyncio.to_thread(response_cache.get, cache_key)
+        except OSError as e:
+            # e.g. the cache directory isn't ours - a cache failure is only a miss
+            print(f"⚠️  Could not read response cache: {e}")
+            cached = None
+        if cached is not None:
+            # Nothing was spent on this call - report no usage
+            cached.pop("usage", None)
+            cached["response_cache"] = "hit"
+            if cassette is not None and cassette.recording:
+                cassette.record_llm({**requested, "messages": messages.messages}, cached, 0)
+            return cached
+
+    async with httpx.AsyncClient() as client:
+        for attempt, candidate in enumerate(candidates):
+            params = build_params(candidate)
+
+            started = time.monotonic()
+            response = await client.post(
+                f"{BASE_URL}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {settings.grok_api_key}",
+                    "Content-Type": "application/json"
+                },
+                content=messages.request_body(params),
+                timeout=120.0,
+            )
+
+            is_last = attempt == len(candidates) - 1
+            if response.status_code in FALLBACK_STATUS_CODES and not is_last:
+                print(f"⚠️  Model {candidate} unavailable ({response.status_code}), falling back to {candidates[attempt + 1]}")
+                continue
+
+            # If request fails, log the error details before raising
+            if response.status_code != 200:
+                error_body = response.text
+                print(f"❌ Grok API Error {response.status_code}")
+                print(f"Response body: {error_body}")
+                print(f"Request payload (last 3 messages): {messages.messages[-3:]}")
+
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+            # Report which configured model actually served the request (for pricing)
+            data["routed_model"] = candidate
+            # Only answers of the requested model stand in for it later
+            if cache_key is not None and attempt == 0:
+                try:
+                    await asyncio.to_thread(response_cache.put, cache_key, data)
+                except OSError as e:
+                    print(f"⚠️  Could not store response in cache: {e}")
+            if cassette is not None and cassette.recording:
+                cassette.record_llm({**params, "messages": messages.messages}, data, int((time.monotonic() - started) * 1000))
+            return data
@@ -3,7 +3,7 @@ Database initialization script
 Run this to create all tables in the database
 """
 from app.database import engine, Base
-from app.db_models import Session, Message, ToolCall, FileChange, TokenUsage, User
+from app.db_models import Session, Message, ToolCall, FileChange, TokenUsage, User, Job, JobEvent, LLMCall, UsageRollup
 
 def init_db():
     """Create all database tables"""
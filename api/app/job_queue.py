@@ -0,0 +1,427 @@
+"""
+Headless job queue for batch agent runs.
+
+Jobs are rows in the database (Postgres or SQLite - whatever DATABASE_URL
+points at), so they survive restarts and can be shared by several worker
+processes. Workers claim the highest-priority queued job with a conditional
+UPDATE, run it with run_agent, and persist its events, result and cost. A
+running job's worker heartbeats; jobs whose heartbeat goes stale (e.g. the
+worker process died) are put back in the queue.
+
+Workers run inside the API process (JOB_WORKERS) and/or as separate
+processes via `python -m app.job_worker`.
+"""
+import asyncio
+import os
+import socket
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.agent_loop import run_agent
+from app.config import settings
+from app.models import to_event_payload
+from app.profiler import session_context
+from app.tools.shell_pool import shell_pool
+
+FINISHED_STATUSES = {"succeeded", "failed", "cancelled"}
+
+# Superseded immediately by the next event - not worth a row each
+UNPERSISTED_EVENT_TYPES = {"thinking"}
+
+EVENT_FLUSH_SECONDS = 0.5
+EVENT_FLUSH_SIZE = 50
+
+# Longest wait between polls while the queue can't be reached
+JOB_POLL_MAX_BACKOFF_SECONDS = 300
+
+# Wakes idle in-process workers as soon as a job is enqueued
+_job_available = asyncio.Event()
+
+
+def _serialize_job(job) -> dict:
+    return {
+        "id": job.id,
+        "prompt": job.prompt,
+        "workspace": job.workspace,
+        "agent_type": job.agent_type,
+        "priority": job.priority,
+        "status": job.status,
+        "cancel_requested": job.cancel_requested,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error,
+        "token_usage": {
+            "input_tokens": job.input_tokens,
+            "output_tokens": job.output_tokens,
+            "total_tokens": job.input_tokens + job.output_tokens,
+            "estimated_cost": job.estimated_cost
+        },
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+# --- Blocking database helpers (call through asyncio.to_thread) ---
+
+def enqueue_job(prompt: str, workspace: str, agent_type: str, priority: int) -> dict:
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        job = Job(
+            id=str(uuid.uuid4()),
+            prompt=prompt,
+            workspace=workspace,
+            agent_type=agent_type,
+            priority=priority,
+            status="queued"
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return _serialize_job(job)
+    finally:
+        db.close()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        return _serialize_job(job) if job else None
+    finally:
+        db.close()
+
+
+def list_jobs(status: Optional[str] = None, limit: int = 50) -> list[dict]:
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        query = db.query(Job)
+        if status:
+            query = query.filter(Job.status == status)
+        jobs = query.order_by(Job.created_at.desc()).limit(limit).all()
+        return [_serialize_job(job) for job in jobs]
+    finally:
+        db.close()
+
+
+def get_job_events(job_id: str, after: int = 0, limit: int = 500) -> list[dict]:
+    """Events of a job after a sequence number, oldest first"""
+    from app.database import SessionLocal
+    from app.db_models import JobEvent
+
+    db = SessionLocal()
+    try:
+        events = (
+            db.query(JobEvent)
+            .filter(JobEvent.job_id == job_id, JobEvent.id > after)
+            .order_by(JobEvent.id)
+            .limit(limit)
+            .all()
+        )
+        return [{"seq": event.id, **event.payload} for event in events]
+    finally:
+        db.close()
+
+
+def request_cancel(job_id: str) -> Optional[dict]:
+    """Cancel a queued job right away, or ask the worker of a running one to stop"""
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job is None:
+            return None
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+        elif job.status == "running":
+            job.cancel_requested = True
+        db.commit()
+        db.refresh(job)
+        return _serialize_job(job)
+    finally:
+        db.close()
+
+
+def claim_next_job(worker_id: str) -> Optional[dict]:
+    """
+    Atomically take the highest-priority queued job. The conditional UPDATE
+    makes this safe with any number of competing worker processes.
+    """
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        for _ in range(5):
+            candidate = (
+                db.query(Job.id)
+                .filter(Job.status == "queued")
+                .order_by(Job.priority.desc(), Job.created_at, Job.id)
+                .first()
+            )
+            if candidate is None:
+                return None
+
+            now = datetime.utcnow()
+            claimed = (
+                db.query(Job)
+                .filter(Job.id == candidate.id, Job.status == "queued")
+                .update({
+                    Job.status: "running",
+                    Job.worker_id: worker_id,
+                    Job.started_at: now,
+                    Job.heartbeat_at: now,
+                    Job.attempts: Job.attempts + 1
+                }, synchronize_session=False)
+            )
+            db.commit()
+            if claimed:
+                return _serialize_job(db.query(Job).filter(Job.id == candidate.id).first())
+            # Another worker won the race - try the next job
+        return None
+    finally:
+        db.close()
+
+
+def heartbeat(job_id: str, worker_id: str) -> bool:
+    """Refresh a running job's heartbeat. Returns True if cancellation was requested."""
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id, Job.worker_id == worker_id).update(
+            {Job.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        job = db.query(Job.cancel_requested).filter(Job.id == job_id).first()
+        return bool(job and job.cancel_requested)
+    finally:
+        db.close()
+
+
+def requeue_stale_jobs() -> int:
+    """Put running jobs whose worker stopped heartbeating back in the queue"""
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.job_stale_seconds)
+        stale = db.query(Job).filter(Job.status == "running", Job.heartbeat_at < cutoff)
+        requeued = 0
+        for job in stale.all():
+            if job.cancel_requested or job.attempts >= settings.job_max_attempts:
+                job.status = "cancelled" if job.cancel_requested else "failed"
+                job.error = job.error or "Worker stopped responding"
+                job.finished_at = datetime.utcnow()
+            else:
+                job.status = "queued"
+                job.worker_id = None
+                requeued += 1
+        db.commit()
+        return requeued
+    finally:
+        db.close()
+
+
+def requeue_job(job_id: str, worker_id: str) -> None:
+    """Hand a job back to the queue (its worker is shutting down)"""
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id, Job.worker_id == worker_id, Job.status == "running").update(
+            {Job.status: "queued", Job.worker_id: None}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def record_events(job_id: str, events: list[dict], usage: Optional[dict]) -> None:
+    from app.database import SessionLocal
+    from app.db_models import Job, JobEvent
+
+    db = SessionLocal()
+    try:
+        db.add_all(JobEvent(job_id=job_id, event_type=e["type"], payload=e) for e in events)
+        if usage is not None:
+            db.query(Job).filter(Job.id == job_id).update({
+                Job.input_tokens: usage["input_tokens"],
+                Job.output_tokens: usage["output_tokens"],
+                Job.estimated_cost: usage["estimated_cost"]
+            }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def finish_job(job_id: str, status: str, result: Optional[str], error: Optional[str]) -> None:
+    from app.database import SessionLocal
+    from app.db_models import Job
+
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id).update({
+            Job.status: status,
+            Job.result: result,
+            Job.error: error,
+            Job.finished_at: datetime.utcnow()
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def notify_job_enqueued() -> None:
+    _job_available.set()
+
+
+# --- Workers ---
+
+class JobWorker:
+    """Runs queued jobs one at a time"""
+
+    def __init__(self, name: str):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{name}"
+
+    async def run_forever(self) -> None:
+        failures = 0
+        while True:
+            try:
+                job = await asyncio.to_thread(claim_next_job, self.worker_id)
+            except Exception as e:
+                # Back off exponentially while the database is unreachable
+                failures += 1
+                delay = min(JOB_POLL_MAX_BACKOFF_SECONDS, settings.job_poll_interval_seconds * 2 ** (failures - 1))
+                print(f"⚠️  Job worker {self.worker_id} could not poll the queue: {e} (retrying in {delay:g}s)")
+                await asyncio.sleep(delay)
+                continue
+            if failures:
+                print(f"Job worker {self.worker_id} reconnected to the queue after {failures} failed poll(s)")
+                failures = 0
+
+            if job is None:
+                _job_available.clear()
+                try:
+                    await asyncio.wait_for(_job_available.wait(), timeout=settings.job_poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.run_job(job)
+
+    async def run_job(self, job: dict) -> None:
+        job_id = job["id"]
+        print(f"Job {job_id} started on {self.worker_id} (priority {job['priority']})")
+        cancel_requested = False
+        run = asyncio.create_task(self._drive(job), context=session_context(f"job-{job_id}"))
+
+        async def watch():
+            nonlocal cancel_requested
+            while not run.done():
+                await asyncio.sleep(settings.job_heartbeat_seconds)
+                try:
+                    if await asyncio.to_thread(heartbeat, job_id, self.worker_id):
+                        cancel_requested = True
+                        run.cancel()
+                except Exception as e:
+                    print(f"⚠️  Job {job_id} heartbeat failed: {e}")
+
+        watcher = asyncio.create_task(watch())
+        try:
+            result, error = await run
+            status = "succeeded" if result is not None and error is None else "failed"
+        except asyncio.CancelledError:
+            if not cancel_requested:
+                # The worker itself is shutting down - let another worker pick the job up
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+                await asyncio.to_thread(requeue_job, job_id, self.worker_id)
+                raise
+            status, result, error = "cancelled", None, "Cancelled by request"
+        except Exception as e:
+            traceback.print_exc()
+            status, result, error = "failed", None, f"Agent loop error: {str(e)}"
+        finally:
+            watcher.cancel()
+            shell_pool.release(f"job-{job_id}")
+
+        await asyncio.to_thread(finish_job, job_id, status, result, error)
+        print(f"Job {job_id} {status}")
+
+    async def _drive(self, job: dict) -> tuple[Optional[str], Optional[str]]:
+        """Run the agent for a job. Returns (final answer, error)."""
+        job_id = job["id"]
+        buffer: list[dict] = []
+        usage: Optional[dict] = None
+        result: Optional[str] = None
+        error: Optional[str] = None
+        last_flush = time.monotonic()
+
+        async def flush():
+            nonlocal buffer, last_flush
+            events, buffer = buffer, []
+            last_flush = time.monotonic()
+            await asyncio.to_thread(record_events, job_id, events, usage)
+
+        try:
+            async for event_dict in run_agent(
+                user_message=job["prompt"],
+                workspace=job["workspace"],
+                history=[],
+                agent_type=job["agent_type"],
+                session_id=f"job-{job_id}"
+            ):
+                payload = to_event_payload(event_dict)
+                if payload["type"] == "token_usage":
+                    usage = payload
+                elif payload["type"] == "assistant":
+                    result = payload["content"]
+                elif payload["type"] == "error":
+                    error = payload["content"]
+
+                if payload["type"] not in UNPERSISTED_EVENT_TYPES:
+                    buffer.append(payload)
+                if len(buffer) >= EVENT_FLUSH_SIZE or time.monotonic() - last_flush >= EVENT_FLUSH_SECONDS:
+                    await flush()
+        finally:
+            # Persist whatever the run produced, even if it was cancelled or crashed
+            if buffer or usage is not None:
+                await asyncio.shield(flush())
+
+        return result, error
+
+
+async def run_job_workers(count: int) -> None:
+    """Run a pool of job workers plus the stale-job sweeper (until cancelled)"""
+    async def sweep():
+        while True:
+            try:
+                requeued = await asyncio.to_thread(requeue_stale_jobs)
+                if requeued:
+                    print(f"Requeued {requeued} job(s) from unresponsive workers")
+                    notify_job_enqueued()
+            except Exception as e:
+                print(f"⚠️  Could not sweep stale jobs: {e}")
+            await asyncio.sleep(settings.job_stale_seconds / 2)
+
+    workers = [JobWorker(f"w{i}") for i in range(count)]
+    await asyncio.gather(sweep(), *(worker.run_forever() for worker in workers))
@@ -0,0 +1,36 @@
+"""
+Standalone job worker process.
+
+Runs queued /jobs agent runs outside the API process - start as many of these
+as the node should handle, e.g.:
+
+    python -m app.job_worker --workers 4
+"""
+import argparse
+import asyncio
+
+from app.config import settings
+from app.job_queue import run_job_workers
+from app.tools.shell_pool import shell_pool
+
+
+async def main(workers: int) -> None:
+    reaper = asyncio.create_task(shell_pool.run_reaper())
+    try:
+        await run_job_workers(workers)
+    finally:
+        reaper.cancel()
+        await shell_pool.close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run agent jobs from the job queue")
+    parser.add_argument("--workers", type=int, default=max(1, settings.job_workers),
+                        help="Number of jobs to run concurrently")
+    args = parser.parse_args()
+
+    print(f"Starting {args.workers} job worker(s)")
+    try:
+        asyncio.run(main(args.workers))
+    except KeyboardInterrupt:
+        pass
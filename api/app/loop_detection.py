@@ -0,0 +1,145 @@
+"""
+Loop and stall detection for agent runs.
+
+Every tool call is fingerprinted by its name and arguments, and every result
+by its content. An iteration makes progress when it learns something new:
+a call it hasn't made before, or a known call whose result changed (the
+workspace moved on). Three patterns count as stuck:
+
+- repetition: the same call returned the same result LOOP_REPEAT_THRESHOLD times
+- oscillation: a file is written back to the content it had two writes ago
+- stall: LOOP_STALL_ITERATIONS iterations in a row without progress
+
+The agent loop escalates on detection: first a corrective hint is added to
+the conversation, then (after LOOP_MAX_HINTS hints) the model is made to
+summarize and stop. Productive iterations also earn the run more budget,
+up to its agent type's ceiling (AGENT_ITERATION_LIMITS), so a stuck run
+stops early while a productive one isn't cut off at a fixed count.
+"""
+import hashlib
+import json
+import re
+from collections import Counter
+from typing import Optional
+
+from app.config import settings
+
+# The resource line execute_bash appends to every result (format_usage) -
+# timings differ on every run, so it would make every repeat look new
+USAGE_LINE = re.compile(r"\n*\[resources: [^\]\n]*\]\s*$")
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8", "replace")).hexdigest()[:16]
+
+
+def call_fingerprint(tool_name: str, arguments: dict) -> str:
+    return _digest(tool_name + "\0" + json.dumps(arguments, sort_keys=True, default=str))
+
+
+def iteration_limits(agent_type: str) -> tuple[int, int]:
+    """(base, max) iterations of a run - agent types without limits use MAX_ITERATIONS"""
+    limits = settings.agent_iteration_limits.get(agent_type, {})
+    base = max(1, limits.get("base", settings.max_iterations))
+    return base, max(base, limits.get("max", base))
+
+
+def _written_files(tool_name: str, arguments: dict) -> list[tuple[str, str]]:
+    """(path, full new content) of the files a call writes"""
+    if tool_name == "write_file":
+        items = [arguments]
+    elif tool_name == "write_files":
+        items = [f for f in arguments.get("files") or [] if isinstance(f, dict) and f.get("action", "write") == "write"]
+    else:
+        return []
+    return [(item["path"], str(item.get("content", ""))) for item in items if isinstance(item.get("path"), str)]
+
+
+def _describe(tool_name: str, arguments: dict) -> str:
+    detail = arguments.get("command") or arguments.get("path") or arguments.get("query")
+    return f"{tool_name}({detail!r})" if isinstance(detail, str) else tool_name
+
+
+class LoopDetector:
+    """Fingerprints one run's tool calls and results across iterations"""
+
+    def __init__(self, agent_type: str):
+        self.base_limit, self.max_limit = iteration_limits(agent_type)
+        self.limit = self.base_limit
+        self.results: dict[str, str] = {}  # Call fingerprint → last result fingerprint
+        self.repeats: Counter = Counter()  # (call, result) fingerprint → occurrences
+        self.writes: dict[str, list[str]] = {}  # Path → content fingerprints of its writes
+        self.productive_iterations = 0
+        self.stalled_iterations = 0
+        self.hints = 0
+        self._progress = False
+        self._problems: list[str] = []
+
+    def observe(self, tool_name: str, arguments: dict, result: str) -> None:
+        """Record one tool call of the current iteration"""
+        call = call_fingerprint(tool_name, arguments)
+        outcome = _digest(USAGE_LINE.sub("", result))
+        if self.results.get(call) != outcome:
+            self._progress = True
+        self.results[call] = outcome
+
+        self.repeats[(call, outcome)] += 1
+        count = self.repeats[(call, outcome)]
+        if count == settings.loop_repeat_threshold or (
+            count > settings.loop_repeat_threshold and count % settings.loop_repeat_threshold == 0
+        ):
+            self._problems.append(
+                f"{_describe(tool_name, arguments)} was called {count} times with the same result"
+            )
+
+        for path, content in _written_files(tool_name, arguments):
+            history = self.writes.setdefault(path, [])
+            content = _digest(content)
+            if len(history) >= 2 and history[-2] == content and history[-1] != content:
+                self._problems.append(f"{path} is being rewritten back and forth between two versions")
+            history.append(content)
+
+    def end_iteration(self) -> Optional[str]:
+        """
+        Close an iteration that ran tools. Extends the budget after progress
+        and returns a description of the problem if the run looks stuck.
+        """
+        problems, self._problems = self._problems, []
+        if self._progress:
+            # Every productive iteration earns one more, up to the ceiling
+            self.productive_iterations += 1
+            self.limit = min(self.max_limit, self.base_limit + self.productive_iterations)
+            self.stalled_iterations = 0
+        else:
+            self.stalled_iterations += 1
+        self._progress = False
+
+        if settings.loop_stall_iterations and self.stalled_iterations >= settings.loop_stall_iterations:
+            problems.append(f"the last {self.stalled_iterations} iterations produced no new information")
+            self.stalled_iterations = 0
+        if not settings.loop_detection_enabled or not problems:
+            return None
+        return "; ".join(dict.fromkeys(problems))
+
+    def intervention(self, problem: str) -> tuple[dict, bool]:
+        """
+        The message to add to the conversation for a detected problem, and
+        whether the model must now summarize and stop (no more tool calls).
+        """
+        if self.hints < settings.loop_max_hints:
+            self.hints += 1
+            return {
+                "role": "system",
+                "content": (
+                    f"Loop detected: {problem}. Repeating the same steps will not give a different "
+                    "outcome. Use the results you already have, change your approach (different "
+                    "command, file or fix), or answer if the task is done."
+                )
+            }, False
+        return {
+            "role": "system",
+            "content": (
+                f"Loop detected again: {problem}. Stop calling tools. Summarize what you did, "
+                "what is still failing and what you would try next."
+            )
+        }, True
@@ -1,28 +1,26 @@
 # backend/app/main.py
 import uuid
 import asyncio
-from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Any
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from app.config import settings
-from app.grok_client import chat_completion
-from app.agent_loop import run_agent
-from app.models import (
-    WebsocketEvent,
-    StatusMessage,
-    ThinkingMessage,
-    AssistantMessage,
-    ToolCallMessage,
-    ToolResultMessage,
-    ErrorMessage,
-    TokenUsageMessage,
-    FileChangeMessage
+from app.models import StatusMessage, ErrorMessage
+from app.run_manager import run_manager, coalesce_events
+from app.session_cache import SessionCache, new_session_state
+from app.checkpoints import CheckpointStore, CheckpointError
+from app.file_listing import list_directory, resolve_workspace_path, WorkspacePathError, bump_workspace_generation
+from app import file_content
+from app.overlays import (
+    create_overlay, load_overlay, overlay_status, promote_overlay, merge_overlay, delete_overlay,
+    run_overlay_sweeper, OverlayError
 )
+from app.profiler import LoopWatchdog
+from app.tools.shell_pool import shell_pool
 from app.tools import get_all_tools  # Make sure this exists!
 
 app = FastAPI(
@@ -35,10 +33,38 @@ app = FastAPI(
 try:
     from app.routes.session_routes import router as session_router
     app.include_router(session_router)
+    session_routes_available = True
     print("✓ Session routes loaded successfully")
 except ImportError as e:
+    session_routes_available = False
     print(f"Warning: Session routes not available: {e}")
 
+# Usage analytics (per-call records and daily rollups)
+try:
+    from app.routes.analytics_routes import router as analytics_router
+    app.include_router(analytics_router)
+    print("✓ Analytics routes loaded successfully")
+except ImportError as e:
+    print(f"Warning: Analytics routes not available: {e}")
+
+# Headless job queue (needs the database as well)
+try:
+    from app.routes.job_routes import router as job_router
+    app.include_router(job_router)
+    job_queue_available = True
+    print("✓ Job routes loaded successfully")
+except ImportError as e:
+    job_queue_available = False
+    print(f"Warning: Job routes not available: {e}")
+
+# Admin diagnostics (profiling, event-loop stalls)
+try:
+    from app.routes.admin_routes import router as admin_router
+    app.include_router(admin_router)
+    print("✓ Admin routes loaded successfully")
+except ImportError as e:
+    print(f"Warning: Admin routes not available: {e}")
+
 # Authentication routes disabled
 # Uncomment below to re-enable authentication
 # try:
@@ -57,11 +83,68 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def start_background_sweepers():
+    app.state.session_sweeper = asyncio.create_task(
+        sessions.run_sweeper(settings.session_sweep_interval_seconds)
+    )
+    app.state.shell_reaper = asyncio.create_task(shell_pool.run_reaper())
+    app.state.loop_watchdog = None
+    if settings.slow_callback_ms > 0:
+        app.state.loop_watchdog = LoopWatchdog(settings.slow_callback_ms)
+        app.state.loop_watchdog.start()
+    app.state.archiver = None
+    if session_routes_available and settings.archive_after_days > 0:
+        from app.archival import run_archiver
+        # Sessions held in memory are in use - never archive those
+        app.state.archiver = asyncio.create_task(
+            run_archiver(lambda sid: sid in sessions, settings.archive_interval_seconds)
+        )
+    app.state.overlay_sweeper = None
+    if settings.workspace_overlay_idle_days > 0:
+        # Sessions held in memory or running may still use their overlay
+        app.state.overlay_sweeper = asyncio.create_task(
+            run_overlay_sweeper(lambda sid: sid in sessions or run_manager.is_active(sid), 3600)
+        )
+    app.state.job_workers = None
+    # The workers need the database layer, not just the routes
+    if job_queue_available and session_routes_available and settings.job_workers > 0:
+        from app.job_queue import run_job_workers
+        app.state.job_workers = asyncio.create_task(run_job_workers(settings.job_workers))
+
+
+@app.on_event("shutdown")
+async def shutdown_runs():
+    app.state.session_sweeper.cancel()
+    app.state.shell_reaper.cancel()
+    if app.state.loop_watchdog is not None:
+        app.state.loop_watchdog.stop()
+    if app.state.archiver is not None:
+        app.state.archiver.cancel()
+    if app.state.overlay_sweeper is not None:
+        app.state.overlay_sweeper.cancel()
+    if app.state.job_workers is not None:
+        # Running jobs are handed back to the queue
+        app.state.job_workers.cancel()
+        await asyncio.gather(app.state.job_workers, return_exceptions=True)
+    await run_manager.shutdown()
+    await shell_pool.close_all()
+
+
 # --- Models for HTTP requests ---
 class StartSessionRequest(BaseModel):
     initial_prompt: str | None = None
     workspace: str | None = None
     agent_type: str = "building"  # "planning" or "building"
+    overlay: bool | None = None  # Work in a copy-on-write view of the workspace (default: WORKSPACE_OVERLAYS)
+
+
+class OrchestrateRequest(BaseModel):
+    tasks: list[str] | None = None  # Default: the open items of the workspace's TODO.md
+
+
+class OverlaySyncRequest(BaseModel):
+    force: bool = False  # Resolve conflicts in favour of the side being copied
 
 
 class MessageRequest(BaseModel):
@@ -69,15 +152,14 @@ class MessageRequest(BaseModel):
     session_id: str
 
 
-# In-memory session storage (for development)
-# In production → redis / postgres + session expiration
-sessions: Dict[str, Dict[str, Any]] = {}  # session_id → {"history": list, "workspace": Path}
-
-# Session-level locks for state access (prevents race conditions on concurrent reads/writes)
-session_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
-
-# Workspace-level locks for file operations (prevents conflicts when multiple agents work on same workspace)
-workspace_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+# Bounded in-memory session cache - idle sessions are evicted and rehydrated
+# from the database on demand. Sessions with a running agent or connected
+# clients are never evicted.
+sessions = SessionCache(
+    max_sessions=settings.session_cache_size,
+    idle_ttl_seconds=settings.session_idle_ttl_seconds,
+    is_pinned=run_manager.is_active
+)
 
 
 @app.get("/health")
@@ -91,72 +173,288 @@ async def health_check():
 
 
 @app.get("/sessions/{session_id}/files")
-async def list_session_files(session_id: str, path: str = ""):
-    """List files in the session workspace"""
-    if session_id not in sessions:
+async def list_session_files(
+    request: Request,
+    session_id: str,
+    path: str = "",
+    recursive: bool = False,
+    depth: int | None = None,
+    hide_ignored: bool = False,
+    offset: int = 0,
+    limit: int = 500
+):
+    """
+    List files in the session workspace. With recursive=true, subdirectories
+    are included (pre-order, each item has a depth) down to `depth` levels.
+    Paginated with offset/limit; unchanged listings are answered with 304.
+    """
+    session = await sessions.load(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
     from pathlib import Path
 
-    workspace = Path(sessions[session_id]["workspace"]).resolve()
-    target = (workspace / path).resolve() if path else workspace
-
-    # Security: ensure path is within workspace
-    if not str(target).startswith(str(workspace)):
-        raise HTTPException(status_code=403, detail="Path outside workspace")
+    try:
+        listing = await asyncio.to_thread(
+            list_directory,
+            Path(session["workspace"]),
+            path,
+            recursive,
+            settings.file_listing_max_depth if depth is None else depth,
+            hide_ignored
+        )
+    except WorkspacePathError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    # The ETag covers the whole listing, so it is valid for every page
+    etag = f'"{listing["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    offset = max(0, offset)
+    limit = min(max(1, limit), 5000)
+    items = listing["items"]
+    page = items[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(items) else None
+    return JSONResponse({
+        "files": page,
+        "path": path,
+        "total": len(items),
+        "offset": offset,
+        "next_offset": next_offset,
+        "truncated": listing["truncated"]
+    }, headers=headers)
+
+
+@app.api_route("/sessions/{session_id}/files/content", methods=["GET", "HEAD"])
+async def get_session_file_content(request: Request, session_id: str, path: str, download: bool = False):
+    """
+    Raw contents of a workspace file. Supports Range requests, conditional
+    requests (ETag / Last-Modified) and gzip/brotli for text files.
+    """
+    session = await sessions.load(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
 
-    if not target.exists():
-        raise HTTPException(status_code=404, detail="Path not found")
+    from pathlib import Path
 
-    if not target.is_dir():
-        raise HTTPException(status_code=400, detail="Path is not a directory")
+    def inspect():
+        target = resolve_workspace_path(Path(session["workspace"]), path)
+        if not target.is_file():
+            raise WorkspacePathError(400, "Path is not a file")
+        return target, target.stat(), file_content.is_text_file(target)
 
     try:
-        items = []
-        for item in sorted(target.iterdir()):
-            try:
-                relative = item.relative_to(workspace)
-                is_dir = item.is_dir()
-
-                items.append({
-                    "name": item.name,
-                    "path": str(relative),
-                    "type": "directory" if is_dir else "file",
-                    "size": item.stat().st_size if not is_dir else None
-                })
-            except Exception:
-                continue
-
-        return {"files": items, "path": path}
+        target, stat, is_text = await asyncio.to_thread(inspect)
+    except WorkspacePathError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except PermissionError:
         raise HTTPException(status_code=403, detail="Permission denied")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+    # Ranges address the identity encoding; small files aren't worth compressing
+    encoding = None
+    if (
+        is_text
+        and "range" not in request.headers
+        and settings.file_content_compress_min_bytes <= stat.st_size <= settings.file_content_compress_max_mb * 1024 * 1024
+    ):
+        encoding = file_content.negotiate_encoding(request.headers.get("accept-encoding", ""))
+
+    etag = file_content.file_etag(stat, encoding)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": file_content.last_modified(stat),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    if file_content.is_not_modified(
+        request.headers.get("if-none-match"), request.headers.get("if-modified-since"), etag, stat
+    ):
+        return Response(status_code=304, headers=headers)
+
+    media_type = file_content.media_type_for(target, is_text)
+    filename = target.name if download else None
+    if encoding is not None:
+        variant = await asyncio.to_thread(file_content.compressed_variant, target, stat, encoding)
+        if variant is not None:
+            headers["Content-Encoding"] = encoding
+            headers["Accept-Ranges"] = "none"
+            return FileResponse(variant, headers=headers, media_type=media_type, filename=filename)
+        # Changed while compressing - fall back to the identity encoding of the new content
+        stat = await asyncio.to_thread(target.stat)
+        headers.update({"ETag": file_content.file_etag(stat), "Last-Modified": file_content.last_modified(stat)})
+
+    return FileResponse(target, headers=headers, media_type=media_type, filename=filename, stat_result=stat)
 
 
 @app.get("/sessions/{session_id}/changes")
 async def get_session_changes(session_id: str):
     """Get file changes for a session"""
-    async with session_locks[session_id]:
-        if session_id not in sessions:
-            raise HTTPException(status_code=404, detail="Session not found")
+    session = await sessions.load(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
 
-        return {"changes": sessions[session_id].get("changes", [])}
+    async with sessions.lock(session_id):
+        return {"changes": session.get("changes", [])}
 
 
 @app.post("/sessions/{session_id}/changes")
 async def add_session_change(session_id: str, change: dict):
     """Add a file change to the session (called by tools)"""
-    async with session_locks[session_id]:
-        if session_id not in sessions:
-            raise HTTPException(status_code=404, detail="Session not found")
+    session = await sessions.load(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
 
+    async with sessions.lock(session_id):
         change["timestamp"] = datetime.utcnow().isoformat()
-        sessions[session_id]["changes"].append(change)
+        session["changes"].append(change)
 
         return {"success": True}
 
 
+@app.post("/sessions/{session_id}/orchestrate")
+async def orchestrate_session(session_id: str, req: OrchestrateRequest | None = None):
+    """Fan the plan's open TODO items out to parallel building agents (progress streams over the WebSocket)"""
+    session = await sessions.load(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    try:
+        run_manager.start_orchestration(session_id, session, req.tasks if req else None)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"session_id": session_id, "started": True}
+
+
+@app.post("/sessions/{session_id}/cancel")
+async def cancel_session_run(session_id: str):
+    """Cancel the in-flight agent run of a session"""
+    if session_id not in sessions and not run_manager.is_running(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    cancelled = await run_manager.cancel(session_id)
+    return {"session_id": session_id, "cancelled": cancelled}
+
+
+async def _session_checkpoints(session_id: str) -> CheckpointStore:
+    session = await sessions.load(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    from pathlib import Path
+    try:
+        return CheckpointStore(Path(session["workspace"]))
+    except CheckpointError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/sessions/{session_id}/checkpoints")
+async def list_checkpoints(session_id: str):
+    """List workspace checkpoints of a session, newest first"""
+    store = await _session_checkpoints(session_id)
+    try:
+        checkpoints = await asyncio.to_thread(store.list_checkpoints, session_id)
+    except CheckpointError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"checkpoints": checkpoints}
+
+
+@app.get("/sessions/{session_id}/checkpoints/{checkpoint_id}/diff")
+async def diff_checkpoint(session_id: str, checkpoint_id: str, against: str | None = None):
+    """Diff a checkpoint against another checkpoint, or against the current workspace"""
+    store = await _session_checkpoints(session_id)
+    try:
+        return await asyncio.to_thread(store.diff, session_id, checkpoint_id, against)
+    except CheckpointError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/sessions/{session_id}/checkpoints/{checkpoint_id}/restore")
+async def restore_checkpoint(session_id: str, checkpoint_id: str):
+    """Reset the session workspace to a checkpoint"""
+    store = await _session_checkpoints(session_id)
+    if run_manager.is_running(session_id):
+        raise HTTPException(status_code=409, detail="Agent run in progress - cancel it first")
+    try:
+        result = await asyncio.to_thread(store.restore, session_id, checkpoint_id)
+    except CheckpointError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    bump_workspace_generation(store.workspace)
+    return result
+
+
+async def _sync_overlay(session_id: str, operation, force: bool, target: str) -> dict:
+    """Run a promote/merge while no agent is writing the overlay and no other sync touches the base"""
+    if await sessions.load(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if run_manager.is_running(session_id):
+        raise HTTPException(status_code=409, detail="Agent run in progress - cancel it first")
+    try:
+        meta = await asyncio.to_thread(load_overlay, session_id)
+        if meta is None:
+            raise OverlayError(404, "Session has no workspace overlay")
+        async with sessions.workspace_lock(meta["base"]):
+            result = await asyncio.to_thread(operation, session_id, force)
+    except OverlayError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Overlay sync failed: {e}")
+    from pathlib import Path
+    bump_workspace_generation(Path(meta[target]))
+    return result
+
+
+@app.get("/sessions/{session_id}/overlay")
+async def get_overlay_status(session_id: str):
+    """Files changed in the session's overlay and in its base workspace, and the conflicts between them"""
+    if await sessions.load(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    try:
+        return await asyncio.to_thread(overlay_status, session_id)
+    except OverlayError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Could not read overlay: {e}")
+
+
+@app.post("/sessions/{session_id}/overlay/promote")
+async def promote_session_overlay(session_id: str, req: OverlaySyncRequest | None = None):
+    """Land the overlay's changes in the base workspace (409 with the conflicting files, nothing applied)"""
+    result = await _sync_overlay(session_id, promote_overlay, bool(req and req.force), "base")
+    if result["conflicts"]:
+        return JSONResponse(status_code=409, content=result)
+    return result
+
+
+@app.post("/sessions/{session_id}/overlay/merge")
+async def merge_session_overlay(session_id: str, req: OverlaySyncRequest | None = None):
+    """Bring the base workspace's changes into the overlay (conflicting files keep the overlay's version)"""
+    return await _sync_overlay(session_id, merge_overlay, bool(req and req.force), "workspace")
+
+
+@app.delete("/sessions/{session_id}/overlay")
+async def delete_session_overlay(session_id: str):
+    """Remove the session's overlay, discarding anything not promoted yet"""
+    if await sessions.load(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if run_manager.is_running(session_id):
+        raise HTTPException(status_code=409, detail="Agent run in progress - cancel it first")
+    try:
+        meta = await asyncio.to_thread(load_overlay, session_id)
+        if meta is None:
+            raise OverlayError(404, "Session has no workspace overlay")
+        async with sessions.workspace_lock(meta["base"]):
+            result = await asyncio.to_thread(delete_overlay, session_id)
+    except OverlayError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Could not remove overlay: {e}")
+    # Its shell and cached state still point into the removed directory
+    shell_pool.release(session_id)
+    sessions.evict(session_id)
+    return result
+
+
 @app.post("/sessions")
 async def create_session(req: StartSessionRequest):
     session_id = str(uuid.uuid4())
@@ -169,54 +467,26 @@ async def create_session(req: StartSessionRequest):
     # Validate agent_type
     agent_type = req.agent_type if req.agent_type in ["planning", "building"] else "building"
 
-    sessions[session_id] = {
-        "history": [],
-        "workspace": workspace,
-        "agent_type": agent_type,
-        "changes": [],  # Track file changes
-        "token_usage": {"input_tokens": 0, "output_tokens": 0, "estimated_cost": 0.0},  # Cumulative token usage
-        "created_at": datetime.utcnow().isoformat()
-    }
-
-    return {
-        "session_id": session_id,
-        "workspace": workspace,
-        "agent_type": agent_type,
-        "message": "Session created successfully"
-    }
-
-
-@app.post("/sessions/{session_id}/resume")
-async def resume_session(
-    session_id: str,
-    workspace: str,
-    agent_type: str,
-    input_tokens: int = 0,
-    output_tokens: int = 0,
-    estimated_cost: float = 0.0
-):
-    """Resume an existing session (for WebSocket to work)"""
-    from pathlib import Path
-    Path(workspace).mkdir(parents=True, exist_ok=True)
+    # Concurrent sessions on one workspace each get their own view of it
+    overlay = None
+    if req.overlay if req.overlay is not None else settings.workspace_overlays:
+        try:
+            overlay = await asyncio.to_thread(create_overlay, session_id, Path(workspace))
+        except OverlayError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except OSError as e:
+            raise HTTPException(status_code=500, detail=f"Could not create workspace overlay: {e}")
+        workspace = overlay["workspace"]
 
-    sessions[session_id] = {
-        "history": [],
-        "workspace": workspace,
-        "agent_type": agent_type,
-        "changes": [],
-        "token_usage": {
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "estimated_cost": estimated_cost
-        },
-        "created_at": datetime.utcnow().isoformat()
-    }
+    sessions[session_id] = new_session_state(workspace=workspace, agent_type=agent_type)
 
     return {
         "session_id": session_id,
         "workspace": workspace,
+        "base_workspace": overlay["base"] if overlay else None,
+        "overlay_mode": overlay["mode"] if overlay else None,
         "agent_type": agent_type,
-        "message": "Session resumed successfully"
+        "message": "Session created successfully"
     }
 
 
@@ -224,7 +494,9 @@ async def resume_session(
 async def agent_websocket(websocket: WebSocket, session_id: str):
     await websocket.accept()
 
-    if session_id not in sessions:
+    # Rehydrates the session from the database if it was evicted or never cached
+    session = await sessions.load(session_id)
+    if session is None:
         await websocket.send_json(ErrorMessage(
             type="error",
             content="Session not found. Please create a new session first.",
@@ -233,90 +505,60 @@ async def agent_websocket(websocket: WebSocket, session_id: str):
         await websocket.close()
         return
 
-    session = sessions[session_id]
-    history = session["history"]
-    workspace = session["workspace"]
-    agent_type = session.get("agent_type", "building")
+    # The WebSocket is just a subscriber - the run itself lives in the run manager
+    subscriber = run_manager.subscribe(session_id)
+    if run_manager.is_running(session_id):
+        await websocket.send_json(StatusMessage(
+            content="Agent run in progress - streaming live events",
+            done=False
+        ).model_dump())
 
-    try:
+    async def receive_loop():
         while True:
             data = await websocket.receive_json()
+
+            if data.get("type") == "cancel":
+                if not await run_manager.cancel(session_id):
+                    subscriber.push(StatusMessage(content="No agent run in progress", done=True).model_dump())
+                continue
+
+            if data.get("type") == "orchestrate":
+                try:
+                    run_manager.start_orchestration(session_id, session, data.get("tasks"))
+                except RuntimeError as e:
+                    subscriber.push(ErrorMessage(content=str(e), fatal=False).model_dump())
+                continue
+
             user_message = data.get("message", "").strip()
 
             if not user_message:
                 continue
 
-            # Send immediate feedback
-            await websocket.send_json(ThinkingMessage().model_dump())
-            await websocket.send_json(StatusMessage(
-                content=f"Processing your request...",
-                done=False
-            ).model_dump())
-
             try:
-                # Run the full agent loop with streaming
-                async for event_dict in run_agent(
-                    user_message=user_message,
-                    workspace=workspace,
-                    history=history.copy(),  # shallow copy - we append in place later
-                    agent_type=agent_type,
-                    cumulative_tokens=session.get("token_usage")
-                ):
-                    # Convert dict → proper model (for validation & serialization)
-                    if event_dict["type"] == "status":
-                        event = StatusMessage(**event_dict)
-                    elif event_dict["type"] == "thinking":
-                        event = ThinkingMessage(**event_dict)
-                    elif event_dict["type"] == "assistant":
-                        event = AssistantMessage(**event_dict)
-                    elif event_dict["type"] == "tool_call":
-                        event = ToolCallMessage(**event_dict)
-                    elif event_dict["type"] == "tool_result":
-                        event = ToolResultMessage(**event_dict)
-                    elif event_dict["type"] == "error":
-                        event = ErrorMessage(**event_dict)
-                    elif event_dict["type"] == "token_usage":
-                        event = TokenUsageMessage(**event_dict)
-                    elif event_dict["type"] == "file_change":
-                        event = FileChangeMessage(**event_dict)
-                    else:
-                        event = StatusMessage(type="status", content=str(event_dict))
-
-                    # Send to frontend
-                    await websocket.send_json(event.model_dump())
-
-                    # Keep history updated (especially assistant messages & tool results)
-                    # if event.type in ("assistant", "tool_result"):
-                    #     history.append({
-                    #         "role": event.type,
-                    #         "content": event.content
-                    #     })
-
-                    # Track file changes
-                    if event.type == "file_change":
-                        session["changes"].append(event.model_dump())
-
-                    # Update cumulative token usage in session
-                    if event.type == "token_usage":
-                        session["token_usage"] = {
-                            "input_tokens": event.input_tokens,
-                            "output_tokens": event.output_tokens,
-                            "estimated_cost": event.estimated_cost
-                        }
-
-            except Exception as e:
-                error_msg = f"Agent loop error: {str(e)}"
-                print(error_msg)  # server log
-                import traceback
-                traceback.print_exc()
-                try:
-                    await websocket.send_json(ErrorMessage(
-                        content=error_msg,
-                        fatal=False
-                    ).model_dump())
-                except:
-                    print(f"Could not send error message (connection may be closed)")
+                run_manager.start(session_id, session, user_message)
+            except RuntimeError as e:
+                subscriber.push(ErrorMessage(content=str(e), fatal=False).model_dump())
 
+    async def send_loop():
+        flush_interval = settings.ws_flush_interval_ms / 1000
+        while True:
+            event = await subscriber.get()
+            if event is None:
+                return
+            # The first event goes out right away; whatever arrives during the
+            # following tick is coalesced (latest token usage, last status...)
+            for pending in coalesce_events([event] + subscriber.drain()):
+                await websocket.send_json(pending)
+            if flush_interval > 0:
+                await asyncio.sleep(flush_interval)
+
+    receiver = asyncio.create_task(receive_loop())
+    sender = asyncio.create_task(send_loop())
+
+    try:
+        done, _ = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
     except WebSocketDisconnect:
         print(f"Client disconnected from session {session_id}")
     except Exception as e:
@@ -325,6 +567,11 @@ async def agent_websocket(websocket: WebSocket, session_id: str):
         traceback.print_exc()
         # Don't try to send error message - connection is likely closed
     finally:
+        # The agent run (if any) keeps going for other subscribers
+        run_manager.unsubscribe(session_id, subscriber)
+        for task in (receiver, sender):
+            task.cancel()
+        await asyncio.gather(receiver, sender, return_exceptions=True)
         try:
             await websocket.close()
         except:
@@ -338,5 +585,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        ws="websockets",
+        ws_per_message_deflate=settings.ws_per_message_deflate
     )
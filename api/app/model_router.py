@@ -0,0 +1,75 @@
+"""
+Model routing policy.
+
+Picks the model and sampling parameters for each LLM call based on the agent
+type, the role of the iteration and the size of the context. Routes are an
+ordered list of rules (MODEL_ROUTES, JSON) - the first matching rule wins,
+anything it doesn't set falls back to the defaults.
+
+Iteration roles:
+- "initial"        first call after a user message
+- "tool_followup"  a call that follows tool results
+- "final"          the last allowed iteration, where the model must answer
+"""
+from app.config import settings
+
+ROUTE_PARAMS = ("model", "temperature", "max_tokens")
+
+
+def message_chars(msg: dict) -> int:
+    """Characters of a message that count towards the prompt size"""
+    chars = len(msg.get("content") or "")
+    for tool_call in msg.get("tool_calls") or ():
+        chars += len(tool_call.get("function", {}).get("arguments") or "")
+    return chars
+
+
+def estimate_context_tokens(messages: list) -> int:
+    """Rough prompt size (~4 characters per token) used for context-size routing"""
+    return sum(message_chars(msg) for msg in messages) // 4
+
+
+def _matches(rule: dict, agent_type: str, role: str, context_tokens: int) -> bool:
+    if "agent_type" in rule and rule["agent_type"] != agent_type:
+        return False
+    if "role" in rule and rule["role"] != role:
+        return False
+    if context_tokens < rule.get("min_context_tokens", 0):
+        return False
+    if "max_context_tokens" in rule and context_tokens > rule["max_context_tokens"]:
+        return False
+    return True
+
+
+def route_model(agent_type: str, role: str, context_tokens: int) -> dict:
+    """
+    Resolve the request parameters for one LLM call.
+    Returns {"model", "temperature", "max_tokens", "fallbacks"}.
+    """
+    params = {
+        "model": settings.grok_model,
+        "temperature": settings.default_temperature,
+        "max_tokens": settings.default_max_tokens,
+    }
+
+    for rule in settings.model_routes:
+        if _matches(rule, agent_type, role, context_tokens):
+            params.update({key: rule[key] for key in ROUTE_PARAMS if key in rule})
+            break
+
+    fallbacks = list(settings.model_fallbacks.get(params["model"], []))
+    # Always end up on the configured main model if a routed model is unavailable
+    if params["model"] != settings.grok_model and settings.grok_model not in fallbacks:
+        fallbacks.append(settings.grok_model)
+    params["fallbacks"] = fallbacks
+
+    return params
+
+
+def model_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Cost in dollars of one call, using model-specific pricing when configured"""
+    pricing = settings.model_pricing.get(model, {})
+    input_price = pricing.get("input", settings.input_price)
+    output_price = pricing.get("output", settings.output_price)
+    # Prices are per million tokens
+    return (input_tokens / 1_000_000) * input_price + (output_tokens / 1_000_000) * output_price
@@ -6,6 +6,7 @@ class AgentMessage(BaseModel):
     """Base class for all messages/events sent over websocket"""
     type: str = Field(..., description="Type of the event/message")
     timestamp: Optional[str] = None
+    source: Optional[str] = None  # Subtask that produced the event (orchestrated runs)
 
 
 class StatusMessage(AgentMessage):
@@ -37,6 +38,7 @@ class ToolResultMessage(AgentMessage):
     content: str
     success: bool = True
     error: Optional[str] = None
+    resource_usage: Optional[dict[str, Any]] = None  # cpu_seconds, peak_rss_mb, wall_ms (execute_bash)
 
 
 class ErrorMessage(AgentMessage):
@@ -51,6 +53,7 @@ class TokenUsageMessage(AgentMessage):
     output_tokens: int
     total_tokens: int
     estimated_cost: float
+    model: Optional[str] = None  # Model that served the last call
 
 
 class FileChangeMessage(AgentMessage):
@@ -62,6 +65,36 @@ class FileChangeMessage(AgentMessage):
     content_after: Optional[str] = None  # File content after the change
 
 
+class FileChangeEntry(BaseModel):
+    action: str  # "create", "write" or "delete"
+    file_path: str
+    content_before: Optional[str] = None
+    content_after: Optional[str] = None
+
+
+class FileChangesMessage(AgentMessage):
+    """Several files changed by one tool call (e.g. an atomic write_files batch)"""
+    type: Literal["file_changes"] = "file_changes"
+    tool_name: str
+    changes: list[FileChangeEntry]
+
+
+class CancelledMessage(AgentMessage):
+    type: Literal["cancelled"] = "cancelled"
+    content: str = "Agent run cancelled"
+
+
+class SubtaskMessage(AgentMessage):
+    type: Literal["subtask"] = "subtask"
+    task_id: str
+    title: str
+    status: str  # "running", "merged", "conflict", "failed", "cancelled"
+    content: str
+    merged_files: list[str] = []
+    conflicts: list[str] = []
+    unmerged: list[str] = []  # Top-level ignored directories (node_modules/, build/, ...) changed but not merged
+
+
 # Union of all possible websocket messages
 WebsocketEvent = (
     StatusMessage
@@ -72,4 +105,45 @@ WebsocketEvent = (
     | ErrorMessage
     | TokenUsageMessage
     | FileChangeMessage
-)
\ No newline at end of file
+    | FileChangesMessage
+    | CancelledMessage
+    | SubtaskMessage
+)
+
+
+# Event type → model used to validate and serialize events yielded by run_agent
+EVENT_MODELS: dict[str, type[AgentMessage]] = {
+    "status": StatusMessage,
+    "thinking": ThinkingMessage,
+    "assistant": AssistantMessage,
+    "tool_call": ToolCallMessage,
+    "tool_result": ToolResultMessage,
+    "error": ErrorMessage,
+    "token_usage": TokenUsageMessage,
+    "file_change": FileChangeMessage,
+    "file_changes": FileChangesMessage,
+    "cancelled": CancelledMessage,
+    "subtask": SubtaskMessage,
+}
+
+
+def to_event_payload(event_dict: dict) -> dict:
+    """Validate an event yielded by run_agent and serialize it for subscribers"""
+    model = EVENT_MODELS.get(event_dict["type"])
+    if model is not None:
+        event = model(**event_dict)
+    else:
+        event = StatusMessage(content=str(event_dict))
+    return event.model_dump()
+
+
+def expand_file_changes(payload: dict) -> list[dict]:
+    """Per-file file_change records of a file_change or file_changes payload (for the changes log)"""
+    if payload["type"] == "file_change":
+        return [payload]
+    if payload["type"] == "file_changes":
+        return [
+            FileChangeMessage(tool_name=payload["tool_name"], source=payload.get("source"), **change).model_dump()
+            for change in payload["changes"]
+        ]
+    return []
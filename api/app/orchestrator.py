@@ -0,0 +1,376 @@
+"""
+Orchestrator: fans a plan out to parallel building agents.
+
+Takes the open items of the planning agent's TODO.md (or an explicit task
+list), groups items that name the same files so they are handled by one
+agent, and runs each group as its own building-agent run in a scratch copy
+of the workspace. Runs execute concurrently (bounded by
+ORCHESTRATOR_MAX_PARALLEL), so a feature finishes in roughly the time of its
+longest subtask.
+
+As each subtask finishes, the files it changed are merged back into the
+session workspace. Files are owned by the first subtask that merges them; a
+later subtask touching the same file (or a file changed in the workspace
+meanwhile) is reported as a conflict and its scratch copy is kept for
+inspection. Events of every subtask are streamed to the session's
+subscribers, tagged with their source.
+"""
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from app.agent_loop import run_agent
+from app.checkpoints import create_checkpoint
+from app.config import settings
+from app.file_listing import bump_workspace_generation
+from app.models import SubtaskMessage, StatusMessage, AssistantMessage, ErrorMessage, TokenUsageMessage, to_event_payload, expand_file_changes
+from app.private_dirs import private_temp_dir
+from app.repo_map import IGNORE_DIRS
+from app.tools.shell_pool import shell_pool
+
+TODO_FILE = "TODO.md"
+
+# Unchecked markdown checklist items: "- [ ] Add login endpoint"
+TODO_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+\[ \]\s+(.+?)\s*$")
+# File ownership hints: backticked paths such as `api/app/auth.py`
+FILE_HINT = re.compile(r"`([^`\s]+\.[A-Za-z0-9]+)`")
+
+# IGNORE_DIRS names are dependency/build directories only at the top level of
+# the workspace (a nested src/build/ is ordinary source); git internals and
+# bytecode caches are skipped at every depth
+ALWAYS_IGNORED = {".git", "__pycache__"}
+
+# Dependency directories cloned into scratch copies (reflinked where the
+# filesystem supports it), so installs stay private to the copy. Virtualenvs
+# are not carried over: they hard-code their absolute path, so a copied one
+# would still install into the workspace's own.
+DEPENDENCY_DIRS = ("node_modules",)
+
+SUBTASK_PROMPT = """You are one of several engineers implementing the plan in this workspace in parallel (see PLAN.md and TODO.md).
+Your assignment:
+
+{tasks}
+
+Only change what this assignment needs{ownership}. Other engineers are working on the other items at the same time, so do not edit TODO.md or work on anything else. Finish with a short summary of what you changed."""
+
+
+def parse_todo(text: str) -> list[str]:
+    """Open checklist items of a TODO.md"""
+    return [m.group(1) for m in map(TODO_ITEM.match, text.splitlines()) if m]
+
+
+def group_tasks(tasks: list[str], max_groups: int) -> list[list[str]]:
+    """
+    Partition tasks by file ownership: tasks naming the same file end up in
+    the same group. At most max_groups groups are returned - the smallest
+    groups are folded together beyond that.
+    """
+    groups: list[tuple[set, list[str]]] = []
+    for task in tasks:
+        files = set(FILE_HINT.findall(task))
+        overlapping = [g for g in groups if files and g[0] & files]
+        merged_files = set(files)
+        merged_tasks = []
+        for group in overlapping:
+            merged_files |= group[0]
+            merged_tasks.extend(group[1])
+            groups.remove(group)
+        groups.append((merged_files, merged_tasks + [task]))
+
+    groups.sort(key=lambda g: -len(g[1]))
+    while len(groups) > max(1, max_groups):
+        files, extra = groups.pop()
+        target = min(groups, key=lambda g: len(g[1]))
+        target[0].update(files)
+        target[1].extend(extra)
+    return [tasks_ for _, tasks_ in groups]
+
+
+def ignored_names(root: Path, directory: str, names) -> set:
+    """Entries of a directory that copies and merges leave out"""
+    if Path(directory) == root:
+        return {name for name in names if name in IGNORE_DIRS}
+    return {name for name in names if name in ALWAYS_IGNORED}
+
+
+def workspace_manifest(root: Path) -> Dict[str, tuple[int, int]]:
+    """Relative path → (mtime_ns, size) of the files and symlinks merging cares about"""
+    manifest = {}
+    for dirpath, dirs, names in os.walk(root):
+        skipped = ignored_names(root, dirpath, dirs)
+        # Symlinks to directories are entries of their own, not descended into
+        links = [d for d in dirs if os.path.islink(os.path.join(dirpath, d))]
+        dirs[:] = [d for d in dirs if d not in skipped and d not in links]
+        for name in names + links:
+            full_path = os.path.join(dirpath, name)
+            try:
+                stat = os.lstat(full_path)
+            except OSError:
+                continue
+            manifest[os.path.relpath(full_path, root)] = (stat.st_mtime_ns, stat.st_size)
+    return manifest
+
+
+def ignored_state(root: Path) -> Dict[str, int]:
+    """Top-level ignored directory → latest mtime of any directory inside it"""
+    state = {}
+    for name in IGNORE_DIRS - ALWAYS_IGNORED:
+        path = root / name
+        if path.is_symlink() or not path.is_dir():
+            continue
+        latest = 0
+        for dirpath, _, _ in os.walk(path):
+            try:
+                latest = max(latest, os.lstat(dirpath).st_mtime_ns)
+            except OSError:
+                pass
+        state[name] = latest
+    return state
+
+
+def unmerged_dirs(root: Path, before: Dict[str, int]) -> list[str]:
+    """Top-level ignored directories created or changed since `before` - never merged"""
+    return sorted(f"{name}/" for name, latest in ignored_state(root).items() if before.get(name) != latest)
+
+
+def clone_tree(source: Path, target: Path) -> None:
+    """Copy a directory tree, sharing blocks with the source where the filesystem can (reflink)"""
+    try:
+        subprocess.run(["cp", "-a", "--reflink=auto", str(source), str(target)], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(source, target, symlinks=True)
+
+
+def create_scratch(workspace: Path, scratch: Path) -> tuple[Dict[str, tuple[int, int]], Dict[str, int]]:
+    """Copy the workspace into a scratch directory. Returns the copy's manifest and ignored-dir state."""
+    shutil.copytree(workspace, scratch, symlinks=True, ignore=lambda d, names: ignored_names(workspace, d, names))
+    for name in DEPENDENCY_DIRS:
+        if (workspace / name).is_dir() and not (workspace / name).is_symlink():
+            clone_tree(workspace / name, scratch / name)
+    return workspace_manifest(scratch), ignored_state(scratch)
+
+
+def copy_entry(source: Path, target: Path) -> None:
+    """Copy a file or symlink (as a link) over whatever is at target"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if source.is_symlink():
+        target.unlink(missing_ok=True)
+        os.symlink(os.readlink(source), target)
+    else:
+        shutil.copy2(source, target)
+
+
+def merge_scratch(
+    workspace: Path,
+    scratch: Path,
+    scratch_before: Dict[str, tuple[int, int]],
+    workspace_before: Dict[str, tuple[int, int]],
+    claimed: set
+) -> tuple[list[str], list[str]]:
+    """
+    Apply a subtask's changes to the workspace. Returns (merged, conflicts).
+    Called from one thread at a time, so `claimed` needs no locking.
+    """
+    scratch_after = workspace_manifest(scratch)
+    changed = [p for p, state in scratch_after.items() if scratch_before.get(p) != state]
+    deleted = [p for p in scratch_before if p not in scratch_after]
+
+    current = workspace_manifest(workspace)
+    merged, conflicts = [], []
+    for path in sorted(changed + deleted):
+        if path in claimed or current.get(path) != workspace_before.get(path):
+            conflicts.append(path)
+            continue
+        target = workspace / path
+        if path in scratch_after:
+            copy_entry(scratch / path, target)
+        else:
+            target.unlink(missing_ok=True)
+        claimed.add(path)
+        merged.append(path)
+    return merged, conflicts
+
+
+async def orchestrate(
+    session_id: str,
+    session: Dict[str, Any],
+    tasks: Optional[list[str]],
+    publish: Callable[[dict], None]
+) -> None:
+    workspace = Path(session["workspace"]).resolve()
+
+    if not tasks:
+        todo = workspace / TODO_FILE
+        try:
+            tasks = parse_todo(await asyncio.to_thread(todo.read_text, encoding="utf-8"))
+        except OSError:
+            tasks = []
+    if not tasks:
+        publish(ErrorMessage(content=f"No open tasks to orchestrate - {TODO_FILE} has no unchecked items").model_dump())
+        return
+
+    groups = group_tasks(tasks, settings.orchestrator_max_subtasks)
+    publish(StatusMessage(
+        content=f"Orchestrating {len(tasks)} task(s) as {len(groups)} parallel subtask(s)...",
+        done=False
+    ).model_dump())
+    await create_checkpoint(workspace, session_id, "before orchestration")
+
+    # Copies of the whole workspace that are merged back - by default only this user may touch them
+    if settings.orchestrator_scratch_dir:
+        scratch_root = Path(settings.orchestrator_scratch_dir)
+        scratch_root.mkdir(parents=True, exist_ok=True)
+    else:
+        scratch_root = private_temp_dir("scratch")
+    workspace_before = await asyncio.to_thread(workspace_manifest, workspace)
+
+    base_tokens = dict(session.get("token_usage") or {})
+    subtask_tokens: Dict[str, dict] = {}
+    claimed: set = set()
+    merge_lock = asyncio.Lock()
+    semaphore = asyncio.Semaphore(max(1, settings.orchestrator_max_parallel))
+    results: Dict[str, dict] = {}
+
+    def publish_token_usage(model: Optional[str]) -> None:
+        # Subtasks count tokens from zero - report the session-wide total instead
+        input_tokens = base_tokens.get("input_tokens", 0) + sum(t["input_tokens"] for t in subtask_tokens.values())
+        output_tokens = base_tokens.get("output_tokens", 0) + sum(t["output_tokens"] for t in subtask_tokens.values())
+        cost = base_tokens.get("estimated_cost", 0.0) + sum(t["estimated_cost"] for t in subtask_tokens.values())
+        session["token_usage"] = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "estimated_cost": round(cost, 6)
+        }
+        publish(TokenUsageMessage(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+            estimated_cost=round(cost, 6),
+            model=model
+        ).model_dump())
+
+    async def run_subtask(index: int, group: list[str]) -> None:
+        task_id = f"{session_id}-task{index}"
+        source = f"subtask {index}"
+        title = group[0] if len(group) == 1 else f"{group[0]} (+{len(group) - 1} more)"
+        scratch = scratch_root / task_id
+
+        def status(state: str, content: str, **extra) -> None:
+            publish(SubtaskMessage(
+                task_id=task_id, title=title, status=state, content=content, source=source, **extra
+            ).model_dump())
+
+        async with semaphore:
+            status("running", f"Subtask {index} started: {title}")
+            keep_scratch = False
+            try:
+                await asyncio.to_thread(shutil.rmtree, scratch, True)
+                scratch_before, ignored_before = await asyncio.to_thread(create_scratch, workspace, scratch)
+
+                owned = sorted({f for task in group for f in FILE_HINT.findall(task)})
+                prompt = SUBTASK_PROMPT.format(
+                    tasks="\n".join(f"- {task}" for task in group),
+                    ownership=f" (you own: {', '.join(owned)})" if owned else ""
+                )
+                file_changes = []
+                answer = ""
+                async for event_dict in run_agent(
+                    user_message=prompt,
+                    workspace=str(scratch),
+                    history=[],
+                    agent_type="building",
+                    session_id=task_id,
+                    checkpoints=False
+                ):
+                    if event_dict["type"] == "token_usage":
+                        subtask_tokens[task_id] = event_dict
+                        publish_token_usage(event_dict.get("model"))
+                        continue
+                    event_dict["source"] = source
+                    payload = to_event_payload(event_dict)
+                    file_changes.extend(expand_file_changes(payload))
+                    if payload["type"] == "assistant":
+                        answer = payload["content"]
+                    publish(payload)
+
+                async with merge_lock:
+                    merged, conflicts = await asyncio.to_thread(
+                        merge_scratch, workspace, scratch, scratch_before, workspace_before, claimed
+                    )
+                # Dependency installs and build output in ignored directories stay in the scratch copy
+                unmerged = await asyncio.to_thread(unmerged_dirs, scratch, ignored_before)
+                bump_workspace_generation(workspace)
+                merged_set = set(merged)
+                session["changes"].extend(
+                    change for change in file_changes
+                    if os.path.normpath(change["file_path"]) in merged_set
+                )
+
+                not_merged = f"; not merged (ignored directories): {', '.join(unmerged)}" if unmerged else ""
+                if conflicts:
+                    keep_scratch = True
+                    content = (
+                        f"Subtask {index} merged {len(merged)} file(s); {len(conflicts)} conflicting file(s) "
+                        f"were not applied (kept in {scratch}){not_merged}"
+                    )
+                    status("conflict", content, merged_files=merged, conflicts=conflicts, unmerged=unmerged)
+                else:
+                    status(
+                        "merged", f"Subtask {index} finished and merged {len(merged)} file(s){not_merged}",
+                        merged_files=merged, unmerged=unmerged
+                    )
+                results[task_id] = {
+                    "index": index, "title": title, "answer": answer,
+                    "merged": merged, "conflicts": conflicts, "unmerged": unmerged, "scratch": str(scratch)
+                }
+            except asyncio.CancelledError:
+                status("cancelled", f"Subtask {index} cancelled")
+                raise
+            except Exception as e:
+                keep_scratch = scratch.exists()
+                status("failed", f"Subtask {index} failed: {e}")
+                results[task_id] = {"index": index, "title": title, "error": str(e), "scratch": str(scratch)}
+            finally:
+                shell_pool.release(task_id)
+                if not keep_scratch:
+                    await asyncio.to_thread(shutil.rmtree, scratch, True)
+
+    runs = [asyncio.create_task(run_subtask(i, group)) for i, group in enumerate(groups, 1)]
+    try:
+        await asyncio.gather(*runs)
+    except BaseException:
+        for run in runs:
+            run.cancel()
+        await asyncio.gather(*runs, return_exceptions=True)
+        raise
+    finally:
+        await create_checkpoint(workspace, session_id, "after orchestration")
+
+    summary = [f"Orchestrated {len(tasks)} task(s) in {len(groups)} parallel subtask(s):", ""]
+    for result in sorted(results.values(), key=lambda r: r["index"]):
+        summary.append(f"### Subtask {result['index']}: {result['title']}")
+        if "error" in result:
+            summary.append(f"Failed: {result['error']}")
+        else:
+            summary.append(f"Merged files: {', '.join(result['merged']) or 'none'}")
+            if result["conflicts"]:
+                summary.append(
+                    f"Conflicts (not applied, see {result['scratch']}): {', '.join(result['conflicts'])}"
+                )
+            if result["unmerged"]:
+                summary.append(f"Not merged (ignored directories): {', '.join(result['unmerged'])}")
+            if result["answer"]:
+                summary.append(result["answer"])
+        summary.append("")
+    summary_text = "\n".join(summary).strip()
+
+    session["history"].extend([
+        {"role": "user", "content": "Implement these tasks in parallel:\n" + "\n".join(f"- {t}" for t in tasks)},
+        {"role": "assistant", "content": summary_text}
+    ])
+    publish(AssistantMessage(content=summary_text).model_dump())
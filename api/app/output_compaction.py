@@ -0,0 +1,187 @@
+"""
+Token-aware compaction of large tool outputs.
+
+Tool results are appended to the conversation and resent with every later
+LLM call, so a noisy build log costs tokens on every remaining iteration.
+Outputs over the token budget are compacted before they enter history:
+repeated lines are collapsed, test-failure summaries are pulled to the top,
+and only the head, the tail and error/traceback regions are kept. The full
+output is stored out-of-band so the model can page through it with the
+read_tool_output tool.
+"""
+import asyncio
+import re
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.private_dirs import private_temp_dir
+
+# Tools whose output is compacted (read_file content must stay verbatim for edits)
+COMPACTED_TOOLS = {"execute_bash", "explore_project_structure", "list_files", "web_search"}
+
+# Rough token estimate - good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+ERROR_PATTERN = re.compile(
+    r"(error|exception|traceback|failed|failure|fatal|panic|assert|segmentation fault|"
+    r"cannot|could not|not found|denied|undefined|refused)",
+    re.IGNORECASE
+)
+
+TEST_SUMMARY_PATTERN = re.compile(
+    r"^(FAILED |ERROR |=+ .*(failed|passed|error).* =+$|=+ short test summary info =+|"
+    r"Tests?:\s+.*(failed|passed)|Test Suites?:|--- FAIL|FAIL\s|not ok \d+|\d+ (failing|passing)\b)",
+    re.IGNORECASE
+)
+
+ERROR_CONTEXT_LINES = 3
+MAX_TRACEBACK_LINES = 40
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def output_store_dir() -> Path:
+    # Outputs may contain secrets a command printed - by default only this user may read them
+    if settings.tool_output_dir:
+        return Path(settings.tool_output_dir)
+    return private_temp_dir("tool-outputs")
+
+
+def output_path(output_id: str) -> Optional[Path]:
+    """Location of a stored output, or None for ids that aren't ours"""
+    if not re.fullmatch(r"[0-9a-f]{32}", output_id or ""):
+        return None
+    return output_store_dir() / f"{output_id}.txt"
+
+
+def store_full_output(text: str) -> str:
+    """Persist a full tool output and return its id (blocking)"""
+    directory = output_store_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    output_id = uuid.uuid4().hex
+    (directory / f"{output_id}.txt").write_text(text, encoding="utf-8")
+
+    # Keep the store bounded - drop the oldest outputs beyond the limit
+    files = sorted(directory.glob("*.txt"), key=lambda p: p.stat().st_mtime)
+    for stale in files[:max(0, len(files) - settings.tool_output_max_files)]:
+        stale.unlink(missing_ok=True)
+
+    return output_id
+
+
+def collapse_repeats(lines: list[str]) -> list[str]:
+    """Collapse runs of identical consecutive lines"""
+    collapsed = []
+    idx = 0
+    while idx < len(lines):
+        run_end = idx + 1
+        while run_end < len(lines) and lines[run_end] == lines[idx]:
+            run_end += 1
+        count = run_end - idx
+        if count > 2:
+            collapsed.append(f"{lines[idx]}  [line repeated {count} times]")
+        else:
+            collapsed.extend(lines[idx:run_end])
+        idx = run_end
+    return collapsed
+
+
+def test_summary_lines(lines: list[str]) -> list[str]:
+    return [line for line in lines if TEST_SUMMARY_PATTERN.search(line.strip())]
+
+
+def important_line_numbers(lines: list[str]) -> set[int]:
+    """Indexes of error lines (with context) and whole traceback blocks"""
+    keep = set()
+    idx = 0
+    while idx < len(lines):
+        line = lines[idx]
+        if line.startswith("Traceback (most recent call last)"):
+            # The traceback runs until the first non-indented line (the exception itself)
+            end = idx + 1
+            while end < len(lines) and (lines[end].startswith(" ") or not lines[end].strip()):
+                end += 1
+            block = list(range(idx, min(end + 1, len(lines))))
+            if len(block) > MAX_TRACEBACK_LINES:
+                # Keep where it started and where it blew up
+                block = block[:5] + block[-(MAX_TRACEBACK_LINES - 5):]
+            keep.update(block)
+            idx = end + 1
+            continue
+        if ERROR_PATTERN.search(line):
+            keep.update(range(max(0, idx - ERROR_CONTEXT_LINES), min(len(lines), idx + ERROR_CONTEXT_LINES + 1)))
+        idx += 1
+    return keep
+
+
+def compact_text(text: str, max_tokens: int, output_id: Optional[str] = None) -> str:
+    """Compact an output to roughly max_tokens. Returns text unchanged if it already fits."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    original_lines = text.splitlines()
+    lines = collapse_repeats(original_lines)
+
+    head = settings.tool_output_head_lines
+    tail = settings.tool_output_tail_lines
+    keep = set(range(min(head, len(lines))))
+    keep.update(range(max(0, len(lines) - tail), len(lines)))
+    keep.update(important_line_numbers(lines))
+
+    body = []
+    previous = -1
+    for idx in sorted(keep):
+        if idx > previous + 1:
+            body.append(f"... [{idx - previous - 1} lines omitted] ...")
+        body.append(lines[idx])
+        previous = idx
+    if previous < len(lines) - 1:
+        body.append(f"... [{len(lines) - previous - 1} lines omitted] ...")
+
+    header = [
+        f"[Output compacted from {len(original_lines)} lines (~{estimate_tokens(text)} tokens)."
+        + (f" Full output id: {output_id} - use read_tool_output to page through it.]" if output_id else "]")
+    ]
+    summary = test_summary_lines(lines)
+    if summary:
+        header.append("Test summary:")
+        header.extend(summary[-30:])
+    header.append("")
+
+    compacted = "\n".join(header + body)
+
+    # Still over budget (e.g. thousands of error lines) - keep both ends of what's left
+    budget_chars = max_tokens * CHARS_PER_TOKEN
+    if len(compacted) > budget_chars:
+        half = budget_chars // 2
+        # Cut on line boundaries so no line is half-kept
+        start = compacted[:half].rsplit("\n", 1)[0]
+        end = compacted[-half:].split("\n", 1)[-1]
+        omitted = len(compacted) - len(start) - len(end)
+        compacted = f"{start}\n... [{omitted} characters omitted] ...\n{end}"
+
+    return compacted
+
+
+def _compact_and_store(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    try:
+        output_id = store_full_output(text)
+    except OSError as e:
+        print(f"⚠️  Could not store full tool output: {e}")
+        output_id = None
+    return compact_text(text, max_tokens, output_id)
+
+
+async def compact_tool_output(tool_name: str, text: str) -> str:
+    """Compaction stage between tool execution and the conversation history"""
+    if tool_name not in COMPACTED_TOOLS or estimate_tokens(text) <= settings.tool_output_max_tokens:
+        return text
+    # Regex work over megabytes of log output - keep it off the event loop
+    return await asyncio.to_thread(_compact_and_store, text, settings.tool_output_max_tokens)
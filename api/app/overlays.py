@@ -0,0 +1,401 @@
+"""
+Copy-on-write workspace overlays.
+
+A session with an overlay works in its own view of the base workspace, so
+several agents can run on one repository at the same time without
+trampling each other. The view is created the cheapest way the system
+allows:
+
+- reflink: `cp --reflink=always` clones files by sharing their blocks until
+  one side writes (btrfs, XFS, ...) - milliseconds, no extra disk space
+- worktree: `git worktree add` checks out the base's HEAD, then copies the
+  base's uncommitted and untracked files on top
+- copy: a plain copy (the fallback)
+
+Hardlinks are not used: tools rewrite files in place, which would write
+through to the base. node_modules is cloned as well, so installs in an
+overlay stay in the overlay. As for orchestrator scratch copies, the other
+IGNORE_DIRS names (build output, virtualenvs) are left out only at the top
+level of the workspace.
+
+The base and overlay manifests (files and symlinks) at the last sync are
+kept in overlay.json. A file changed in the overlay is promoted to the base;
+a file changed in the base is merged into the overlay; a file changed on
+both sides (to different contents) is a conflict, resolved only with force.
+Either way all files are staged first and then renamed into place, so a
+failure leaves the target untouched.
+
+Overlays are removed with DELETE /sessions/{id}/overlay, or automatically
+once nothing in them changed for WORKSPACE_OVERLAY_IDLE_DAYS and they hold
+no unpromoted changes.
+"""
+import asyncio
+import filecmp
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from app.config import settings
+from app.orchestrator import ALWAYS_IGNORED, DEPENDENCY_DIRS, clone_tree, ignored_names, workspace_manifest
+from app.repo_map import IGNORE_DIRS
+
+OVERLAY_MODES = ("reflink", "worktree", "copy")
+SESSION_ID = re.compile(r"[A-Za-z0-9_-]+")
+META_FILE = "overlay.json"
+
+
+class OverlayError(Exception):
+    """An overlay operation that can't be performed"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def overlay_root() -> Path:
+    return Path(settings.workspace_overlay_dir).resolve()
+
+
+def _overlay_dir(session_id: str) -> Path:
+    if not SESSION_ID.fullmatch(session_id or ""):
+        raise OverlayError(400, f"Invalid session id: {session_id}")
+    return overlay_root() / session_id
+
+
+def _git(cwd: Path, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", *args], cwd=cwd, capture_output=True)
+
+
+def _clone_reflink(base: Path, target: Path) -> None:
+    target.mkdir(parents=True)
+    entries = [str(p) for p in base.iterdir() if p.name not in IGNORE_DIRS]
+    if entries:
+        subprocess.run(
+            ["cp", "-a", "--reflink=always", *entries, str(target)],
+            check=True, capture_output=True
+        )
+
+
+def _clone_worktree(base: Path, target: Path) -> None:
+    toplevel = _git(base, "rev-parse", "--show-toplevel")
+    if toplevel.returncode != 0 or Path(os.fsdecode(toplevel.stdout.strip())).resolve() != base:
+        raise OSError("workspace is not the root of a git repository")
+    result = _git(base, "worktree", "add", "--detach", "-q", str(target), "HEAD")
+    if result.returncode != 0:
+        raise OSError(result.stderr.decode(errors="replace").strip() or "git worktree add failed")
+
+    # HEAD is checked out - bring over what isn't committed yet
+    listed = _git(base, "ls-files", "-z", "--modified", "--others")
+    for name in set(os.fsdecode(p) for p in listed.stdout.split(b"\0") if p):
+        parts = Path(name).parts
+        if parts[0] in IGNORE_DIRS or ALWAYS_IGNORED.intersection(parts):
+            continue
+        source, dest = base / name, target / name
+        if source.is_symlink() or source.is_file():
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source, dest, follow_symlinks=False)
+        elif not source.exists():
+            dest.unlink(missing_ok=True)  # Deleted in the base but not committed
+
+
+def _clone_copy(base: Path, target: Path) -> None:
+    shutil.copytree(base, target, symlinks=True, ignore=lambda d, names: ignored_names(base, d, names))
+
+
+CLONERS = {"reflink": _clone_reflink, "worktree": _clone_worktree, "copy": _clone_copy}
+
+
+def _remove_clone(base: Path, target: Path, mode: Optional[str]) -> None:
+    if mode == "worktree":
+        _git(base, "worktree", "remove", "--force", str(target))
+    shutil.rmtree(target, ignore_errors=True)
+    if mode == "worktree":
+        _git(base, "worktree", "prune")
+
+
+def _save_meta(directory: Path, meta: dict) -> None:
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".meta-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, directory / META_FILE)
+
+
+def load_overlay(session_id: str) -> Optional[dict]:
+    """Metadata of a session's overlay, or None if the session has none"""
+    directory = _overlay_dir(session_id)
+    try:
+        meta = json.loads((directory / META_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+    meta["base_manifest"] = {p: tuple(s) for p, s in meta["base_manifest"].items()}
+    meta["overlay_manifest"] = {p: tuple(s) for p, s in meta["overlay_manifest"].items()}
+    return meta
+
+
+def create_overlay(session_id: str, base: Path, mode: Optional[str] = None) -> dict:
+    """Give a session its own copy-on-write view of a workspace (blocking)"""
+    base = base.resolve()
+    mode = mode or settings.workspace_overlay_mode
+    if mode != "auto" and mode not in OVERLAY_MODES:
+        raise OverlayError(400, f"Unknown overlay mode '{mode}' (use auto, {', '.join(OVERLAY_MODES)})")
+    directory = _overlay_dir(session_id)
+    if directory.is_relative_to(base):
+        raise OverlayError(400, "WORKSPACE_OVERLAY_DIR must be outside the workspace")
+    if directory.exists():
+        raise OverlayError(409, f"Session {session_id} already has an overlay")
+    directory.mkdir(parents=True)
+    target = directory / "workspace"
+
+    # Taken before cloning: anything changing meanwhile counts as a base change
+    base_manifest = workspace_manifest(base)
+    used = None
+    errors = []
+    for candidate in (OVERLAY_MODES if mode == "auto" else (mode,)):
+        try:
+            CLONERS[candidate](base, target)
+            used = candidate
+            break
+        except (OSError, subprocess.CalledProcessError) as e:
+            errors.append(f"{candidate}: {e}")
+            _remove_clone(base, target, candidate)
+    if used is None:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise OverlayError(500, "Could not create workspace overlay - " + "; ".join(errors))
+
+    for name in DEPENDENCY_DIRS:
+        if (base / name).is_dir() and not (target / name).exists():
+            clone_tree(base / name, target / name)
+
+    meta = {
+        "session_id": session_id,
+        "base": str(base),
+        "workspace": str(target),
+        "mode": used,
+        "base_manifest": base_manifest,
+        "overlay_manifest": workspace_manifest(target)
+    }
+    _save_meta(directory, meta)
+    return meta
+
+
+def _changed(before: Dict[str, tuple], after: Dict[str, tuple]) -> set:
+    return {p for p in before.keys() | after.keys() if before.get(p) != after.get(p)}
+
+
+def _same_content(a: Path, b: Path) -> bool:
+    if a.is_symlink() or b.is_symlink():
+        return a.is_symlink() and b.is_symlink() and os.readlink(a) == os.readlink(b)
+    if not a.exists() and not b.exists():
+        return True
+    return a.is_file() and b.is_file() and filecmp.cmp(a, b, shallow=False)
+
+
+def _diff(meta: dict) -> dict:
+    base, workspace = Path(meta["base"]), Path(meta["workspace"])
+    base_now = workspace_manifest(base)
+    overlay_now = workspace_manifest(workspace)
+    overlay_changed = _changed(meta["overlay_manifest"], overlay_now)
+    base_changed = _changed(meta["base_manifest"], base_now)
+    both = overlay_changed & base_changed
+    identical = {p for p in both if _same_content(base / p, workspace / p)}
+    return {
+        "base_now": base_now,
+        "overlay_now": overlay_now,
+        "overlay_changed": overlay_changed - identical,
+        "base_changed": base_changed - identical,
+        "identical": identical,
+        "conflicts": both - identical
+    }
+
+
+def _sibling(path: Path, suffix: str) -> Path:
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.{suffix}")
+
+
+def _apply(paths: set, source: Path, target: Path) -> list[str]:
+    """
+    Make paths in target match source, all or nothing: new versions are
+    staged next to their targets first, then swapped in by rename while the
+    replaced and deleted files are kept as backups until every rename
+    succeeded. Raises OverlayError after rolling back.
+    """
+    created_dirs: list[Path] = []
+    staged: Dict[str, Path] = {}
+    backups: list[tuple[Path, Path]] = []
+    placed: list[Path] = []
+    try:
+        for path in sorted(paths):
+            src = source / path
+            if not (src.is_symlink() or src.is_file()):
+                continue  # Deleted on the source side
+            dest = target / path
+            missing = []
+            parent = dest.parent
+            while not os.path.lexists(parent):
+                missing.append(parent)
+                parent = parent.parent
+            for directory in reversed(missing):
+                directory.mkdir()
+                created_dirs.append(directory)
+            temp = _sibling(dest, "tmp")
+            if src.is_symlink():
+                os.symlink(os.readlink(src), temp)
+            else:
+                shutil.copy2(src, temp)
+            staged[path] = temp
+
+        for path in sorted(paths):
+            dest = target / path
+            if os.path.lexists(dest):
+                if dest.is_dir() and not dest.is_symlink():
+                    raise IsADirectoryError(f"{path} is a directory")
+                backup = _sibling(dest, "bak")
+                os.rename(dest, backup)
+                backups.append((dest, backup))
+            if path in staged:
+                os.rename(staged[path], dest)
+                del staged[path]
+                placed.append(dest)
+    except OSError as e:
+        for dest in placed:
+            dest.unlink(missing_ok=True)
+        for dest, backup in reversed(backups):
+            os.replace(backup, dest)
+        for temp in staged.values():
+            temp.unlink(missing_ok=True)
+        for directory in reversed(created_dirs):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+        raise OverlayError(500, f"Rolled back, no file was changed: {e}") from e
+
+    for _, backup in backups:
+        backup.unlink(missing_ok=True)
+    return sorted(paths)
+
+
+def _settle(meta: dict, paths: set) -> None:
+    """Record paths as in sync on both sides"""
+    base, workspace = Path(meta["base"]), Path(meta["workspace"])
+    for path in paths:
+        for root, manifest in ((base, meta["base_manifest"]), (workspace, meta["overlay_manifest"])):
+            try:
+                stat = os.lstat(root / path)
+                manifest[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                manifest.pop(path, None)
+
+
+def _require_overlay(session_id: str) -> dict:
+    meta = load_overlay(session_id)
+    if meta is None:
+        raise OverlayError(404, "Session has no workspace overlay")
+    return meta
+
+
+def overlay_status(session_id: str) -> dict:
+    """What the overlay and the base changed since they were last in sync (blocking)"""
+    meta = _require_overlay(session_id)
+    diff = _diff(meta)
+    return {
+        "base": meta["base"],
+        "workspace": meta["workspace"],
+        "mode": meta["mode"],
+        "changed": sorted(diff["overlay_changed"] - diff["conflicts"]),
+        "base_changed": sorted(diff["base_changed"] - diff["conflicts"]),
+        "conflicts": sorted(diff["conflicts"])
+    }
+
+
+def promote_overlay(session_id: str, force: bool = False) -> dict:
+    """
+    Land the overlay's changes in the base (blocking). All or nothing: with
+    conflicts nothing is applied unless force is set, in which case the
+    overlay's version wins.
+    """
+    meta = _require_overlay(session_id)
+    diff = _diff(meta)
+    conflicts = sorted(diff["conflicts"])
+    if conflicts and not force:
+        return {"promoted": [], "conflicts": conflicts}
+
+    promoted = _apply(diff["overlay_changed"], Path(meta["workspace"]), Path(meta["base"]))
+    _settle(meta, diff["overlay_changed"] | diff["identical"])
+    _save_meta(_overlay_dir(session_id), meta)
+    return {"promoted": promoted, "conflicts": []}
+
+
+def merge_overlay(session_id: str, force: bool = False) -> dict:
+    """
+    Bring the base's changes into the overlay (blocking). Conflicting files
+    keep the overlay's version and are reported, unless force is set, in
+    which case the base's version wins.
+    """
+    meta = _require_overlay(session_id)
+    diff = _diff(meta)
+    paths = diff["base_changed"] if force else diff["base_changed"] - diff["conflicts"]
+    merged = _apply(paths, Path(meta["base"]), Path(meta["workspace"]))
+    _settle(meta, paths | diff["identical"])
+    _save_meta(_overlay_dir(session_id), meta)
+    return {"merged": merged, "conflicts": [] if force else sorted(diff["conflicts"])}
+
+
+def delete_overlay(session_id: str) -> dict:
+    """Remove a session's overlay, unpromoted changes included (blocking)"""
+    meta = _require_overlay(session_id)
+    _remove_clone(Path(meta["base"]), Path(meta["workspace"]), meta["mode"])
+    shutil.rmtree(_overlay_dir(session_id), ignore_errors=True)
+    return {"removed": meta["workspace"]}
+
+
+def prune_idle_overlays(is_active: Callable[[str], bool]) -> list[str]:
+    """Remove overlays nothing changed in for WORKSPACE_OVERLAY_IDLE_DAYS that have nothing to promote (blocking)"""
+    root = overlay_root()
+    if settings.workspace_overlay_idle_days <= 0 or not root.is_dir():
+        return []
+    cutoff = time.time() - settings.workspace_overlay_idle_days * 86400
+    removed = []
+    for entry in os.scandir(root):
+        session_id = entry.name
+        if not SESSION_ID.fullmatch(session_id) or is_active(session_id):
+            continue
+        meta = load_overlay(session_id)
+        if meta is None:
+            continue
+        try:
+            last_sync = os.stat(Path(entry.path) / META_FILE).st_mtime
+            diff = _diff(meta)
+        except OSError:
+            continue
+        last_change = max([last_sync] + [mtime_ns / 1e9 for mtime_ns, _ in diff["overlay_now"].values()])
+        if last_change > cutoff or diff["overlay_changed"] or diff["conflicts"]:
+            continue
+        try:
+            delete_overlay(session_id)
+        except (OSError, OverlayError) as e:
+            print(f"⚠️  Could not remove idle overlay of session {session_id}: {e}")
+            continue
+        removed.append(session_id)
+    return removed
+
+
+async def run_overlay_sweeper(is_active: Callable[[str], bool], interval_seconds: float) -> None:
+    """Periodically remove idle overlays (runs for the lifetime of the app)"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            removed = await asyncio.to_thread(prune_idle_overlays, is_active)
+        except Exception as e:
+            print(f"⚠️  Overlay cleanup failed: {e}")
+            continue
+        if removed:
+            print(f"Removed {len(removed)} idle workspace overlay(s)")
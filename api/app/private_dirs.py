@@ -0,0 +1,33 @@
+"""
+Private default locations for on-disk caches.
+
+The system temp dir is shared by every user of the host. Caches whose
+contents the API trusts when it reads them back (code indexes, compressed
+file variants, LLM responses) default to a per-user directory below it that
+only the API's own user can access.
+"""
+import os
+import stat
+import tempfile
+from pathlib import Path
+
+
+def _ensure_private(directory: Path) -> None:
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{directory} is not a directory")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(f"{directory} is owned by another user")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(directory, 0o700)
+
+
+def private_temp_dir(name: str) -> Path:
+    """<temp dir>/web-agent-<uid>/<name>, created owner-only (raises PermissionError if it isn't ours)"""
+    user = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+    root = Path(tempfile.gettempdir()) / f"web-agent-{user}"
+    _ensure_private(root)
+    directory = root / name
+    _ensure_private(directory)
+    return directory
@@ -0,0 +1,341 @@
+"""
+On-demand profiling of the live API process.
+
+Three profilers can be switched on for N seconds (see /admin/profile):
+
+- "sample": a background thread samples the stacks of the event loop and the
+  worker threads every few milliseconds. Cheap enough for production and the
+  only mode that can be scoped to one session - a sample belongs to the
+  session named by the outermost `session_id` local on its stack (the run's
+  supervisor, run_agent, the WebSocket handler...). Exported as collapsed
+  stacks (flamegraph.pl, speedscope) or speedscope JSON.
+- "cprofile": deterministic profile of everything running on the event loop,
+  exported as pstats (snakeviz, `python -m pstats`) or a text summary.
+- "yappi": async-aware wall-clock profile of all threads, optionally scoped
+  to a session through the `current_session` context variable. Needs the
+  optional yappi package.
+
+LoopWatchdog reports event-loop stalls: when no callback got to run for
+longer than SLOW_CALLBACK_MS, the stack of whatever is blocking the loop is
+captured while it is still blocking and logged.
+"""
+import asyncio
+import contextvars
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+
+# Session whose run the current task belongs to (set by the run manager, copied into threads by to_thread)
+current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_session", default=None)
+
+
+def session_context(session_id: str) -> contextvars.Context:
+    """A copy of the current context tagged with the session, for the run's task"""
+    context = contextvars.copy_context()
+    context.run(current_session.set, session_id)
+    return context
+
+PROFILE_FORMATS = {
+    "sample": ("collapsed", "speedscope"),
+    "cprofile": ("pstats", "text"),
+    "yappi": ("pstats", "text"),
+}
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class ProfilerError(Exception):
+    """The requested profile can't be taken"""
+
+
+_profile_lock = asyncio.Lock()
+
+
+def _short_path(filename: str) -> str:
+    try:
+        relative = os.path.relpath(filename)
+    except ValueError:
+        return filename
+    return filename if relative.startswith("..") else relative
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _frames_outermost_first(frame) -> list:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _frame_session(frames: list) -> Optional[str]:
+    for frame in frames:
+        session_id = frame.f_locals.get("session_id")
+        if isinstance(session_id, str):
+            return session_id
+    return None
+
+
+def _is_idle_worker(frames: list) -> bool:
+    """Thread pool workers waiting for their next work item"""
+    for position, frame in enumerate(frames):
+        if frame.f_code.co_name == "_worker" and frame.f_code.co_filename.endswith(os.path.join("futures", "thread.py")):
+            return position + 1 < len(frames) and frames[position + 1].f_code.co_name == "get"
+    return False
+
+
+class StackSampler:
+    """Samples thread stacks from a background thread into collapsed-stack counts"""
+
+    def __init__(self, interval_ms: float, session_id: Optional[str] = None):
+        self.interval = max(0.001, interval_ms / 1000)
+        self.session_id = session_id
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.stopped = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or names.get(thread_id) == LoopWatchdog.THREAD_NAME:
+                    continue
+                frames = _frames_outermost_first(frame)
+                if _is_idle_worker(frames):
+                    continue
+                if self.session_id is not None and _frame_session(frames) != self.session_id:
+                    continue
+                stack = [names.get(thread_id, str(thread_id))] + [_frame_label(f.f_code) for f in frames]
+                self.counts[tuple(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.counts.most_common())
+
+    def speedscope(self) -> dict:
+        frames: list[dict] = []
+        frame_index: dict[str, int] = {}
+        by_thread: dict[str, list[tuple[list[int], int]]] = {}
+        for stack, count in self.counts.items():
+            indices = []
+            for label in stack[1:]:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indices.append(frame_index[label])
+            by_thread.setdefault(stack[0], []).append((indices, count))
+
+        interval_ms = self.interval * 1000
+        duration_ms = (self.stopped - self.started) * 1000
+        profiles = []
+        for thread_name, samples in sorted(by_thread.items()):
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": duration_ms,
+                "samples": [indices for indices, _ in samples],
+                "weights": [count * interval_ms for _, count in samples]
+            })
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": f"web-agent {'session ' + self.session_id if self.session_id else 'process'}",
+            "exporter": "web-agent",
+            "shared": {"frames": frames},
+            "profiles": profiles
+        }
+
+
+def _pstats_text(stats: pstats.Stats, limit: int = 60) -> str:
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(limit)
+    return out.getvalue()
+
+
+async def _profile_sample(seconds: float, session_id: Optional[str], interval_ms: float, fmt: str) -> tuple[bytes, str]:
+    sampler = StackSampler(interval_ms, session_id)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(sampler.stop)
+    if fmt == "speedscope":
+        return json.dumps(sampler.speedscope()).encode(), "application/json"
+    return sampler.collapsed().encode(), "text/plain"
+
+
+async def _profile_cprofile(seconds: float, fmt: str) -> tuple[bytes, str]:
+    # Enabled on the event loop thread, so every coroutine and callback is covered
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+    if fmt == "text":
+        return _pstats_text(pstats.Stats(profiler)).encode(), "text/plain"
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats), "application/octet-stream"
+
+
+async def _profile_yappi(seconds: float, session_id: Optional[str], fmt: str) -> tuple[bytes, str]:
+    try:
+        import yappi
+    except ImportError:
+        raise ProfilerError("yappi is not installed (pip install yappi)")
+
+    yappi.clear_stats()
+    yappi.set_clock_type("wall")
+    if session_id is not None:
+        yappi.set_tag_callback(lambda: 1 if current_session.get() == session_id else 0)
+    yappi.start(builtins=False, profile_threads=True)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        yappi.stop()
+        yappi.set_tag_callback(None)
+    try:
+        stats = yappi.get_func_stats(filter={"tag": 1} if session_id is not None else None)
+        with tempfile.NamedTemporaryFile(suffix=".prof", delete=False) as f:
+            path = f.name
+        try:
+            stats.save(path, type="pstat")
+            if fmt == "text":
+                return _pstats_text(pstats.Stats(path)).encode(), "text/plain"
+            with open(path, "rb") as f:
+                return f.read(), "application/octet-stream"
+        finally:
+            os.unlink(path)
+    finally:
+        yappi.clear_stats()
+
+
+async def take_profile(
+    seconds: float,
+    mode: str = "sample",
+    fmt: Optional[str] = None,
+    session_id: Optional[str] = None,
+    interval_ms: float = 5.0
+) -> tuple[bytes, str, str]:
+    """Profile the process (or one session) for a while. Returns (artifact, media type, file name)."""
+    if mode not in PROFILE_FORMATS:
+        raise ProfilerError(f"Unknown profiler '{mode}' (use one of: {', '.join(PROFILE_FORMATS)})")
+    fmt = fmt or PROFILE_FORMATS[mode][0]
+    if fmt not in PROFILE_FORMATS[mode]:
+        raise ProfilerError(f"The {mode} profiler exports {' or '.join(PROFILE_FORMATS[mode])}, not {fmt}")
+    if mode == "cprofile" and session_id is not None:
+        raise ProfilerError("cProfile can't be scoped to a session - use the sample or yappi profiler")
+
+    # Profilers are process-global - only one at a time
+    if _profile_lock.locked():
+        raise ProfilerError("A profile is already being taken")
+    async with _profile_lock:
+        if mode == "sample":
+            artifact, media_type = await _profile_sample(seconds, session_id, interval_ms, fmt)
+        elif mode == "cprofile":
+            artifact, media_type = await _profile_cprofile(seconds, fmt)
+        else:
+            artifact, media_type = await _profile_yappi(seconds, session_id, fmt)
+
+    extension = {"collapsed": "txt", "speedscope": "speedscope.json", "pstats": "prof", "text": "txt"}[fmt]
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    return artifact, media_type, f"profile-{mode}-{session_id or 'process'}-{stamp}.{extension}"
+
+
+class LoopWatchdog:
+    """
+    Detects callbacks that block the event loop. A heartbeat is scheduled on
+    the loop; a watchdog thread checks that it keeps arriving and, when it is
+    late by more than the threshold, captures the loop thread's current stack.
+    """
+
+    THREAD_NAME = "loop-watchdog"
+
+    def __init__(self, threshold_ms: float, history: int = 50):
+        self.threshold = threshold_ms / 1000
+        self.interval = max(0.01, self.threshold / 4)
+        self.stalls: deque[dict] = deque(maxlen=history)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._last_beat = 0.0
+        self._current: Optional[dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start watching the running loop (call from the loop thread)"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._loop.call_soon(self._beat)
+        self._thread = threading.Thread(target=self._watch, name=self.THREAD_NAME, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        stall = self._current
+        if stall is not None:
+            self._current = None
+            stall["blocked_ms"] = int((now - stall["_since"]) * 1000)
+            del stall["_since"]
+            print(f"⚠️  Event loop was blocked for {stall['blocked_ms']}ms (stack logged above)")
+        self._last_beat = now
+        if not self._stop.is_set():
+            self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            since = self._last_beat + self.interval
+            late = time.monotonic() - since
+            if late <= self.threshold or self._current is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)
+            stall = {
+                "detected_at": datetime.utcnow().isoformat(),
+                "blocked_ms": int(late * 1000),
+                "session_id": _frame_session(_frames_outermost_first(frame)),
+                "stack": [line.rstrip() for line in stack],
+                "_since": since
+            }
+            self._current = stall
+            self.stalls.append(stall)
+            print(f"⚠️  Event loop blocked for more than {int(self.threshold * 1000)}ms, currently in:\n{''.join(stack[-12:])}")
+
+    def report(self) -> list[dict]:
+        return [{k: v for k, v in stall.items() if not k.startswith("_")} for stall in self.stalls]
@@ -0,0 +1,253 @@
+"""
+Compact, ranked repository map for the system prompt.
+
+Gives the agent its bearings without spending iterations on
+explore_project_structure/list_files: the most important files with their
+top-level symbols, truncated to a token budget. Maps are cached on disk,
+keyed by git HEAD plus a hash of the dirty files (or of the file listing for
+non-git workspaces), so they are only rebuilt when the workspace changes.
+"""
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.private_dirs import private_temp_dir
+
+IGNORE_DIRS = {
+    'node_modules', '__pycache__', '.git', '.venv', 'venv',
+    'env', '.pytest_cache', '.mypy_cache', 'dist', 'build',
+    '.next', '.nuxt', 'coverage', '.coverage', 'htmlcov'
+}
+
+SOURCE_EXTENSIONS = {
+    ".py", ".ts", ".tsx", ".js", ".jsx", ".go", ".rs", ".java", ".kt",
+    ".rb", ".php", ".c", ".h", ".cpp", ".hpp", ".cs", ".swift", ".scala"
+}
+
+# Files that tell the agent the most about a project, wherever they live
+KEY_FILES = {
+    "readme.md": 50, "pyproject.toml": 40, "package.json": 40, "setup.py": 30,
+    "requirements.txt": 30, "cargo.toml": 40, "go.mod": 40, "dockerfile": 25,
+    "docker-compose.yml": 25, "makefile": 25, "plan.md": 30, "todo.md": 30,
+    "tsconfig.json": 15, "vite.config.ts": 10,
+}
+ENTRY_POINTS = {"main", "app", "index", "server", "cli", "__main__", "manage", "routes", "models"}
+
+MAX_FILES_SCANNED = 5000
+MAX_SYMBOL_FILE_BYTES = 200_000
+MAX_SYMBOLS_PER_FILE = 12
+
+JS_SYMBOL = re.compile(
+    r"^export\s+(?:default\s+)?(?:async\s+)?(?:function\*?|class|const|let|interface|type|enum)\s+([A-Za-z_$][\w$]*)",
+    re.MULTILINE
+)
+GO_SYMBOL = re.compile(r"^(?:func(?:\s+\([^)]*\))?|type)\s+([A-Z]\w*)", re.MULTILINE)
+RUST_SYMBOL = re.compile(r"^pub\s+(?:async\s+)?(?:fn|struct|enum|trait|type)\s+(\w+)", re.MULTILINE)
+
+
+def _git(workspace: Path, *args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", *args], cwd=workspace, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def list_workspace_files(workspace: Path) -> list[str]:
+    """Relative paths of the workspace's files (git's view when available)"""
+    tracked = _git(workspace, "ls-files", "--cached", "--others", "--exclude-standard")
+    if tracked is not None:
+        return [p for p in tracked.splitlines() if p][:MAX_FILES_SCANNED]
+
+    files = []
+    for root, dirs, names in os.walk(workspace):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORE_DIRS and not d.startswith("."))
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            files.append(os.path.relpath(os.path.join(root, name), workspace))
+            if len(files) >= MAX_FILES_SCANNED:
+                return files
+    return files
+
+
+def workspace_fingerprint(workspace: Path, files: list[str]) -> str:
+    """Cache key: git HEAD + dirty-file state, or the file listing's stat info"""
+    digest = hashlib.sha256()
+    head = _git(workspace, "rev-parse", "HEAD")
+    toplevel = _git(workspace, "rev-parse", "--show-toplevel") if head is not None else None
+    # Limited to the workspace, with every untracked file listed on its own
+    status = _git(workspace, "status", "--porcelain", "-z", "--untracked-files=all", "--", ".") if toplevel else None
+
+    if head is not None and toplevel and status is not None:
+        digest.update(head.encode())
+        # Paths are relative to the repository root, which may be above the workspace
+        root = Path(toplevel.strip())
+        entries = iter(status.split("\0"))
+        # Dirty files can change without the status line changing - hash their stat too
+        for entry in entries:
+            if not entry:
+                continue
+            digest.update(entry.encode())
+            if "R" in entry[:2] or "C" in entry[:2]:
+                next(entries, None)  # Rename/copy source path
+            try:
+                stat = (root / entry[3:]).stat()
+                digest.update(f"{stat.st_mtime_ns}:{stat.st_size}".encode())
+            except OSError:
+                pass
+    else:
+        for path in files:
+            try:
+                stat = (workspace / path).stat()
+            except OSError:
+                continue
+            digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+
+    return digest.hexdigest()
+
+
+def extract_symbols(path: Path) -> list[str]:
+    """Top-level classes/functions (with class methods for Python)"""
+    try:
+        if path.stat().st_size > MAX_SYMBOL_FILE_BYTES:
+            return []
+        source = path.read_text(encoding="utf-8", errors="replace")
+    except OSError:
+        return []
+
+    suffix = path.suffix
+    if suffix == ".py":
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return []
+        symbols = []
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef):
+                methods = [
+                    n.name for n in node.body
+                    if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and not n.name.startswith("_")
+                ]
+                symbols.append(f"class {node.name}" + (f"({', '.join(methods[:6])})" if methods else ""))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith("_"):
+                symbols.append(f"def {node.name}")
+        return symbols[:MAX_SYMBOLS_PER_FILE]
+
+    if suffix in (".ts", ".tsx", ".js", ".jsx"):
+        pattern = JS_SYMBOL
+    elif suffix == ".go":
+        pattern = GO_SYMBOL
+    elif suffix == ".rs":
+        pattern = RUST_SYMBOL
+    else:
+        return []
+    return list(dict.fromkeys(pattern.findall(source)))[:MAX_SYMBOLS_PER_FILE]
+
+
+def score_file(path: str) -> float:
+    parts = Path(path).parts
+    name = parts[-1].lower()
+    stem = Path(name).stem
+    suffix = Path(name).suffix
+
+    if any(part in IGNORE_DIRS for part in parts):
+        return -1
+
+    score = KEY_FILES.get(name, 0)
+    if suffix in SOURCE_EXTENSIONS:
+        score += 20
+    if stem in ENTRY_POINTS:
+        score += 15
+    if "test" in name or any(part in ("tests", "test", "__tests__") for part in parts):
+        score -= 10
+    if name.endswith((".lock", ".map", ".min.js", ".svg", ".png", ".jpg", ".ico", "-lock.json")):
+        score -= 30
+    # Shallow files describe the project better than deeply nested ones
+    score -= 3 * (len(parts) - 1)
+    return score
+
+
+def build_repo_map(workspace: Path, files: list[str], max_tokens: int) -> str:
+    ranked = sorted(
+        (path for path in files if score_file(path) >= 0),
+        key=lambda path: (-score_file(path), path)
+    )
+
+    budget_chars = max_tokens * 4
+    lines = []
+    used = 0
+    shown = 0
+    for path in ranked:
+        full_path = workspace / path
+        symbols = extract_symbols(full_path) if full_path.suffix in SOURCE_EXTENSIONS else []
+        line = path + (f": {'; '.join(symbols)}" if symbols else "")
+        if used + len(line) + 1 > budget_chars:
+            # Try the bare path before giving up on the entry
+            line = path
+            if used + len(line) + 1 > budget_chars:
+                break
+        lines.append(line)
+        used += len(line) + 1
+        shown += 1
+
+    if shown < len(ranked):
+        lines.append(f"... and {len(ranked) - shown} more files")
+    return "\n".join(lines)
+
+
+def cache_path(workspace: Path) -> Path:
+    # Cached maps go into the system prompt verbatim - by default only this user may write them
+    if settings.repo_map_cache_dir:
+        directory = Path(settings.repo_map_cache_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+    else:
+        directory = private_temp_dir("repo-maps")
+    return directory / f"{hashlib.sha256(str(workspace).encode()).hexdigest()[:32]}.json"
+
+
+def get_repo_map_sync(workspace: Path, max_tokens: int) -> str:
+    workspace = workspace.resolve()
+    files = list_workspace_files(workspace)
+    if not files:
+        return ""
+
+    key = f"{workspace_fingerprint(workspace, files)}:{max_tokens}"
+    try:
+        path = cache_path(workspace)
+    except OSError as e:
+        print(f"⚠️  Repository map cache unavailable: {e}")
+        return build_repo_map(workspace, files, max_tokens)
+    try:
+        cached = json.loads(path.read_text())
+        if cached.get("key") == key:
+            return cached["map"]
+    except (OSError, ValueError):
+        pass
+
+    repo_map = build_repo_map(workspace, files, max_tokens)
+    try:
+        path.write_text(json.dumps({"key": key, "map": repo_map}))
+    except OSError as e:
+        print(f"⚠️  Could not cache repository map: {e}")
+    return repo_map
+
+
+async def get_repo_map(workspace: Path) -> str:
+    """Ranked repository map of a workspace (empty if disabled or the workspace is empty)"""
+    if not settings.repo_map_max_tokens:
+        return ""
+    try:
+        return await asyncio.to_thread(get_repo_map_sync, workspace, settings.repo_map_max_tokens)
+    except Exception as e:
+        print(f"⚠️  Could not build repository map: {e}")
+        return ""
@@ -0,0 +1,140 @@
+"""
+Exact-match cache of LLM responses.
+
+Deterministic requests - temperature 0, or callers that explicitly allow it
+(RESPONSE_CACHE_AGENT_TYPES) - are answered from disk when a byte-for-byte
+equivalent request was answered before: same model, sampling params, tools
+and messages (hashed with sorted keys, so key order doesn't matter).
+
+Entries are one JSON file each. They are evicted least recently used first
+once the cache grows beyond RESPONSE_CACHE_MAX_MB; a hit refreshes the
+file's mtime, which is what recency is ordered by when the index is rebuilt
+(e.g. after a restart). Cache failures are logged and treated as misses.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import orjson
+
+from app.config import settings
+from app.private_dirs import private_temp_dir
+
+
+def request_key(params: dict, messages_digest: str) -> str:
+    """Cache key of a request: its params (model, sampling, tools) and messages"""
+    return hashlib.sha256(orjson.dumps(params, option=orjson.OPT_SORT_KEYS) + messages_digest.encode()).hexdigest()
+
+
+class ResponseCache:
+    """On-disk LRU of key → response, bounded by total size"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[str, int]"] = None  # key → size, least recent first
+        self._directory: Optional[Path] = None  # Resolved (and checked) with the index
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def directory(self) -> Path:
+        # Responses are replayed to the agent as-is - by default only this user may write them
+        if not settings.response_cache_dir:
+            return private_temp_dir("responses")
+        directory = Path(settings.response_cache_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def _load_index(self) -> "OrderedDict[str, int]":
+        if self._index is None:
+            self._directory = self.directory
+            entries = []
+            for entry in os.scandir(self._directory):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+            self._index = OrderedDict((key, size) for _, key, size in sorted(entries))
+            self._bytes = sum(self._index.values())
+        return self._index
+
+    def _path(self, key: str) -> Path:
+        return self._directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached response of a request, or None (blocking)"""
+        with self._lock:
+            index = self._load_index()
+            try:
+                data = orjson.loads(self._path(key).read_bytes())
+                os.utime(self._path(key))
+            except (OSError, orjson.JSONDecodeError):
+                # Unknown, or evicted by another process sharing the directory
+                if key in index:
+                    self._bytes -= index.pop(key)
+                self.misses += 1
+                return None
+            if key not in index:
+                index[key] = self._path(key).stat().st_size
+                self._bytes += index[key]
+            index.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, response: dict) -> None:
+        """Store a response and evict the least recently used entries beyond the size limit (blocking)"""
+        body = orjson.dumps(response)
+        limit = settings.response_cache_max_mb * 1024 * 1024
+        if len(body) > limit:
+            return
+        with self._lock:
+            index = self._load_index()
+            fd, tmp = tempfile.mkstemp(dir=self._directory, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(tmp, self._path(key))
+            self._bytes += len(body) - index.pop(key, 0)
+            index[key] = len(body)
+            self.stores += 1
+
+            while self._bytes > limit and index:
+                old_key, size = index.popitem(last=False)
+                self._path(old_key).unlink(missing_ok=True)
+                self._bytes -= size
+                self.evictions += 1
+
+    def clear(self) -> int:
+        """Delete every entry (blocking). Returns how many were removed."""
+        with self._lock:
+            index = self._load_index()
+            removed = len(index)
+            for key in index:
+                self._path(key).unlink(missing_ok=True)
+            index.clear()
+            self._bytes = 0
+            return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            index = self._load_index() if settings.response_cache_enabled else (self._index or {})
+            lookups = self.hits + self.misses
+            return {
+                "enabled": settings.response_cache_enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(index),
+                "bytes": self._bytes,
+                "max_bytes": settings.response_cache_max_mb * 1024 * 1024
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,76 @@
+"""
+Admin diagnostics routes - on-demand profiling, event-loop stall reports and
+response cache metrics.
+Disabled unless ADMIN_TOKEN is set; requests must send it as X-Admin-Token.
+"""
+import asyncio
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from app.config import settings
+from app.profiler import ProfilerError, take_profile
+from app.response_cache import response_cache
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+class ProfileRequest(BaseModel):
+    seconds: float = 10
+    profiler: str = "sample"  # "sample", "cprofile" or "yappi"
+    format: Optional[str] = None  # sample: collapsed/speedscope, cprofile/yappi: pstats/text
+    session_id: Optional[str] = None  # Only profile this session's run (sample and yappi)
+    interval_ms: float = 5  # Sampling interval of the sample profiler
+
+
+@router.post("/profile", dependencies=[Depends(require_admin)])
+async def profile(data: ProfileRequest):
+    """Profile the running process (or one session) for a number of seconds and return the artifact"""
+    if not 0 < data.seconds <= settings.profile_max_seconds:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {settings.profile_max_seconds}")
+    if not 1 <= data.interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms must be between 1 and 1000")
+
+    try:
+        artifact, media_type, filename = await take_profile(
+            data.seconds, data.profiler, data.format, data.session_id, data.interval_ms
+        )
+    except ProfilerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return Response(
+        content=artifact,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/slow-callbacks", dependencies=[Depends(require_admin)])
+async def slow_callbacks(request: Request):
+    """Recent event-loop stalls with the stack that was blocking the loop"""
+    watchdog = getattr(request.app.state, "loop_watchdog", None)
+    if watchdog is None:
+        return {"enabled": False, "threshold_ms": settings.slow_callback_ms, "stalls": []}
+    return {"enabled": True, "threshold_ms": settings.slow_callback_ms, "stalls": watchdog.report()}
+
+
+@router.get("/response-cache", dependencies=[Depends(require_admin)])
+async def response_cache_stats():
+    """Hit/miss counts and size of the LLM response cache"""
+    return await asyncio.to_thread(response_cache.stats)
+
+
+@router.delete("/response-cache", dependencies=[Depends(require_admin)])
+async def clear_response_cache():
+    """Drop every cached response"""
+    return {"removed": await asyncio.to_thread(response_cache.clear)}
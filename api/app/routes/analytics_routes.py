@@ -0,0 +1,132 @@
+"""
+Usage analytics routes, answered from the daily usage rollups
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.db_models import LLMCall, UsageRollup
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+GROUP_COLUMNS = {
+    "day": UsageRollup.day,
+    "workspace": UsageRollup.workspace,
+    "model": UsageRollup.model,
+    "session": UsageRollup.session_id,
+}
+
+
+def _totals(rollups_query):
+    return rollups_query.with_entities(
+        func.coalesce(func.sum(UsageRollup.calls), 0).label("calls"),
+        func.coalesce(func.sum(UsageRollup.input_tokens), 0).label("input_tokens"),
+        func.coalesce(func.sum(UsageRollup.output_tokens), 0).label("output_tokens"),
+        func.coalesce(func.sum(UsageRollup.cached_tokens), 0).label("cached_tokens"),
+        func.coalesce(func.sum(UsageRollup.latency_ms), 0).label("latency_ms"),
+        func.coalesce(func.sum(UsageRollup.cost), 0.0).label("cost"),
+    )
+
+
+def _serialize(row, key: Optional[str] = None) -> dict:
+    result = {
+        "calls": int(row.calls),
+        "input_tokens": int(row.input_tokens),
+        "output_tokens": int(row.output_tokens),
+        "cached_tokens": int(row.cached_tokens),
+        "total_tokens": int(row.input_tokens) + int(row.output_tokens),
+        "cost": round(float(row.cost), 6),
+        "avg_latency_ms": round(int(row.latency_ms) / row.calls) if row.calls else 0,
+    }
+    if key is not None:
+        value = getattr(row, key)
+        result[key] = value.isoformat() if isinstance(value, date) else value
+    return result
+
+
+def _filtered(
+    db: Session,
+    days: int,
+    workspace: Optional[str],
+    model: Optional[str],
+    session_id: Optional[str]
+):
+    query = db.query(UsageRollup).filter(UsageRollup.day >= datetime.now(timezone.utc).date() - timedelta(days=max(1, days) - 1))
+    if workspace:
+        query = query.filter(UsageRollup.workspace == workspace)
+    if model:
+        query = query.filter(UsageRollup.model == model)
+    if session_id:
+        query = query.filter(UsageRollup.session_id == session_id)
+    return query
+
+
+@router.get("/summary")
+async def usage_summary(
+    days: int = 30,
+    workspace: Optional[str] = None,
+    model: Optional[str] = None,
+    session_id: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Total usage and cost over the last `days` days"""
+    row = _totals(_filtered(db, days, workspace, model, session_id)).one()
+    return {"days": days, **_serialize(row)}
+
+
+@router.get("/by-{group}")
+async def usage_by_group(
+    group: str,
+    days: int = 30,
+    workspace: Optional[str] = None,
+    model: Optional[str] = None,
+    session_id: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Usage and cost grouped by day, workspace, model or session (e.g. /by-workspace?days=7)"""
+    column = GROUP_COLUMNS.get(group)
+    if column is None:
+        raise HTTPException(status_code=404, detail=f"Unknown grouping: {group}")
+
+    rows = (
+        _totals(_filtered(db, days, workspace, model, session_id))
+        .add_columns(column.label(group))
+        .group_by(column)
+        .order_by(column if group == "day" else func.sum(UsageRollup.cost).desc())
+        .limit(min(max(1, limit), 1000))
+        .all()
+    )
+    return {"days": days, "group": group, "rows": [_serialize(row, group) for row in rows]}
+
+
+@router.get("/sessions/{session_id}/calls")
+async def session_calls(session_id: str, limit: int = 200, db: Session = Depends(get_db)):
+    """Individual LLM calls of a session, newest first"""
+    calls = (
+        db.query(LLMCall)
+        .filter(LLMCall.session_id == session_id)
+        .order_by(LLMCall.id.desc())
+        .limit(min(max(1, limit), 1000))
+        .all()
+    )
+    return {
+        "calls": [
+            {
+                "id": call.id,
+                "model": call.model,
+                "agent_type": call.agent_type,
+                "input_tokens": call.input_tokens,
+                "output_tokens": call.output_tokens,
+                "cached_tokens": call.cached_tokens,
+                "latency_ms": call.latency_ms,
+                "cost": call.cost,
+                "created_at": call.created_at
+            }
+            for call in calls
+        ]
+    }
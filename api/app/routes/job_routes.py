@@ -0,0 +1,109 @@
+"""
+Headless job queue routes - run agents from CI and scripts without a WebSocket
+"""
+import asyncio
+import json
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.config import settings
+from app.job_queue import (
+    FINISHED_STATUSES,
+    enqueue_job,
+    get_job,
+    get_job_events,
+    list_jobs,
+    notify_job_enqueued,
+    request_cancel
+)
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+class JobCreate(BaseModel):
+    prompt: str
+    workspace: Optional[str] = None
+    agent_type: str = "building"  # "planning" or "building"
+    priority: int = 0  # Higher runs first
+
+
+@router.post("")
+async def create_job(data: JobCreate):
+    """Enqueue a headless agent run"""
+    if not data.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt must not be empty")
+
+    workspace = data.workspace or settings.default_workspace
+    Path(workspace).mkdir(parents=True, exist_ok=True)
+    agent_type = data.agent_type if data.agent_type in ["planning", "building"] else "building"
+
+    job = await asyncio.to_thread(enqueue_job, data.prompt, workspace, agent_type, data.priority)
+    notify_job_enqueued()
+    return job
+
+
+@router.get("")
+async def get_jobs(status: Optional[str] = None, limit: int = 50):
+    """List jobs, most recent first"""
+    return {"jobs": await asyncio.to_thread(list_jobs, status, min(max(1, limit), 500))}
+
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str):
+    """Status, result and cost of a job"""
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}/events")
+async def get_events(job_id: str, after: int = 0, limit: int = 500):
+    """Poll a job's events - pass the last seen `seq` as `after`"""
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    events = await asyncio.to_thread(get_job_events, job_id, after, min(max(1, limit), 1000))
+    return {"job_id": job_id, "status": job["status"], "events": events}
+
+
+@router.get("/{job_id}/stream")
+async def stream_events(job_id: str, after: int = 0):
+    """
+    Stream a job's events as NDJSON until it finishes. The last line is the
+    final job record ({"type": "job", ...}).
+    """
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def lines():
+        last_seq = after
+        while True:
+            # Read the status first so events written just before finishing aren't missed
+            job = await asyncio.to_thread(get_job, job_id)
+            events = await asyncio.to_thread(get_job_events, job_id, last_seq)
+            for event in events:
+                last_seq = event["seq"]
+                yield json.dumps(event) + "\n"
+            if events:
+                continue
+            if job is None or job["status"] in FINISHED_STATUSES:
+                yield json.dumps({"type": "job", **(job or {"id": job_id, "status": "deleted"})}) + "\n"
+                return
+            await asyncio.sleep(settings.job_poll_interval_seconds)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or stop a running one at its worker's next heartbeat"""
+    job = await asyncio.to_thread(request_cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
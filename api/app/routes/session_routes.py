@@ -7,6 +7,7 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 
+from app.archival import ensure_session_hot
 from app.database import get_db
 from app.db_models import (
     Session as DBSession,
@@ -37,6 +38,9 @@ class ToolCallCreate(BaseModel):
     result: Optional[str] = None
     success: bool = True
     error: Optional[str] = None
+    execution_time_ms: Optional[int] = None
+    cpu_seconds: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
 
 
 class FileChangeCreate(BaseModel):
@@ -54,6 +58,15 @@ class TokenUsageCreate(BaseModel):
     estimated_cost: float
 
 
+async def ensure_hot(session: DBSession, db: Session) -> None:
+    """Rehydrate an archived session before its data is read or added to"""
+    if session.archived_at is None:
+        return
+    if await ensure_session_hot(session.id) is None:
+        raise HTTPException(status_code=503, detail="Archived session could not be restored")
+    db.refresh(session)
+
+
 # Session endpoints
 @router.post("/{session_id}/init")
 async def initialize_session(session_id: str, data: SessionCreate, db: Session = Depends(get_db)):
@@ -87,6 +100,7 @@ async def save_message(session_id: str, message: MessageCreate, db: Session = De
     session = db.query(DBSession).filter(DBSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    await ensure_hot(session, db)
 
     db_message = DBMessage(
         session_id=session_id,
@@ -107,6 +121,7 @@ async def save_tool_call(session_id: str, tool_call: ToolCallCreate, db: Session
     session = db.query(DBSession).filter(DBSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    await ensure_hot(session, db)
 
     db_tool_call = DBToolCall(
         session_id=session_id,
@@ -114,7 +129,10 @@ async def save_tool_call(session_id: str, tool_call: ToolCallCreate, db: Session
         arguments=tool_call.arguments,
         result=tool_call.result,
         success=tool_call.success,
-        error=tool_call.error
+        error=tool_call.error,
+        execution_time_ms=tool_call.execution_time_ms,
+        cpu_seconds=tool_call.cpu_seconds,
+        peak_rss_mb=tool_call.peak_rss_mb
     )
     db.add(db_tool_call)
     db.commit()
@@ -129,6 +147,7 @@ async def save_file_change(session_id: str, file_change: FileChangeCreate, db: S
     session = db.query(DBSession).filter(DBSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    await ensure_hot(session, db)
 
     db_file_change = DBFileChange(
         session_id=session_id,
@@ -151,6 +170,7 @@ async def save_token_usage(session_id: str, token_usage: TokenUsageCreate, db: S
     session = db.query(DBSession).filter(DBSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    await ensure_hot(session, db)
 
     db_token_usage = DBTokenUsage(
         session_id=session_id,
@@ -169,6 +189,9 @@ async def save_token_usage(session_id: str, token_usage: TokenUsageCreate, db: S
 @router.get("/{session_id}/messages")
 async def get_messages(session_id: str, db: Session = Depends(get_db)):
     """Get all messages for a session"""
+    session = db.query(DBSession).filter(DBSession.id == session_id).first()
+    if session:
+        await ensure_hot(session, db)
     messages = db.query(DBMessage).filter(DBMessage.session_id == session_id).order_by(DBMessage.created_at).all()
     return {
         "messages": [
@@ -187,6 +210,9 @@ async def get_messages(session_id: str, db: Session = Depends(get_db)):
 @router.get("/{session_id}/token-usage/latest")
 async def get_latest_token_usage(session_id: str, db: Session = Depends(get_db)):
     """Get the latest token usage for a session"""
+    session = db.query(DBSession).filter(DBSession.id == session_id).first()
+    if session:
+        await ensure_hot(session, db)
     token_usage = (
         db.query(DBTokenUsage)
         .filter(DBTokenUsage.session_id == session_id)
@@ -212,6 +238,7 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
     session = db.query(DBSession).filter(DBSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    await ensure_hot(session, db)
 
     return {
         "id": session.id,
@@ -239,7 +266,8 @@ async def list_recent_sessions(limit: int = 20, db: Session = Depends(get_db)):
                 "workspace": session.workspace,
                 "agent_type": session.agent_type,
                 "created_at": session.created_at,
-                "updated_at": session.updated_at
+                "updated_at": session.updated_at,
+                "archived": session.archived_at is not None
             }
             for session in sessions
         ]
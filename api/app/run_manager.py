@@ -0,0 +1,264 @@
+"""
+Session run manager.
+
+Agent runs are launched as supervised background tasks, independent of any
+WebSocket connection. Every event a run produces is fanned out to all
+subscribers of the session through per-subscriber bounded queues, so a slow
+client never applies backpressure to the agent loop itself.
+"""
+import asyncio
+import traceback
+from collections import defaultdict, deque
+from typing import Any, Coroutine, Dict, Optional, Set
+
+from app.agent_loop import run_agent, close_pending_tool_calls
+from app.config import settings
+from app.models import StatusMessage, ThinkingMessage, ErrorMessage, CancelledMessage, to_event_payload, expand_file_changes
+from app.orchestrator import orchestrate
+from app.profiler import session_context
+
+# Events that are superseded by a later event of the same type. These are the
+# first to be coalesced or dropped when a subscriber falls behind.
+EPHEMERAL_EVENT_TYPES = {"status", "thinking", "token_usage"}
+
+
+def coalesce_events(events: list[dict]) -> list[dict]:
+    """
+    Merge superseding events of one flush tick: only the latest token_usage
+    is kept, and consecutive status/thinking events of the same source
+    collapse into the last one (token_usage in between doesn't count).
+    Everything else is passed through in order.
+    """
+    result: list[dict] = []
+    latest_usage = None
+    usage_at = 0
+    for event in events:
+        if event["type"] == "token_usage":
+            latest_usage, usage_at = event, len(result)
+            continue
+        if (
+            event["type"] in ("status", "thinking")
+            and result
+            and result[-1]["type"] in ("status", "thinking")
+            and result[-1].get("source") == event.get("source")
+        ):
+            result.pop()
+            usage_at = min(usage_at, len(result))
+        result.append(event)
+    if latest_usage is not None:
+        result.insert(usage_at, latest_usage)
+    return result
+
+
+class EventSubscriber:
+    """A bounded, coalescing event queue for a single consumer (e.g. one WebSocket)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self.dropped = 0
+        self._events: deque[dict] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def push(self, event: dict) -> None:
+        """Enqueue an event without ever blocking the publisher"""
+        if self._closed:
+            return
+
+        if len(self._events) >= self.maxsize:
+            self._make_room(event)
+
+        self._events.append(event)
+        self._ready.set()
+
+    def _make_room(self, event: dict) -> None:
+        # token_usage is cumulative, so a newer one fully replaces a pending one
+        if event["type"] == "token_usage":
+            for pending in self._events:
+                if pending["type"] == "token_usage":
+                    self._events.remove(pending)
+                    return
+
+        # Otherwise drop the oldest ephemeral event
+        for pending in self._events:
+            if pending["type"] in EPHEMERAL_EVENT_TYPES:
+                self._events.remove(pending)
+                return
+
+        # Nothing safe to drop - the subscriber is lagging, lose the oldest event
+        self._events.popleft()
+        self.dropped += 1
+
+    async def get(self) -> Optional[dict]:
+        """Wait for the next event. Returns None once the subscriber is closed."""
+        while not self._events:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return StatusMessage(
+                content=f"Connection too slow - {dropped} event(s) were dropped",
+                done=False
+            ).model_dump()
+
+        return self._events.popleft()
+
+    def drain(self) -> list[dict]:
+        """Take every event that is already pending, without waiting"""
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
+
+
+class RunManager:
+    """Owns the background agent runs and the event subscribers of every session"""
+
+    def __init__(self, queue_size: int = settings.subscriber_queue_size):
+        self.queue_size = queue_size
+        self._runs: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, Set[EventSubscriber]] = defaultdict(set)
+
+    def subscribe(self, session_id: str) -> EventSubscriber:
+        subscriber = EventSubscriber(self.queue_size)
+        self._subscribers[session_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, session_id: str, subscriber: EventSubscriber) -> None:
+        subscriber.close()
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def publish(self, session_id: str, event: dict) -> None:
+        """Fan an event out to every subscriber of the session"""
+        for subscriber in list(self._subscribers.get(session_id, ())):
+            subscriber.push(event)
+
+    def is_running(self, session_id: str) -> bool:
+        task = self._runs.get(session_id)
+        return task is not None and not task.done()
+
+    def is_active(self, session_id: str) -> bool:
+        """True while a run is in flight or any client is subscribed"""
+        return self.is_running(session_id) or bool(self._subscribers.get(session_id))
+
+    def start(self, session_id: str, session: Dict[str, Any], user_message: str) -> asyncio.Task:
+        """Launch an agent run for the session in the background"""
+        return self._launch(session_id, self._drive(session_id, session, user_message))
+
+    def start_orchestration(self, session_id: str, session: Dict[str, Any], tasks: Optional[list] = None) -> asyncio.Task:
+        """Launch an orchestrated run (parallel building agents) for the session in the background"""
+        return self._launch(session_id, self._supervise(
+            session_id, orchestrate(session_id, session, tasks, lambda event: self.publish(session_id, event))
+        ))
+
+    def _launch(self, session_id: str, run: Coroutine) -> asyncio.Task:
+        if self.is_running(session_id):
+            run.close()
+            raise RuntimeError("An agent run is already in progress for this session")
+
+        task = asyncio.create_task(run, name=f"agent-run-{session_id}", context=session_context(session_id))
+        self._runs[session_id] = task
+        task.add_done_callback(lambda t: self._on_run_done(session_id, t))
+        return task
+
+    async def cancel(self, session_id: str) -> bool:
+        """
+        Cancel the in-flight run of a session and wait for it to wind down.
+        Returns False if nothing was running.
+        """
+        task = self._runs.get(session_id)
+        if task is None or task.done():
+            return False
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    def _on_run_done(self, session_id: str, task: asyncio.Task) -> None:
+        if self._runs.get(session_id) is task:
+            del self._runs[session_id]
+
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Agent run for session {session_id} crashed: {task.exception()}")
+
+    async def _drive(self, session_id: str, session: Dict[str, Any], user_message: str) -> None:
+        self.publish(session_id, ThinkingMessage().model_dump())
+        self.publish(session_id, StatusMessage(
+            content="Processing your request...",
+            done=False
+        ).model_dump())
+
+        # run_agent appends to this list as it goes, so partial progress survives cancellation
+        history = session["history"].copy()
+
+        async def run():
+            async for event_dict in run_agent(
+                user_message=user_message,
+                workspace=session["workspace"],
+                history=history,
+                agent_type=session.get("agent_type", "building"),
+                cumulative_tokens=session.get("token_usage"),
+                session_id=session_id
+            ):
+                # Convert dict → proper model (for validation & serialization)
+                payload = to_event_payload(event_dict)
+
+                # Track file changes
+                session["changes"].extend(expand_file_changes(payload))
+
+                # Update cumulative token usage in session
+                if payload["type"] == "token_usage":
+                    session["token_usage"] = {
+                        "input_tokens": payload["input_tokens"],
+                        "output_tokens": payload["output_tokens"],
+                        "estimated_cost": payload["estimated_cost"]
+                    }
+
+                self.publish(session_id, payload)
+
+        try:
+            await self._supervise(session_id, run())
+        finally:
+            session["history"] = close_pending_tool_calls(history)
+
+    async def _supervise(self, session_id: str, run: Coroutine) -> None:
+        """Turn cancellation and crashes of a run into events for the subscribers"""
+        try:
+            await run
+        except asyncio.CancelledError:
+            # Cancellation interrupts the pending LLM request or tool execution
+            self.publish(session_id, CancelledMessage().model_dump())
+            raise
+        except Exception as e:
+            error_msg = f"Agent loop error: {str(e)}"
+            print(error_msg)  # server log
+            traceback.print_exc()
+            self.publish(session_id, ErrorMessage(
+                content=error_msg,
+                fatal=False
+            ).model_dump())
+
+    async def shutdown(self) -> None:
+        """Cancel all in-flight runs and release subscribers (called on app shutdown)"""
+        tasks = list(self._runs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for subscribers in self._subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+        self._subscribers.clear()
+
+
+run_manager = RunManager()
@@ -0,0 +1,235 @@
+"""
+Bounded in-memory session cache.
+
+Live session state (history, changes, token usage) is kept in an LRU cache
+with idle-TTL eviction. Evicted or unknown sessions are lazily rehydrated
+from the database tables when they are needed again (e.g. a WebSocket
+connects to a session from the "recent sessions" list).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+SessionState = Dict[str, Any]
+
+
+def new_session_state(
+    workspace: str,
+    agent_type: str,
+    history: list | None = None,
+    changes: list | None = None,
+    token_usage: dict | None = None,
+    created_at: str | None = None
+) -> SessionState:
+    """Build the in-memory state for a session"""
+    return {
+        "history": history or [],
+        "workspace": workspace,
+        "agent_type": agent_type,
+        "changes": changes or [],  # Track file changes
+        "token_usage": token_usage or {"input_tokens": 0, "output_tokens": 0, "estimated_cost": 0.0},  # Cumulative token usage
+        "created_at": created_at or datetime.utcnow().isoformat()
+    }
+
+
+def load_session_from_db(session_id: str) -> Optional[SessionState]:
+    """Rebuild a session's in-memory state from the database (blocking)"""
+    from app.database import SessionLocal
+    from app.db_models import (
+        Session as DBSession,
+        Message as DBMessage,
+        FileChange as DBFileChange,
+        TokenUsage as DBTokenUsage
+    )
+
+    db = SessionLocal()
+    try:
+        row = db.query(DBSession).filter(DBSession.id == session_id).first()
+        if not row:
+            return None
+        if row.archived_at is not None:
+            # Cold session - move it back into the hot tables first
+            from app.archival import rehydrate_session
+            rehydrate_session(session_id)
+            db.refresh(row)
+
+        # Only plain user/assistant turns can be replayed to the model -
+        # tool calls are stored without their tool_call_id pairing
+        messages = (
+            db.query(DBMessage)
+            .filter(DBMessage.session_id == session_id)
+            .filter(DBMessage.role.in_(["user", "assistant"]))
+            .order_by(DBMessage.created_at)
+            .all()
+        )
+        history = [{"role": msg.role, "content": msg.content} for msg in messages]
+
+        file_changes = (
+            db.query(DBFileChange)
+            .filter(DBFileChange.session_id == session_id)
+            .order_by(DBFileChange.created_at)
+            .all()
+        )
+        changes = [
+            {
+                "type": "file_change",
+                "action": change.action,
+                "file_path": change.file_path,
+                "tool_name": change.tool_name,
+                "content_before": change.content_before,
+                "content_after": change.content_after,
+                "timestamp": change.created_at.isoformat() if change.created_at else None
+            }
+            for change in file_changes
+        ]
+
+        latest_usage = (
+            db.query(DBTokenUsage)
+            .filter(DBTokenUsage.session_id == session_id)
+            .order_by(DBTokenUsage.created_at.desc())
+            .first()
+        )
+        token_usage = None
+        if latest_usage:
+            token_usage = {
+                "input_tokens": latest_usage.input_tokens,
+                "output_tokens": latest_usage.output_tokens,
+                "estimated_cost": latest_usage.estimated_cost
+            }
+
+        return new_session_state(
+            workspace=row.workspace,
+            agent_type=row.agent_type or "building",
+            history=history,
+            changes=changes,
+            token_usage=token_usage,
+            created_at=row.created_at.isoformat() if row.created_at else None
+        )
+    finally:
+        db.close()
+
+
+class SessionCache:
+    """LRU + idle-TTL bounded map of session_id → session state, with per-session locks"""
+
+    def __init__(
+        self,
+        max_sessions: int,
+        idle_ttl_seconds: float,
+        is_pinned: Callable[[str], bool] | None = None
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.idle_ttl_seconds = idle_ttl_seconds
+        # Pinned sessions (running agent, connected clients) are never evicted
+        self.is_pinned = is_pinned or (lambda session_id: False)
+
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._workspace_locks: Dict[str, asyncio.Lock] = {}
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __getitem__(self, session_id: str) -> SessionState:
+        session = self._sessions[session_id]
+        self._touch(session_id)
+        return session
+
+    def __setitem__(self, session_id: str, session: SessionState) -> None:
+        self._sessions[session_id] = session
+        self._touch(session_id)
+        self._evict_over_capacity()
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        if session_id not in self._sessions:
+            return default
+        return self[session_id]
+
+    def _touch(self, session_id: str) -> None:
+        self._sessions.move_to_end(session_id)
+        self._last_access[session_id] = time.monotonic()
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """Session-level lock for state access (prevents races on concurrent reads/writes)"""
+        return self._locks.setdefault(session_id, asyncio.Lock())
+
+    def workspace_lock(self, workspace: str) -> asyncio.Lock:
+        """Workspace-level lock for file operations shared by sessions on the same workspace"""
+        return self._workspace_locks.setdefault(workspace, asyncio.Lock())
+
+    async def load(self, session_id: str) -> Optional[SessionState]:
+        """Get a session, rehydrating it from the database if it isn't cached"""
+        if session_id in self._sessions:
+            return self[session_id]
+
+        try:
+            session = await asyncio.to_thread(load_session_from_db, session_id)
+        except Exception as e:
+            print(f"Could not rehydrate session {session_id}: {e}")
+            return None
+
+        if session is None:
+            return None
+
+        # Another request may have rehydrated it while we were querying
+        if session_id in self._sessions:
+            return self[session_id]
+
+        self[session_id] = session
+        print(f"Rehydrated session {session_id} from database")
+        return session
+
+    def _evictable(self, session_id: str) -> bool:
+        lock = self._locks.get(session_id)
+        if lock is not None and lock.locked():
+            return False
+        return not self.is_pinned(session_id)
+
+    def evict(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        self._last_access.pop(session_id, None)
+        self._locks.pop(session_id, None)
+
+        if session is None:
+            return
+
+        # Drop the workspace lock once no cached session uses the workspace
+        workspace = session["workspace"]
+        lock = self._workspace_locks.get(workspace)
+        in_use = any(s["workspace"] == workspace for s in self._sessions.values())
+        if lock is not None and not lock.locked() and not in_use:
+            del self._workspace_locks[workspace]
+
+    def _evict_over_capacity(self) -> None:
+        # Oldest first; pinned sessions may keep the cache temporarily over capacity
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                return
+            if self._evictable(session_id):
+                self.evict(session_id)
+
+    def evict_idle(self) -> list[str]:
+        """Evict every unpinned session idle for longer than the TTL"""
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        expired = [
+            session_id
+            for session_id, last_access in self._last_access.items()
+            if last_access < cutoff and self._evictable(session_id)
+        ]
+        for session_id in expired:
+            self.evict(session_id)
+        return expired
+
+    async def run_sweeper(self, interval_seconds: float) -> None:
+        """Periodically evict idle sessions (runs for the lifetime of the app)"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            evicted = self.evict_idle()
+            if evicted:
+                print(f"Evicted {len(evicted)} idle session(s) from cache")
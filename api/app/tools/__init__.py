@@ -2,22 +2,30 @@
 
 from .base_tool import Tool
 from .read_file import ReadFileTool
+from .read_files import ReadFilesTool
 from .write_file import WriteFileTool
+from .write_files import WriteFilesTool
 from .execute_bash import ExecuteBashTool
 from .list_files import ListFilesTool
 from .web_search import WebSearchTool
 from .explore_structure import ExploreStructureTool
+from .read_tool_output import ReadToolOutputTool
+from .find_relevant_code import FindRelevantCodeTool
 
-def get_all_tools() -> list[Tool]:
+def get_all_tools(session_id: str | None = None) -> list[Tool]:
     """
     Returns the list of all available tools that will be passed to Grok.
     Add new tools here when you create them.
     """
     return [
         ReadFileTool(),
+        ReadFilesTool(),
         WriteFileTool(),
-        ExecuteBashTool(),
+        WriteFilesTool(),
+        ExecuteBashTool(session_id=session_id),
         ListFilesTool(),
         WebSearchTool(),
         ExploreStructureTool(),
+        ReadToolOutputTool(),
+        FindRelevantCodeTool(),
     ]
\ No newline at end of file
@@ -2,6 +2,11 @@ from abc import ABC, abstractmethod
 from pydantic import BaseModel
 
 class Tool(ABC):
+    # Optional resource accounting of the last execute() call (see ExecuteBashTool)
+    last_usage: dict | None = None
+    # Files changed by the last execute() call, for tools that report them (see WriteFilesTool)
+    last_changes: list[dict] | None = None
+
     @property
     @abstractmethod
     def schema(self):
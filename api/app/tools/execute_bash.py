@@ -1,13 +1,21 @@
-import subprocess
-import shlex
+import asyncio
 from pathlib import Path
 from typing import Any
 
 from .base_tool import Tool
+from .shell_pool import shell_pool, ShellExited, ShellWorker
+from .resource_limits import format_usage
+from ..config import settings
 from ..models import ToolResultMessage
 
 
 class ExecuteBashTool(Tool):
+    def __init__(self, session_id: str | None = None):
+        # With a session id, commands run in that session's persistent shell
+        self.session_id = session_id
+        # Resource usage of the last command (cpu_seconds, peak_rss_mb, wall_ms)
+        self.last_usage = None
+
     @property
     def schema(self):
         return {
@@ -18,7 +26,8 @@ class ExecuteBashTool(Tool):
                     "Execute a bash/shell command in the current workspace directory. "
                     "Use this tool when you need to run commands, scripts, git operations, "
                     "package managers (npm/pip/uv), tests, builds, etc. "
-                    "The command runs in a non-interactive shell."
+                    "The command runs in a non-interactive shell. Shell state (working directory, "
+                    "exported variables, activated virtualenvs) persists between calls."
                 ),
                 "parameters": {
                     "type": "object",
@@ -45,38 +54,65 @@ class ExecuteBashTool(Tool):
         if not command:
             return "Error: No command provided"
 
-        try:
-            # Run with timeout and capture output
-            result = subprocess.run(
-                command,
-                shell=True,
-                cwd=str(workspace),
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                encoding="utf-8",
-                errors="replace"
-            )
-
-            output = []
-            if result.stdout.strip():
-                output.append("STDOUT:\n" + result.stdout.rstrip())
-            if result.stderr.strip():
-                output.append("STDERR:\n" + result.stderr.rstrip())
+        self.last_usage = None
 
-            output_text = "\n\n".join(output) if output else "(no output)"
+        worker = shell_pool.acquire(self.session_id, workspace) if self.session_id else None
+        if worker is None:
+            # No session (or the pool is saturated) - use a throwaway shell
+            worker = ShellWorker(workspace)
+            try:
+                return await self._run(worker, command, timeout)
+            finally:
+                await worker.kill()
 
-            if result.returncode == 0:
-                return f"Command completed successfully (exit code 0):\n{output_text}"
-            else:
+        async with worker.lock:
+            # Checked under the lock, so commands queued behind a long one see its usage
+            if worker.cpu_seconds_total >= settings.bash_session_cpu_seconds > 0:
                 return (
-                    f"Command failed with exit code {result.returncode}:\n"
-                    f"{output_text}"
+                    f"Error: CPU budget exhausted - this session's commands already used "
+                    f"{worker.cpu_seconds_total:.0f}s of CPU (limit {settings.bash_session_cpu_seconds}s)"
                 )
+            return await self._run(worker, command, timeout)
 
-        except subprocess.TimeoutExpired:
-            return f"Command timed out after {timeout} seconds"
-        except subprocess.SubprocessError as e:
-            return f"Failed to execute command: {str(e)}"
+    async def _run(self, worker: ShellWorker, command: str, timeout: int) -> str:
+        try:
+            returncode, stdout, stderr, usage = await worker.run(command, timeout)
+        except asyncio.TimeoutError:
+            if worker.session_id is None:
+                return f"Command timed out after {timeout} seconds"
+            return (
+                f"Command timed out after {timeout} seconds "
+                "(the shell was restarted - working directory and environment were reset)"
+            )
+        except ShellExited as e:
+            notice = "The shell exited - a fresh shell will be started for the next command"
+            if not (e.stdout.strip() or e.stderr.strip()):
+                return notice
+            # Keep what the command printed before it ended the shell (e.g. `pytest; exit $?`)
+            self.last_usage = e.usage
+            result = format_result(e.returncode if e.returncode is not None else -1, e.stdout, e.stderr)
+            result += f"\n\n({notice})"
+            return result + ("\n\n" + format_usage(e.usage) if e.usage else "")
         except Exception as e:
-            return f"Unexpected error while running bash command: {str(e)}"
\ No newline at end of file
+            return f"Unexpected error while running bash command: {str(e)}"
+
+        self.last_usage = usage
+        return format_result(returncode, stdout, stderr) + "\n\n" + format_usage(usage)
+
+
+def format_result(returncode: int, stdout: str, stderr: str) -> str:
+    output = []
+    if stdout.strip():
+        output.append("STDOUT:\n" + stdout.rstrip())
+    if stderr.strip():
+        output.append("STDERR:\n" + stderr.rstrip())
+
+    output_text = "\n\n".join(output) if output else "(no output)"
+
+    if returncode == 0:
+        return f"Command completed successfully (exit code 0):\n{output_text}"
+    else:
+        return (
+            f"Command failed with exit code {returncode}:\n"
+            f"{output_text}"
+        )
@@ -0,0 +1,74 @@
+import asyncio
+from pathlib import Path
+
+from app.tools.base_tool import Tool
+from app.code_index import code_index_manager
+
+MAX_SNIPPET_LINES = 40
+
+
+class FindRelevantCodeTool(Tool):
+    """Tool to find the code most relevant to a query using a BM25 index of the workspace"""
+
+    @property
+    def schema(self) -> dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": "find_relevant_code",
+                "description": (
+                    "Search the workspace for the code most relevant to a query (keywords, identifiers "
+                    "or a short description) and return the top snippets with file paths and line numbers. "
+                    "Use this before reading files one by one."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "What to look for, e.g. 'websocket reconnect handling' or 'run_agent'"
+                        },
+                        "top_k": {
+                            "type": "integer",
+                            "description": "Number of snippets to return (default: 5, max: 20)",
+                            "default": 5
+                        }
+                    },
+                    "required": ["query"]
+                }
+            }
+        }
+
+    async def execute(self, arguments: dict, workspace: Path) -> str:
+        query = arguments.get("query", "").strip()
+        top_k = min(max(1, arguments.get("top_k", 5)), 20)
+        if not query:
+            return "Error: query is required"
+
+        try:
+            results = await code_index_manager.search(workspace, query, top_k)
+        except Exception as e:
+            return f"Error searching workspace: {str(e)}"
+
+        if not results:
+            return f"No code found matching {query!r}"
+
+        def read_snippets() -> list[str]:
+            sections = []
+            for score, path, start, end in results:
+                try:
+                    lines = (workspace / path).read_text(encoding="utf-8", errors="replace").splitlines()
+                except OSError:
+                    continue
+                snippet = lines[start - 1:min(end, start - 1 + MAX_SNIPPET_LINES)]
+                if not snippet:
+                    continue
+                last = start + len(snippet) - 1
+                body = "\n".join(f"{n:>6}  {line}" for n, line in enumerate(snippet, start))
+                sections.append(f"{path}:{start}-{last} (score {score:.2f})\n{body}")
+            return sections
+
+        sections = await asyncio.to_thread(read_snippets)
+        if not sections:
+            return f"No code found matching {query!r}"
+        return f"Top {len(sections)} result(s) for {query!r}:\n\n" + "\n\n".join(sections)
@@ -0,0 +1,197 @@
+import asyncio
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+import aiofiles
+
+from app.config import settings
+from app.repo_map import IGNORE_DIRS
+from app.tools.base_tool import Tool
+
+GLOB_CHARS = set("*?[")
+
+
+def _segment_matches(name: str, pattern: str) -> bool:
+    # Like glob: wildcards don't match hidden names
+    if name.startswith(".") and not pattern.startswith("."):
+        return False
+    return fnmatchcase(name, pattern)
+
+
+def _matches(parts: tuple, patterns: list[str]) -> bool:
+    """Whether path parts match glob segments ('**' matches any number of directories)"""
+    if not patterns:
+        return not parts
+    if patterns[0] == "**":
+        if _matches(parts, patterns[1:]):
+            return True
+        return bool(parts) and not parts[0].startswith(".") and _matches(parts[1:], patterns)
+    return bool(parts) and _segment_matches(parts[0], patterns[0]) and _matches(parts[1:], patterns[1:])
+
+
+def glob_workspace(pattern: str, workspace: Path, limit: int) -> list[str]:
+    """
+    Workspace-relative files matching a glob, at most limit. The walk starts
+    at the pattern's literal prefix and never enters IGNORE_DIRS, symlinked
+    directories, or (without '**') directories deeper than the pattern.
+    """
+    segments = [s for s in pattern.split("/") if s not in ("", ".")]
+    literal = []
+    for segment in segments[:-1]:
+        if GLOB_CHARS & set(segment):
+            break
+        literal.append(segment)
+    rest = segments[len(literal):]
+    if not rest or any(part in IGNORE_DIRS for part in literal):
+        return []
+    recursive = "**" in rest
+
+    start = workspace.joinpath(*literal)
+    matches = []
+    for dirpath, dirs, names in os.walk(start):
+        rel_dir = Path(dirpath).relative_to(start).parts
+        depth = len(rel_dir)
+        if recursive:
+            dirs[:] = sorted(d for d in dirs if d not in IGNORE_DIRS)
+        elif depth < len(rest) - 1:
+            dirs[:] = sorted(d for d in dirs if d not in IGNORE_DIRS and _segment_matches(d, rest[depth]))
+        else:
+            dirs[:] = []
+        for name in sorted(names):
+            if _matches(rel_dir + (name,), rest) and os.path.isfile(os.path.join(dirpath, name)):
+                matches.append("/".join([*literal, *rel_dir, name]))
+                if len(matches) >= limit:
+                    return matches
+    return matches
+
+
+class ReadFilesTool(Tool):
+    """Tool to read several files (paths or glob patterns) in one call"""
+
+    @property
+    def schema(self) -> dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": "read_files",
+                "description": (
+                    "Read several files in one call. Accepts paths and glob patterns "
+                    "(e.g. 'src/**/*.py'). Prefer this over repeated read_file calls when you "
+                    "need more than one file. Large files are truncated and the result reports "
+                    "any skipped or truncated files."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "paths": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Relative file paths and/or glob patterns"
+                        }
+                    },
+                    "required": ["paths"]
+                }
+            }
+        }
+
+    @staticmethod
+    def _expand(patterns: list[str], workspace: Path, limit: int) -> tuple[list[str], list[str]]:
+        """Resolve paths and globs to unique workspace-relative files, plus skip notes"""
+        files = []
+        skipped = []
+        seen = set()
+
+        for pattern in patterns:
+            if GLOB_CHARS & set(pattern):
+                # Rejected up front - walking them would leave the workspace
+                if os.path.isabs(pattern) or ".." in Path(pattern).parts:
+                    skipped.append(f"{pattern} (outside workspace)")
+                    continue
+                if len(files) >= limit:
+                    skipped.append(f"{pattern} (file limit reached)")
+                    continue
+                # One extra match, so exceeding the limit is reported
+                matches = glob_workspace(pattern, workspace, limit - len(files) + 1)
+                if not matches:
+                    skipped.append(f"{pattern} (no files match)")
+            else:
+                matches = [pattern]
+
+            for rel_path in matches:
+                full_path = (workspace / rel_path).resolve()
+                if not full_path.is_relative_to(workspace):
+                    skipped.append(f"{rel_path} (outside workspace)")
+                    continue
+                if not full_path.is_file():
+                    skipped.append(f"{rel_path} (not found)")
+                    continue
+                rel = str(full_path.relative_to(workspace))
+                if rel not in seen:
+                    seen.add(rel)
+                    files.append(rel)
+
+        return files, skipped
+
+    @staticmethod
+    async def _read(full_path: Path, max_bytes: int) -> tuple[bytes, int]:
+        """Read up to max_bytes of a file. Returns (data, total_size)."""
+        async with aiofiles.open(full_path, mode='rb') as f:
+            data = await f.read(max_bytes)
+        return data, full_path.stat().st_size
+
+    async def execute(self, arguments: dict, workspace: Path) -> str:
+        patterns = arguments.get("paths") or []
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        if not patterns:
+            return "Error: paths is required"
+
+        workspace = workspace.resolve()
+        try:
+            files, skipped = await asyncio.to_thread(self._expand, patterns, workspace, settings.read_files_max_files)
+        except Exception as e:
+            return f"Error resolving paths: {str(e)}"
+
+        max_files = settings.read_files_max_files
+        if len(files) > max_files:
+            skipped.append(f"{len(files) - max_files} or more file(s) (over the {max_files} file limit)")
+            files = files[:max_files]
+
+        per_file = settings.read_files_max_file_bytes
+        reads = await asyncio.gather(
+            *(self._read(workspace / rel, per_file) for rel in files),
+            return_exceptions=True
+        )
+
+        sections = []
+        truncated = []
+        remaining = settings.read_files_max_total_bytes
+        for rel, outcome in zip(files, reads):
+            if isinstance(outcome, Exception):
+                skipped.append(f"{rel} (unreadable: {outcome})")
+                continue
+            data, size = outcome
+            if b"\0" in data[:8192]:
+                skipped.append(f"{rel} (binary)")
+                continue
+            if remaining <= 0:
+                skipped.append(f"{rel} (total size limit reached)")
+                continue
+
+            kept = data[:remaining]
+            remaining -= len(kept)
+            text = kept.decode("utf-8", errors="replace")
+            if len(kept) < size:
+                # Don't leave half a line at the cut
+                text = text.rsplit("\n", 1)[0] if "\n" in text else text
+                truncated.append(f"{rel} (showing {len(kept)} of {size} bytes)")
+                text += f"\n... [truncated - {size - len(kept)} more bytes, use read_file for the rest]"
+            sections.append(f"===== {rel} =====\n{text}")
+
+        parts = [f"Read {len(sections)} file(s)."]
+        if truncated:
+            parts.append("Truncated: " + "; ".join(truncated))
+        if skipped:
+            parts.append("Skipped: " + "; ".join(skipped))
+        return "\n".join(parts) + ("\n\n" + "\n\n".join(sections) if sections else "")
@@ -0,0 +1,83 @@
+import asyncio
+import re
+from pathlib import Path
+
+from app.tools.base_tool import Tool
+from app.output_compaction import output_path
+
+
+class ReadToolOutputTool(Tool):
+    """Tool to page through the full output of a compacted tool result"""
+
+    @property
+    def schema(self) -> dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": "read_tool_output",
+                "description": (
+                    "Page through the full output of an earlier tool call whose result was compacted. "
+                    "Use the output id from the '[Output compacted ...]' header. "
+                    "Optionally filter lines with a regular expression."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "output_id": {
+                            "type": "string",
+                            "description": "Id of the stored output (from the compaction header)"
+                        },
+                        "start_line": {
+                            "type": "integer",
+                            "description": "First line to return, 1-based (default: 1)",
+                            "default": 1
+                        },
+                        "num_lines": {
+                            "type": "integer",
+                            "description": "Number of lines to return (default: 200, max: 1000)",
+                            "default": 200
+                        },
+                        "pattern": {
+                            "type": "string",
+                            "description": "Only return lines matching this regular expression"
+                        }
+                    },
+                    "required": ["output_id"]
+                }
+            }
+        }
+
+    async def execute(self, arguments: dict, workspace: Path) -> str:
+        output_id = arguments.get("output_id", "").strip()
+        start_line = max(1, arguments.get("start_line", 1))
+        num_lines = min(max(1, arguments.get("num_lines", 200)), 1000)
+        pattern = arguments.get("pattern")
+
+        try:
+            path = output_path(output_id)
+        except OSError as e:
+            return f"Error reading stored output: {str(e)}"
+        if path is None or not path.is_file():
+            return f"Error: No stored output with id {output_id}"
+
+        try:
+            text = await asyncio.to_thread(path.read_text, encoding="utf-8")
+        except Exception as e:
+            return f"Error reading stored output: {str(e)}"
+
+        numbered = list(enumerate(text.splitlines(), 1))
+        if pattern:
+            try:
+                regex = re.compile(pattern)
+            except re.error as e:
+                return f"Error: Invalid pattern: {str(e)}"
+            numbered = [(n, line) for n, line in numbered if regex.search(line)]
+
+        page = [(n, line) for n, line in numbered if n >= start_line][:num_lines]
+        if not page:
+            return f"No lines at or after line {start_line}" + (f" matching {pattern!r}" if pattern else "")
+
+        total = len(text.splitlines())
+        result = f"Output {output_id} (lines {page[0][0]}-{page[-1][0]} of {total}):\n\n"
+        result += "\n".join(f"{n:>6}  {line}" for n, line in page)
+        return result
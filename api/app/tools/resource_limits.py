@@ -0,0 +1,204 @@
+"""
+Resource isolation and accounting for execute_bash processes.
+
+Every shell gets a per-process CPU time rlimit and a lower scheduling
+priority. When a delegated cgroup v2 subtree is configured
+(BASH_CGROUP_ROOT), each session's shell also runs in its own cgroup with
+memory.max, pids.max and cpu.max, which gives hard per-session limits and
+exact CPU/memory accounting. Without a cgroup, memory is bounded per process
+by RLIMIT_DATA. RLIMIT_AS is not used: it caps address space, not memory,
+and breaks runtimes that reserve large regions up front (V8/WebAssembly,
+JVMs, sanitizer builds).
+"""
+import asyncio
+import os
+import resource
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def apply_process_limits(memory_rlimit: bool = True) -> None:
+    """
+    preexec_fn for shell workers - runs in the child before exec. Shells in a
+    cgroup pass memory_rlimit=False: memory.max already bounds them.
+    """
+    cpu = settings.bash_cpu_seconds_per_process
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+
+    memory = settings.bash_memory_mb
+    if memory and memory_rlimit:
+        # Heap and other private writable mappings - unlike RLIMIT_AS, reserved
+        # but untouched (PROT_NONE) address space doesn't count
+        limit = memory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+    # RLIMIT_NPROC counts every process of the (shared) server user, so the
+    # process count is only enforced through the cgroup's pids.max
+    os.nice(settings.bash_nice)
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """CPU time of a process plus all children it has waited for (from /proc/<pid>/stat)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # utime, stime, cutime, cstime are fields 14-17 (indexes 11-14 after the comm field)
+    ticks = sum(int(value) for value in fields[11:15])
+    return ticks / CLOCK_TICKS
+
+
+def process_rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def process_group_rss_bytes(pgid: int) -> int:
+    """Total resident memory of every process in a process group"""
+    total = 0
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        # pgrp is field 5, rss (pages) is field 24
+        if int(fields[2]) == pgid:
+            total += int(fields[21]) * PAGE_SIZE
+    return total
+
+
+class SessionCgroup:
+    """A cgroup v2 directory holding one session's shell and everything it spawns"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @classmethod
+    def create(cls, session_id: str) -> Optional["SessionCgroup"]:
+        root = settings.bash_cgroup_root
+        if not root or not Path(root, "cgroup.controllers").exists():
+            return None
+
+        path = Path(root) / f"session-{session_id}"
+        try:
+            path.mkdir(exist_ok=True)
+            if settings.bash_memory_mb:
+                (path / "memory.max").write_text(str(settings.bash_memory_mb * 1024 * 1024))
+            if settings.bash_max_processes:
+                (path / "pids.max").write_text(str(settings.bash_max_processes))
+            if settings.bash_max_cpus:
+                period = 100_000
+                (path / "cpu.max").write_text(f"{int(settings.bash_max_cpus * period)} {period}")
+        except OSError as e:
+            print(f"⚠️  cgroup setup failed for session {session_id}, using rlimits only: {e}")
+            return None
+        return cls(path)
+
+    def add_process(self, pid: int) -> None:
+        (self.path / "cgroup.procs").write_text(str(pid))
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            for line in (self.path / "cpu.stat").read_text().splitlines():
+                key, value = line.split()
+                if key == "usage_usec":
+                    return int(value) / 1_000_000
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def reset_memory_peak(self) -> None:
+        # Writable since Linux 6.12; older kernels report the session-wide peak
+        try:
+            (self.path / "memory.peak").write_text("0")
+        except OSError:
+            pass
+
+    def memory_peak_bytes(self) -> Optional[int]:
+        try:
+            return int((self.path / "memory.peak").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def kill(self) -> None:
+        # Catches processes that left the shell's process group (Linux 5.14+)
+        try:
+            (self.path / "cgroup.kill").write_text("1")
+        except OSError:
+            pass
+
+    def remove(self) -> None:
+        try:
+            self.path.rmdir()
+        except OSError:
+            pass
+
+
+class UsageMeter:
+    """Measures CPU seconds and peak RSS of one command run in a shell worker"""
+
+    SAMPLE_INTERVAL = 0.1
+
+    def __init__(self, pid: int, cgroup: Optional[SessionCgroup]):
+        self.pid = pid
+        self.cgroup = cgroup
+        self.peak_rss = 0
+        self._cpu_start = None
+        self._sampler: Optional[asyncio.Task] = None
+
+    def _cpu_now(self) -> Optional[float]:
+        if self.cgroup is not None:
+            return self.cgroup.cpu_seconds()
+        return process_cpu_seconds(self.pid)
+
+    async def _sample(self) -> None:
+        while True:
+            rss = await asyncio.to_thread(process_group_rss_bytes, self.pid)
+            self.peak_rss = max(self.peak_rss, rss)
+            await asyncio.sleep(self.SAMPLE_INTERVAL)
+
+    def start(self) -> None:
+        self._cpu_start = self._cpu_now()
+        if self.cgroup is not None:
+            self.cgroup.reset_memory_peak()
+        else:
+            self._sampler = asyncio.create_task(self._sample())
+
+    async def stop(self) -> dict:
+        if self._sampler is not None:
+            self._sampler.cancel()
+            await asyncio.gather(self._sampler, return_exceptions=True)
+
+        cpu_end = self._cpu_now()
+        cpu_seconds = None
+        if self._cpu_start is not None and cpu_end is not None:
+            cpu_seconds = round(max(0.0, cpu_end - self._cpu_start), 3)
+
+        if self.cgroup is not None:
+            peak = self.cgroup.memory_peak_bytes()
+        else:
+            # Commands faster than one sample interval: fall back to the shell's own RSS
+            peak = self.peak_rss or process_rss_bytes(self.pid)
+        return {
+            "cpu_seconds": cpu_seconds,
+            "peak_rss_mb": round(peak / (1024 * 1024), 1) if peak else None
+        }
+
+
+def format_usage(usage: dict) -> str:
+    cpu = f"{usage['cpu_seconds']:.2f}s" if usage.get("cpu_seconds") is not None else "n/a"
+    rss = f"{usage['peak_rss_mb']:.1f} MB" if usage.get("peak_rss_mb") is not None else "n/a"
+    return f"[resources: cpu {cpu}, peak rss {rss}, wall {usage.get('wall_ms', 0)} ms]"
@@ -0,0 +1,270 @@
+"""
+Persistent per-session shell workers for execute_bash.
+
+Each session gets a long-lived bash process, so `cd`, `export` and virtualenv
+activation carry over between tool calls. Commands are framed with a unique
+sentinel that the worker echoes (with the exit code) once the command is done.
+"""
+import asyncio
+import functools
+import os
+import signal
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import settings
+from app.tools.resource_limits import SessionCgroup, UsageMeter, apply_process_limits
+
+SHELL = "/bin/bash"
+READ_CHUNK = 64 * 1024
+
+
+class ShellExited(Exception):
+    """The worker shell died (e.g. the command ran `exit`), with what the command printed before"""
+
+    def __init__(self, stdout: str = "", stderr: str = "", returncode: Optional[int] = None, usage: Optional[dict] = None):
+        super().__init__(stdout, stderr, returncode)
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+        self.usage = usage
+
+
+class ShellWorker:
+    """A single long-lived bash process bound to one session"""
+
+    def __init__(self, workspace: Path, session_id: Optional[str] = None):
+        self.workspace = workspace
+        self.session_id = session_id
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.cgroup: Optional[SessionCgroup] = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        # Survives shell restarts, so the session CPU budget can't be reset by a timeout
+        self.cpu_seconds_total = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        # Created first, so the rlimits know whether the cgroup bounds memory
+        if self.session_id and self.cgroup is None:
+            self.cgroup = SessionCgroup.create(self.session_id)
+        self.process = await asyncio.create_subprocess_exec(
+            SHELL, "--noprofile", "--norc",
+            cwd=str(self.workspace),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Own process group, so the shell and everything it spawned can be killed together
+            start_new_session=True,
+            preexec_fn=functools.partial(apply_process_limits, memory_rlimit=self.cgroup is None)
+        )
+        if self.cgroup is not None:
+            self.cgroup.add_process(self.process.pid)
+
+    async def run(self, command: str, timeout: float) -> tuple[int, str, str, dict]:
+        """Run a command in the shell. Returns (exit_code, stdout, stderr, resource_usage)."""
+        if not self.alive:
+            await self.start()
+
+        self.last_used = time.monotonic()
+        sentinel = f"__AGENT_DONE_{uuid.uuid4().hex}__"
+
+        # The command is passed through a quoted heredoc and eval'd in the
+        # current shell: state changes persist, syntax errors can't desync the
+        # framing, and stdin is detached so the command can't eat our input.
+        script = (
+            f"IFS= read -r -d '' __agent_cmd <<'{sentinel}'\n"
+            f"{command}\n"
+            f"{sentinel}\n"
+            f'eval "$__agent_cmd" < /dev/null\n'
+            f"__agent_rc=$?\n"
+            f"printf '\\n{sentinel} %d\\n' \"$__agent_rc\"\n"
+            f"printf '\\n{sentinel}\\n' >&2\n"
+        )
+
+        meter = UsageMeter(self.process.pid, self.cgroup)
+        meter.start()
+        started = time.monotonic()
+
+        try:
+            self.process.stdin.write(script.encode("utf-8"))
+            await self.process.stdin.drain()
+
+            (stdout, exit_code), (stderr, _) = await asyncio.wait_for(
+                asyncio.gather(
+                    self._read_until(self.process.stdout, sentinel),
+                    self._read_until(self.process.stderr, sentinel)
+                ),
+                timeout=timeout
+            )
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            await self._account(meter)
+            await self.kill()
+            raise
+        except (BrokenPipeError, ConnectionResetError):
+            await self._account(meter)
+            await self.kill()
+            raise ShellExited()
+        finally:
+            self.last_used = time.monotonic()
+
+        usage = await self._account(meter)
+        usage["wall_ms"] = int((time.monotonic() - started) * 1000)
+
+        if exit_code is None:
+            # EOF before the sentinel - the command terminated the shell (its status is the command's)
+            returncode = await self.process.wait()
+            await self.kill()
+            raise ShellExited(stdout, stderr, returncode, usage)
+
+        return exit_code, stdout, stderr, usage
+
+    async def _account(self, meter: UsageMeter) -> dict:
+        usage = await meter.stop()
+        self.cpu_seconds_total += usage["cpu_seconds"] or 0.0
+        return usage
+
+    @staticmethod
+    async def _read_until(stream: asyncio.StreamReader, sentinel: str) -> tuple[str, Optional[int]]:
+        # The framing printf always puts a newline in front of the sentinel
+        marker = b"\n" + sentinel.encode()
+        max_bytes = settings.bash_max_output_bytes
+        chunks = []
+        kept = 0
+        omitted = 0
+        pending = b""
+
+        def keep(data: bytes) -> None:
+            # Keep draining past the cap so the command never blocks on a full pipe
+            nonlocal kept, omitted
+            room = max(0, max_bytes - kept)
+            chunks.append(data[:room])
+            kept += min(room, len(data))
+            omitted += max(0, len(data) - room)
+
+        def collect() -> str:
+            text = b"".join(chunks).decode("utf-8", errors="replace")
+            if omitted:
+                text += f"\n[output truncated: {omitted} more bytes omitted]"
+            return text
+
+        while True:
+            chunk = await stream.read(READ_CHUNK)
+            if not chunk:
+                keep(pending)
+                return collect(), None
+
+            data = pending + chunk
+            idx = data.find(marker)
+            if idx != -1:
+                end = data.find(b"\n", idx + len(marker))
+                if end == -1:
+                    # Sentinel line not complete yet
+                    pending = data
+                    continue
+                keep(data[:idx])
+                rest = data[idx + len(marker):end].strip()
+                return collect(), int(rest) if rest else 0
+
+            # Hold back a possible partial marker at the end of the chunk
+            split = max(0, len(data) - len(marker))
+            keep(data[:split])
+            pending = data[split:]
+
+    async def kill(self) -> None:
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await self.process.wait()
+        self.process = None
+
+        if self.cgroup is not None:
+            self.cgroup.kill()
+            self.cgroup.remove()
+            self.cgroup = None
+
+
+class ShellPool:
+    """Bounded pool of shell workers keyed by session id, with idle reaping"""
+
+    def __init__(self, max_workers: int, idle_timeout_seconds: float):
+        self.max_workers = max(1, max_workers)
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self._workers: Dict[str, ShellWorker] = {}
+
+    def acquire(self, session_id: str, workspace: Path) -> Optional[ShellWorker]:
+        """
+        Get (or create) the worker for a session. Returns None if the pool is
+        full of busy workers - the caller should fall back to a one-shot process.
+        """
+        worker = self._workers.get(session_id)
+        if worker is not None and worker.workspace == workspace:
+            return worker
+
+        if worker is not None:
+            if worker.lock.locked():
+                # Still running a command in the old workspace - never kill it mid-command
+                return None
+            self._discard(session_id)
+
+        if len(self._workers) >= self.max_workers and not self._reap_lru():
+            return None
+
+        worker = ShellWorker(workspace, session_id=session_id)
+        self._workers[session_id] = worker
+        return worker
+
+    def release(self, session_id: str) -> None:
+        """Shut down a session's worker right away (e.g. a finished subtask)"""
+        self._discard(session_id)
+
+    def _reap_lru(self) -> bool:
+        idle = [(w.last_used, sid) for sid, w in self._workers.items() if not w.lock.locked()]
+        if not idle:
+            return False
+        _, session_id = min(idle)
+        self._discard(session_id)
+        return True
+
+    def _discard(self, session_id: str) -> None:
+        worker = self._workers.pop(session_id, None)
+        if worker is not None:
+            asyncio.create_task(worker.kill())
+
+    def reap_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_timeout_seconds
+        expired = [
+            sid for sid, w in self._workers.items()
+            if w.last_used < cutoff and not w.lock.locked()
+        ]
+        for session_id in expired:
+            self._discard(session_id)
+        return len(expired)
+
+    async def run_reaper(self, interval_seconds: float = 30) -> None:
+        """Periodically shut down idle shells (runs for the lifetime of the app)"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            reaped = self.reap_idle()
+            if reaped:
+                print(f"Reaped {reaped} idle shell worker(s)")
+
+    async def close_all(self) -> None:
+        workers = list(self._workers.values())
+        self._workers.clear()
+        await asyncio.gather(*(w.kill() for w in workers), return_exceptions=True)
+
+
+shell_pool = ShellPool(
+    max_workers=settings.shell_pool_size,
+    idle_timeout_seconds=settings.shell_idle_timeout_seconds
+)
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Any
+
+from .base_tool import Tool
+
+MAX_FILES = 100
+
+
+class BatchError(Exception):
+    """A write_files batch that can't be (or wasn't) applied"""
+
+
+def _read_before(path: Path) -> str | None:
+    if not path.is_file():
+        return None
+    try:
+        return path.read_text(encoding="utf-8")
+    except (UnicodeDecodeError, OSError):
+        return None  # Binary or unreadable - the change record just has no before-state
+
+
+def _hidden_sibling(path: Path, suffix: str) -> Path:
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.{suffix}")
+
+
+def apply_batch(workspace: Path, operations: list[dict]) -> list[dict]:
+    """
+    Apply creates, overwrites and deletes all-or-nothing (blocking).
+
+    Every new file is first written to a staged temp file next to its target.
+    Only once all of them are staged are targets replaced by renames; replaced
+    and deleted files are kept as backups until the whole batch succeeded, and
+    moved back if any step fails. Returns the applied changes with their
+    before/after content.
+    """
+    workspace = workspace.resolve()
+    planned = []
+    seen = set()
+    for op in operations:
+        rel_path = (op.get("path") or "").strip()
+        action = op.get("action", "write")
+        if not rel_path:
+            raise BatchError("Every file needs a path")
+        if action not in ("write", "delete"):
+            raise BatchError(f"{rel_path}: unknown action '{action}' (use 'write' or 'delete')")
+        target = (workspace / rel_path).resolve()
+        if not target.is_relative_to(workspace) or target == workspace:
+            raise BatchError(f"{rel_path}: path outside the workspace")
+        if target in seen:
+            raise BatchError(f"{rel_path}: listed more than once")
+        seen.add(target)
+        if target.is_dir():
+            raise BatchError(f"{rel_path}: is a directory")
+        if action == "delete" and not target.is_file():
+            raise BatchError(f"{rel_path}: can't delete a file that doesn't exist")
+        if action == "write" and not isinstance(op.get("content"), str):
+            raise BatchError(f"{rel_path}: 'content' is required for writes")
+        planned.append({
+            "path": rel_path,
+            "target": target,
+            "action": action,
+            "content": op.get("content"),
+            "existed": target.exists(),
+            "content_before": _read_before(target)
+        })
+
+    created_dirs: list[Path] = []
+    staged: dict[Path, Path] = {}
+    backups: list[tuple[Path, Path]] = []
+    placed: list[Path] = []
+    try:
+        # 1. Stage the new contents
+        for item in planned:
+            if item["action"] != "write":
+                continue
+            target = item["target"]
+            missing = []
+            parent = target.parent
+            while not parent.exists():
+                missing.append(parent)
+                parent = parent.parent
+            for directory in reversed(missing):
+                directory.mkdir()
+                created_dirs.append(directory)
+            temp = _hidden_sibling(target, "tmp")
+            with open(temp, "w", encoding="utf-8") as f:
+                f.write(item["content"])
+            staged[target] = temp
+            if item["existed"]:
+                shutil.copymode(target, temp)
+
+        # 2. Swap them in - existing files are moved aside, not overwritten
+        for item in planned:
+            target = item["target"]
+            if item["existed"]:
+                backup = _hidden_sibling(target, "bak")
+                os.rename(target, backup)
+                backups.append((target, backup))
+            if item["action"] == "write":
+                os.rename(staged[target], target)
+                del staged[target]
+                placed.append(target)
+    except Exception as e:
+        # Roll back: remove what was placed, restore what was moved aside
+        for target in placed:
+            target.unlink(missing_ok=True)
+        for target, backup in reversed(backups):
+            os.replace(backup, target)
+        for temp in staged.values():
+            temp.unlink(missing_ok=True)
+        for directory in reversed(created_dirs):
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+        raise BatchError(f"Batch rolled back, no file was changed: {e}") from e
+
+    # 3. Committed - drop the backups
+    for _, backup in backups:
+        backup.unlink(missing_ok=True)
+
+    return [
+        {
+            "action": "delete" if item["action"] == "delete" else ("write" if item["existed"] else "create"),
+            "file_path": item["path"],
+            "content_before": item["content_before"],
+            "content_after": item["content"] if item["action"] == "write" else None
+        }
+        for item in planned
+    ]
+
+
+class WriteFilesTool(Tool):
+    @property
+    def schema(self):
+        return {
+            "type": "function",
+            "function": {
+                "name": "write_files",
+                "description": (
+                    "Create, overwrite and delete several files in one atomic step: either every "
+                    "change is applied or none is. Prefer this over repeated write_file calls "
+                    "when a change spans multiple files (e.g. a new feature with its tests)."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "description": f"The changes to apply (at most {MAX_FILES})",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "path": {
+                                        "type": "string",
+                                        "description": "Relative path to the file (from workspace root)"
+                                    },
+                                    "action": {
+                                        "type": "string",
+                                        "enum": ["write", "delete"],
+                                        "description": "'write' creates or overwrites the file (default), 'delete' removes it",
+                                        "default": "write"
+                                    },
+                                    "content": {
+                                        "type": "string",
+                                        "description": "The full content of the file (for 'write')"
+                                    }
+                                },
+                                "required": ["path"]
+                            }
+                        }
+                    },
+                    "required": ["files"]
+                }
+            }
+        }
+
+    async def execute(self, arguments: dict[str, Any], workspace: Path) -> str:
+        self.last_changes = []
+        files = arguments.get("files") or []
+        if not isinstance(files, list) or not files:
+            return "Error: No files provided"
+        if len(files) > MAX_FILES:
+            return f"Error: At most {MAX_FILES} files per call"
+
+        try:
+            changes = await asyncio.to_thread(apply_batch, workspace, files)
+        except BatchError as e:
+            return f"Error: {e}"
+        except PermissionError as e:
+            return f"Permission denied: {e}"
+
+        self.last_changes = changes
+        lines = [f"Applied {len(changes)} file change(s) atomically:"]
+        for change in changes:
+            size = f" ({len(change['content_after'])} characters)" if change["content_after"] is not None else ""
+            lines.append(f"- {change['action']}: {change['file_path']}{size}")
+        return "\n".join(lines)
@@ -0,0 +1,108 @@
+"""
+Server-side LLM usage accounting.
+
+Every LLM call is written as a delta record (LLMCall) and folded into a
+daily rollup row per session, workspace and model (UsageRollup) in the same
+transaction. Analytics queries then scan a handful of rollup rows instead of
+every call. Writes happen in the background and never slow down or break an
+agent run.
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional, Set
+
+from app.config import settings
+
+# Keeps fire-and-forget writes alive until they finish
+_pending: Set[asyncio.Task] = set()
+
+
+def cached_prompt_tokens(usage: dict) -> int:
+    """Prompt tokens served from the provider's prompt cache (0 if not reported)"""
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens") or 0
+
+
+def write_llm_call(
+    session_id: Optional[str],
+    workspace: str,
+    agent_type: Optional[str],
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cached_tokens: int,
+    latency_ms: int,
+    cost: float
+) -> None:
+    """Insert the delta record and update its rollup row (blocking)"""
+    from sqlalchemy.exc import IntegrityError
+    from app.database import SessionLocal
+    from app.db_models import LLMCall, UsageRollup
+
+    now = datetime.utcnow()
+    key = {
+        "day": now.date(),
+        "session_id": session_id or "",
+        "workspace": workspace,
+        "model": model
+    }
+    increments = {
+        UsageRollup.calls: UsageRollup.calls + 1,
+        UsageRollup.input_tokens: UsageRollup.input_tokens + input_tokens,
+        UsageRollup.output_tokens: UsageRollup.output_tokens + output_tokens,
+        UsageRollup.cached_tokens: UsageRollup.cached_tokens + cached_tokens,
+        UsageRollup.latency_ms: UsageRollup.latency_ms + latency_ms,
+        UsageRollup.cost: UsageRollup.cost + cost
+    }
+
+    db = SessionLocal()
+    try:
+        for _ in range(3):
+            db.add(LLMCall(
+                session_id=session_id,
+                workspace=workspace,
+                agent_type=agent_type,
+                model=model,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                cached_tokens=cached_tokens,
+                latency_ms=latency_ms,
+                cost=cost,
+                created_at=now
+            ))
+            # Portable upsert: bump the existing row, create it on the first call of the day
+            updated = db.query(UsageRollup).filter_by(**key).update(increments, synchronize_session=False)
+            if not updated:
+                db.add(UsageRollup(
+                    **key,
+                    calls=1,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    cached_tokens=cached_tokens,
+                    latency_ms=latency_ms,
+                    cost=cost
+                ))
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # A concurrent writer created the rollup row first - retry as an update
+                db.rollback()
+    finally:
+        db.close()
+
+
+def record_llm_call(**call) -> None:
+    """Record an LLM call in the background (best effort)"""
+    if not settings.usage_tracking_enabled:
+        return
+
+    async def write():
+        try:
+            await asyncio.to_thread(write_llm_call, **call)
+        except Exception as e:
+            print(f"⚠️  Could not record LLM usage: {e}")
+
+    task = asyncio.create_task(write())
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
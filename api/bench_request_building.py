@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark of LLM request building over a long conversation.
+
+Simulates an agent session of N turns (user message, assistant tool call,
+tool result, assistant answer) and builds the request body before every
+assistant message, the way run_agent does:
+
+- full:        validate_messages() over the whole history + json encoding of
+               the whole payload on every call (the previous behaviour)
+- incremental: Conversation - each message validated and encoded once,
+               bodies assembled from the cached fragments
+
+Usage: python bench_request_building.py [--turns 200]
+"""
+import argparse
+import copy
+import json
+import os
+import time
+
+os.environ.setdefault("GROK_API_KEY", "benchmark")
+
+from app.grok_client import Conversation, validate_messages  # noqa: E402
+from app.tools import get_all_tools  # noqa: E402
+
+TOOL_OUTPUT = "\n".join(f"{i:5d}  def handler_{i}(request): return process(request, retries={i % 7})" for i in range(40))
+
+
+def turn_messages(turn: int) -> list[list[dict]]:
+    """Messages of one turn, grouped by the API call that follows them"""
+    call_id = f"call_{turn}"
+    return [
+        [{"role": "user", "content": f"Turn {turn}: please look at module_{turn}.py and fix the failing handler"}],
+        [
+            {"role": "assistant", "content": None, "tool_calls": [{
+                "id": call_id, "type": "function",
+                "function": {"name": "read_file", "arguments": json.dumps({"path": f"src/module_{turn}.py"})}
+            }]},
+            {"role": "tool", "tool_call_id": call_id, "content": TOOL_OUTPUT}
+        ],
+        [{"role": "assistant", "content": f"Fixed the handler in module_{turn}.py by retrying on timeouts."}]
+    ]
+
+
+def params(tools: list) -> dict:
+    return {"model": "grok-4-1-fast", "temperature": 0.7, "max_tokens": 4096, "tools": tools, "tool_choice": "auto"}
+
+
+def run_full(turns: int, tools: list) -> tuple[float, int, bytes]:
+    messages: list = [{"role": "system", "content": "You are a helpful coding agent."}]
+    started = time.perf_counter()
+    calls = 0
+    body = b""
+    for turn in range(turns):
+        before_call, after_tool, answer = turn_messages(turn)
+        for new_messages in (before_call, after_tool):
+            messages.extend(new_messages)
+            payload = {**params(tools), "messages": validate_messages(messages)}
+            # What httpx's json= does
+            body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+            calls += 1
+        messages.extend(answer)
+    return time.perf_counter() - started, calls, body
+
+
+def run_incremental(turns: int, tools: list) -> tuple[float, int, bytes]:
+    conversation = Conversation()
+    conversation.set_system("You are a helpful coding agent.")
+    started = time.perf_counter()
+    calls = 0
+    body = b""
+    for turn in range(turns):
+        before_call, after_tool, answer = turn_messages(turn)
+        for new_messages in (before_call, after_tool):
+            for msg in new_messages:
+                conversation.append(msg)
+            body = conversation.request_body(params(tools))
+            calls += 1
+        for msg in answer:
+            conversation.append(msg)
+    return time.perf_counter() - started, calls, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs is reported")
+    args = parser.parse_args()
+
+    tools = [t.schema for t in get_all_tools()]
+    results = {}
+    for name, run in (("full", run_full), ("incremental", run_incremental)):
+        best = min((run(args.turns, copy.deepcopy(tools)) for _ in range(args.repeat)), key=lambda r: r[0])
+        results[name] = best
+
+    # Both strategies must produce the same request
+    assert json.loads(results["full"][2]) == json.loads(results["incremental"][2]), "request bodies differ"
+
+    calls = results["full"][1]
+    print(f"{args.turns} turns, {calls} API calls, final body {len(results['incremental'][2]) / 1024:.0f} KiB")
+    for name, (seconds, _, _) in results.items():
+        print(f"  {name:<12} {seconds * 1000:9.1f} ms total  {seconds / calls * 1e6:9.1f} us/call")
+    print(f"  speedup      {results['full'][0] / results['incremental'][0]:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+-- Migration: Add resource usage columns to tool_calls table
+-- Run this migration against your PostgreSQL database to add the new columns
+
+ALTER TABLE tool_calls
+ADD COLUMN IF NOT EXISTS cpu_seconds DOUBLE PRECISION,
+ADD COLUMN IF NOT EXISTS peak_rss_mb DOUBLE PRECISION;
+
+-- Verify the columns were added
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'tool_calls'
+AND column_name IN ('cpu_seconds', 'peak_rss_mb');
@@ -0,0 +1,40 @@
+-- Migration: Add the headless job queue tables
+-- Run this migration against your PostgreSQL database (or run app/init_db.py on a fresh database)
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id VARCHAR PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    workspace VARCHAR NOT NULL,
+    agent_type VARCHAR DEFAULT 'building',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR NOT NULL DEFAULT 'queued',
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id VARCHAR,
+    result TEXT,
+    error TEXT,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    estimated_cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    heartbeat_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status);
+
+CREATE TABLE IF NOT EXISTS job_events (
+    id SERIAL PRIMARY KEY,
+    job_id VARCHAR NOT NULL REFERENCES jobs (id) ON DELETE CASCADE,
+    event_type VARCHAR NOT NULL,
+    payload JSON NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_job_events_job_id ON job_events (job_id);
+
+-- Verify the tables were added
+SELECT table_name
+FROM information_schema.tables
+WHERE table_name IN ('jobs', 'job_events');
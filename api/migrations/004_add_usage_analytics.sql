@@ -0,0 +1,43 @@
+-- Migration: Add per-call LLM usage records and their daily rollups
+-- Run this migration against your PostgreSQL database (or run app/init_db.py on a fresh database)
+
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR,
+    workspace VARCHAR NOT NULL,
+    agent_type VARCHAR,
+    model VARCHAR NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms INTEGER NOT NULL DEFAULT 0,
+    cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_llm_calls_session_id ON llm_calls (session_id);
+CREATE INDEX IF NOT EXISTS ix_llm_calls_created_at ON llm_calls (created_at);
+
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    id SERIAL PRIMARY KEY,
+    day DATE NOT NULL,
+    session_id VARCHAR NOT NULL DEFAULT '',
+    workspace VARCHAR NOT NULL,
+    model VARCHAR NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms INTEGER NOT NULL DEFAULT 0,
+    cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+    CONSTRAINT uq_usage_rollups_key UNIQUE (day, session_id, workspace, model)
+);
+
+CREATE INDEX IF NOT EXISTS ix_usage_rollups_day ON usage_rollups (day);
+CREATE INDEX IF NOT EXISTS ix_usage_rollups_workspace_day ON usage_rollups (workspace, day);
+CREATE INDEX IF NOT EXISTS ix_usage_rollups_model_day ON usage_rollups (model, day);
+
+-- Verify the tables were added
+SELECT table_name
+FROM information_schema.tables
+WHERE table_name IN ('llm_calls', 'usage_rollups');
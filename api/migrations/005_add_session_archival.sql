@@ -0,0 +1,14 @@
+-- Migration: Add archive location columns to sessions table
+-- Run this migration against your PostgreSQL database to add the new columns
+
+ALTER TABLE sessions
+ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP WITH TIME ZONE,
+ADD COLUMN IF NOT EXISTS archive_segment VARCHAR,
+ADD COLUMN IF NOT EXISTS archive_offset BIGINT,
+ADD COLUMN IF NOT EXISTS archive_length INTEGER;
+
+-- Verify the columns were added
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'sessions'
+AND column_name IN ('archived_at', 'archive_segment', 'archive_offset', 'archive_length');
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Regression check: repeated execute_bash calls are detected as a loop.
+
+Every execute_bash result ends with a resource line whose timings differ on
+every run. The same failing command must still count as the same result -
+detected after LOOP_REPEAT_THRESHOLD calls, and without earning the run
+more iterations.
+
+Usage: python test_loop_detection.py
+"""
+import os
+
+os.environ.setdefault("GROK_API_KEY", "test")
+
+from app.config import settings  # noqa: E402
+from app.loop_detection import LoopDetector  # noqa: E402
+from app.tools.execute_bash import format_result  # noqa: E402
+from app.tools.resource_limits import format_usage  # noqa: E402
+
+
+def bash_result(run: int) -> str:
+    """The same failing pytest run, with this run's resource usage"""
+    usage = {"cpu_seconds": 1.2 + run / 100, "peak_rss_mb": 80.0 + run, "wall_ms": 1500 + run * 37}
+    return format_result(1, "FAILED tests/test_app.py::test_login - AssertionError", "") + "\n\n" + format_usage(usage)
+
+
+def test_repeated_bash_calls():
+    detector = LoopDetector("building")
+    arguments = {"command": "pytest -q"}
+    problems = []
+    for run in range(8):
+        detector.observe("execute_bash", arguments, bash_result(run))
+        problems.append(detector.end_iteration())
+
+    first = next((i for i, p in enumerate(problems) if p), None)
+    assert first == settings.loop_repeat_threshold - 1, f"loop detected at call {first}, expected {settings.loop_repeat_threshold - 1}"
+    # Only the first call learned something
+    assert detector.limit == min(detector.max_limit, detector.base_limit + 1), f"limit grew to {detector.limit}"
+    print(f"✓ Detected after {first + 1} identical runs, limit {detector.limit} (base {detector.base_limit})")
+
+
+def test_changed_output_is_progress():
+    detector = LoopDetector("building")
+    for run in range(3):
+        result = format_result(1, f"{3 - run} failed", "") + "\n\n" + format_usage({"wall_ms": run})
+        detector.observe("execute_bash", {"command": "pytest -q"}, result)
+        assert detector.end_iteration() is None
+    print("✓ Changing output is not a loop")
+
+
+if __name__ == "__main__":
+    test_repeated_bash_calls()
+    test_changed_output_is_progress()
@@ -6,7 +6,6 @@ import { RecentSessions } from './components/RecentSessions'
 import { Plus, X, LogOut } from 'lucide-react'
 import { cn } from '@/lib/utils'
 import * as sessionService from './services/sessionService'
-import { config } from './config'
 import { WebSocketProvider, useWebSocket } from './contexts/WebSocketContext'
 
 type Message = {
@@ -113,17 +112,8 @@ function AppContent() {
       return
     }
 
-    // Resume the session in backend (for WebSocket to work) - include token usage for accumulation
-    try {
-      const tokenParams = sessionData.tokenUsage
-        ? `&input_tokens=${sessionData.tokenUsage.input_tokens}&output_tokens=${sessionData.tokenUsage.output_tokens}&estimated_cost=${sessionData.tokenUsage.estimated_cost}`
-        : ''
-      await fetch(`${config.apiBaseUrl}/sessions/${sessionId}/resume?workspace=${encodeURIComponent(sessionData.workspace)}&agent_type=${sessionData.agentType}${tokenParams}`, {
-        method: "POST"
-      })
-    } catch (err) {
-      console.error('Failed to resume session in backend:', err)
-    }
+    // No explicit resume needed - the backend rehydrates the session from
+    // the database when the WebSocket connects
 
     const typeLabel = sessionData.agentType === 'planning' ? '📋' : '🔨'
     const newSession: Session = {
@@ -15,7 +15,7 @@ export function ChatMessage({ message, hasResult, resultSuccess }: MessageProps)
   const isAssistant = message.type === 'assistant'
   const isToolCall = message.type === 'tool_call'
   const isToolResult = message.type === 'tool_result'
-  const isStatus = message.type === 'status' || message.type === 'thinking'
+  const isStatus = message.type === 'status' || message.type === 'thinking' || message.type === 'subtask'
   const isError = message.type === 'error'
 
   const getToolIcon = () => {
@@ -25,13 +25,21 @@ export function FileExplorer({ sessionId }: Props) {
     setLoading(true)
     setError(null)
     try {
-      const url = `${config.apiBaseUrl}/sessions/${sessionId}/files${path ? `?path=${encodeURIComponent(path)}` : ''}`
-      const res = await fetch(url)
+      // Listings are paginated; unchanged pages are revalidated by the browser via ETag
+      const items: FileItem[] = []
+      let offset: number | null = 0
+      while (offset !== null) {
+        const params = new URLSearchParams({ offset: String(offset) })
+        if (path) params.set('path', path)
+        const res = await fetch(`${config.apiBaseUrl}/sessions/${sessionId}/files?${params}`)
 
-      if (!res.ok) throw new Error('Failed to fetch files')
+        if (!res.ok) throw new Error('Failed to fetch files')
 
-      const data = await res.json()
-      setFiles(data.files || [])
+        const data = await res.json()
+        items.push(...(data.files || []))
+        offset = data.next_offset ?? null
+      }
+      setFiles(items)
       setCurrentPath(path)
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to load files')
@@ -95,7 +95,10 @@ export function SessionView({
           arguments: {},
           result: event.content,
           success: event.success !== false,
-          error: event.error
+          error: event.error,
+          execution_time_ms: event.resource_usage?.wall_ms,
+          cpu_seconds: event.resource_usage?.cpu_seconds,
+          peak_rss_mb: event.resource_usage?.peak_rss_mb
         }).catch(err => console.warn('Failed to save tool result:', err))
       } else if (event.type === 'file_change') {
         sessionService.saveFileChange(sessionId, {
@@ -105,6 +108,17 @@ export function SessionView({
           content_before: event.content_before,
           content_after: event.content_after
         }).catch(err => console.warn('Failed to save file change:', err))
+      } else if (event.type === 'file_changes') {
+        // Batch tools (write_files) report all their changes in one event
+        for (const change of event.changes || []) {
+          sessionService.saveFileChange(sessionId, {
+            file_path: change.file_path,
+            action: change.action,
+            tool_name: event.tool_name,
+            content_before: change.content_before,
+            content_after: change.content_after
+          }).catch(err => console.warn('Failed to save file change:', err))
+        }
       }
     }
   }, [sessionId, onMessageUpdate, onTokenUsageUpdate])
@@ -18,6 +18,9 @@ export interface ToolCallData {
   result?: string
   success: boolean
   error?: string
+  execution_time_ms?: number | null
+  cpu_seconds?: number | null
+  peak_rss_mb?: number | null
 }
 
 export interface FileChangeData {